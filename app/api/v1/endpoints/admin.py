@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Query
+from datetime import datetime
+
+from app.db.query_log import slow_query_log
+
+router = APIRouter()
+
+
+@router.get("/slow-queries", summary="スロークエリログ")
+async def get_slow_queries(
+    limit: int = Query(50, ge=1, le=1000, description="取得件数（新しい順）")
+):
+    """
+    閾値（SLOW_QUERY_THRESHOLD_MS）を超えたSQLを新しい順に取得します。
+    パラメータ、取得行数、EXPLAIN結果と全クエリの実行統計を含みます。
+    """
+    return {
+        "stats": slow_query_log.stats(),
+        "queries": slow_query_log.entries(limit),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@router.delete("/slow-queries", summary="スロークエリログをクリア")
+async def clear_slow_queries():
+    """
+    保持しているスロークエリログを削除します（実行統計は保持）。
+    """
+    slow_query_log.clear()
+    return {"status": "cleared", "timestamp": datetime.now().isoformat()}
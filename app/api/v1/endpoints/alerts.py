@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Query, Path, HTTPException, Depends
+from fastapi import APIRouter, Query, Path, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
 from typing import Optional, List
-from datetime import datetime, timedelta
-import random
+from datetime import datetime
+from contextlib import contextmanager
+import asyncio
+import json
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.schemas.requests.alerts import AlertBatchResolveRequest
 from app.schemas.responses.alerts import (
     Alert,
     AlertListResponse,
@@ -13,211 +17,287 @@ from app.schemas.responses.alerts import (
     AlertStatus,
 )
 from app.services.alert_service import AlertService
-from app.db.session import get_db
+from app.services.alert_engine import alert_engine
+from app.services.alert_scheduler import alert_scheduler
+from app.services.alert_store import alert_store, is_missing_table
+from app.db.session import get_db, get_read_db, read_session_factory
 from app.core.logging import app_logger
 
 router = APIRouter()
 
 
-def generate_dummy_alerts() -> List[Alert]:
-    """ダミーアラートデータを生成"""
-    alerts = []
-    
-    alert_templates = [
-        {
-            "type": AlertType.ATTENDANCE,
-            "priority": AlertPriority.HIGH,
-            "title": "欠勤による人員不足",
-            "message": "横浜拠点でデータ入力工程の人員が3名不足しています。",
-            "location_id": 3,
-            "location_name": "横浜",
-        },
-        {
-            "type": AlertType.PRODUCTIVITY,
-            "priority": AlertPriority.MEDIUM,
-            "title": "生産性低下警告",
-            "message": "補正処理工程の生産性が目標値を20%下回っています。",
-            "location_id": 2,
-            "location_name": "盛岡",
-        },
-        {
-            "type": AlertType.SKILL_GAP,
-            "priority": AlertPriority.LOW,
-            "title": "スキル不足の検出",
-            "message": "品質チェック工程で必要スキルレベル4の人員が不足しています。",
-            "location_id": 1,
-            "location_name": "札幌",
-        },
-        {
-            "type": AlertType.WORKLOAD,
-            "priority": AlertPriority.CRITICAL,
-            "title": "業務量急増アラート",
-            "message": "明日の業務量が通常の150%を超える予測です。緊急対応が必要です。",
-            "location_id": 4,
-            "location_name": "京都",
-        },
-        {
-            "type": AlertType.SYSTEM,
-            "priority": AlertPriority.LOW,
-            "title": "データ同期遅延",
-            "message": "RealWorksからのデータ同期に5分の遅延が発生しています。",
-            "location_id": None,
-            "location_name": None,
-        },
-    ]
-    
-    base_time = datetime.now()
-    
-    for i, template in enumerate(alert_templates * 3):  # 15件のアラートを生成
-        alert = Alert(
-            id=i + 1,
-            type=template["type"],
-            priority=template["priority"],
-            status=random.choice([AlertStatus.NEW, AlertStatus.ACKNOWLEDGED, AlertStatus.IN_PROGRESS]),
-            title=template["title"],
-            message=template["message"],
-            location_id=template.get("location_id"),
-            location_name=template.get("location_name"),
-            employee_id=None,
-            employee_name=None,
-            created_at=base_time - timedelta(hours=random.randint(0, 48)),
-            updated_at=base_time - timedelta(hours=random.randint(0, 24)),
-            acknowledged_at=None,
-            resolved_at=None,
-        )
-        alerts.append(alert)
-    
-    return alerts
+# アラート種別ごとの推奨アクション
+RECOMMENDED_ACTIONS = {
+    AlertType.ATTENDANCE: [
+        "他拠点から応援人員を配置",
+        "在宅勤務可能な従業員を緊急配置",
+        "優先度の低い工程から人員を一時的に移動",
+    ],
+    AlertType.PRODUCTIVITY: [
+        "熟練者を配置して生産性を向上",
+        "作業手順の見直しと改善",
+        "休憩時間の調整による効率化",
+    ],
+    AlertType.SKILL_GAP: [
+        "スキルトレーニングの実施",
+        "熟練者とのペア作業を設定",
+        "一時的に他拠点から熟練者を配置",
+    ],
+    AlertType.WORKLOAD: [
+        "全拠点での人員配置見直し",
+        "残業対応の事前調整",
+        "外部リソースの活用検討",
+    ],
+    AlertType.CORRECTION_THRESHOLD: [
+        "補正工程の経験者を他工程から移動",
+        "他拠点の補正工程へ応援を依頼",
+        "SV補正で優先度の高い案件から処理",
+    ],
+    AlertType.SS_MASSIVE: [
+        "納品1時間前に全拠点から人員を集中",
+        "優先度の低い工程から人員を一時的に移動",
+        "残業対応の事前調整",
+    ],
+    AlertType.LONG_ASSIGNMENT: [
+        "同じ業務の別工程へ配置転換",
+        "休憩の取得を指示",
+        "交代要員を配置",
+    ],
+    AlertType.ENTRY_BALANCE: [
+        "人数の多いエントリ工程から少ない工程へ移動",
+        "エントリ1・2の両方を担当できるオペレータを配置",
+    ],
+}
+
+DEFAULT_RECOMMENDED_ACTIONS = [
+    "システム管理者に連絡",
+    "手動でのデータ確認実施",
+]
+
+
+@contextmanager
+def alert_store_errors():
+    """アラート履歴テーブル（alerts）が未作成の場合は500ではなく503を返す"""
+    try:
+        yield
+    except Exception as e:
+        if is_missing_table(e):
+            app_logger.error(f"アラート履歴テーブルがありません: {e}")
+            raise HTTPException(
+                status_code=503,
+                detail="アラート履歴テーブル（alerts）がありません。scripts/create_alert_store.pyで作成してください"
+            )
+        raise
 
 
 @router.get("/check", summary="アラート基準チェック")
 async def check_alerts(
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     現在の状況をチェックして、基準を超えているアラートを生成します。
 
     やばい基準:
-    - 補正工程残件数: 品川50件以上、大阪100件以上
+    - 全拠点の補正残件数: 50件以上（進捗スナップショットは全拠点の合計のため、品川・大阪の基準のうち低い方で1件判定）
     - SS受領件数: 1,000件以上
     - 長時間配置: 60分以上
     - エントリバランス: 差30%以上
+
+    スケジューラーの実行中はバックグラウンドで評価済みの結果を返し、DBには問い合わせません。
+    変化をリアルタイムに受け取る場合は /alerts/stream（SSE）または /alerts/ws（WebSocket）を使用してください。
     """
-    app_logger.info("アラート基準チェック開始")
+    result = alert_scheduler.current() if alert_scheduler.running else None
+    if result is None:
+        app_logger.info("アラート基準チェック開始")
+        alert_service = AlertService()
+        alerts = await alert_service.check_all_alerts(db)
+        result = alert_scheduler.current() or {
+            "alert_count": len(alerts),
+            "alerts": alerts,
+            "checked_at": datetime.now().isoformat(),
+        }
+
+    return {"message": "アラートチェック完了", **result}
+
+
+# SSEの接続維持用コメントの送信間隔（秒）
+STREAM_KEEPALIVE_SECONDS = 15
+
+
+@router.get("/stream", summary="アラート変化の配信（SSE）")
+async def stream_alerts():
+    """
+    発生中のアラートが変化するたびにServer-Sent Eventsで配信します。
+
+    接続直後に現在の全件（event: snapshot）、以降は差分（event: changed）を送ります。
+    changedは種別＋拠点＋工程（フィンガープリント）単位で、新規（new）・悪化による優先度の引き上げ（escalated）・
+    解消直後の再発（reopened、解消済みの表示を発生中に戻す）・解消（cleared）があった場合のみ送ります。
+    値だけの変化は送らないため、最新の値が必要な場合は /alerts/check を使用してください。
+    """
+    queue = alert_scheduler.subscribe()
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['event']}\nid: {event['version']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            alert_scheduler.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
+@router.websocket("/ws")
+async def alerts_websocket(websocket: WebSocket):
+    """発生中のアラートの変化をWebSocketで配信（イベントの形式は /alerts/stream と同じ）"""
+    await websocket.accept()
+    queue = alert_scheduler.subscribe()
+
+    async def forward():
+        while True:
+            await websocket.send_json(await queue.get())
+
+    sender = asyncio.create_task(forward())
+    try:
+        # クライアントからの切断を待つ（配信がない間も切断を検知して購読を解除する）
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        sender.cancel()
+        alert_scheduler.unsubscribe(queue)
+
+
+@router.post("/resolve", summary="アラート一括解消提案")
+async def resolve_alerts(
+    request: AlertBatchResolveRequest,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    複数のアラートの解消提案を並行して生成し、完了した順にNDJSON（1行1件）で返します。
+
+    DBデータは全アラートで1回だけ取得して共有し、LLMへの同時リクエストはOllamaの並列数までに抑えます。
+    """
     alert_service = AlertService()
-    alerts = await alert_service.check_all_alerts(db)
+    all_alerts = await alert_service.check_all_alerts(db)
+    if request.alert_ids is None:
+        targets = all_alerts
+    else:
+        by_id = {alert.get("id"): alert for alert in all_alerts}
+        missing = [alert_id for alert_id in request.alert_ids if alert_id not in by_id]
+        if missing:
+            raise HTTPException(status_code=404, detail=f"アラートが見つかりません: {missing}")
+        targets = [by_id[alert_id] for alert_id in dict.fromkeys(request.alert_ids)]
 
-    return {
-        "message": "アラートチェック完了",
-        "alert_count": len(alerts),
-        "alerts": alerts,
-        "checked_at": datetime.now().isoformat()
-    }
+    app_logger.info(f"アラート一括解消提案生成: {len(targets)}件")
+
+    async def results():
+        # 依存関係のセッションはレスポンス送信前に閉じられるため、配信中は専用のセッションを使う
+        async with read_session_factory() as session:
+            async for resolution in alert_service.resolve_alerts_as_completed(targets, session, detail=request.detail):
+                yield json.dumps(resolution, ensure_ascii=False, default=str) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@router.get("/long-assignments", summary="長時間配置オペレータ取得")
+async def get_long_assignments(
+    minutes: Optional[float] = Query(None, gt=0, description="配置時間の基準（分、省略時は長時間配置アラートの基準）"),
+    location: Optional[str] = Query(None, description="拠点名でフィルタ"),
+    process: Optional[str] = Query(None, description="工程名でフィルタ"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    同じ工程に指定時間以上配置されているオペレータを配置時間の長い順に返します。
+
+    オペレータごとの配置開始時刻はメモリ上で保持しており、新しいログイン記録だけを反映して範囲検索で求めます。
+    基準時刻（as_of）は反映済みの最新のログイン記録の時刻です。
+    """
+    alert_service = AlertService()
+    try:
+        return await alert_service.get_long_assignments(
+            db, minutes=minutes, location_name=location, process_name=process
+        )
+    except Exception as e:
+        app_logger.error(f"長時間配置取得エラー: {e}")
+        raise HTTPException(status_code=503, detail="ログイン記録を取得できません")
 
 
 @router.get("", response_model=AlertListResponse, summary="アラート一覧取得")
 async def get_alerts(
-    page: int = Query(1, ge=1, description="ページ番号"),
+    cursor: Optional[str] = Query(None, description="前のページのnext_cursor（省略時は先頭ページ）"),
     page_size: int = Query(20, ge=1, le=100, description="1ページあたりの件数"),
     type: Optional[AlertType] = Query(None, description="アラート種別でフィルタ"),
     priority: Optional[AlertPriority] = Query(None, description="優先度でフィルタ"),
     status: Optional[AlertStatus] = Query(None, description="ステータスでフィルタ"),
     location_id: Optional[int] = Query(None, description="拠点IDでフィルタ"),
+    include_total: bool = Query(False, description="総件数を含める（件数が多い場合は遅くなる）"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
-    アラート一覧を取得します。
+    アラート履歴を新しい順に取得します。
     各種フィルタリングオプションを使用して、必要なアラートのみを絞り込むことができます。
+
+    ページングはキーセット方式です。次のページはレスポンスのnext_cursorをcursorに指定して取得します
+    （履歴の件数に関係なく、1ページの取得で読む行数はpage_size件です）。
     """
-    app_logger.info(f"Getting alerts - page: {page}, page_size: {page_size}, filters: type={type}, priority={priority}, status={status}, location_id={location_id}")
-
-    all_alerts = generate_dummy_alerts()
-
-    # フィルタリング
-    filtered_alerts = all_alerts
-    if type:
-        filtered_alerts = [a for a in filtered_alerts if a.type == type]
-    if priority:
-        filtered_alerts = [a for a in filtered_alerts if a.priority == priority]
-    if status:
-        filtered_alerts = [a for a in filtered_alerts if a.status == status]
-    if location_id:
-        filtered_alerts = [a for a in filtered_alerts if a.location_id == location_id]
-
-    # ページネーション
-    total = len(filtered_alerts)
-    start_idx = (page - 1) * page_size
-    end_idx = start_idx + page_size
-    paged_alerts = filtered_alerts[start_idx:end_idx]
+    app_logger.info(f"Getting alerts - cursor: {cursor}, page_size: {page_size}, filters: type={type}, priority={priority}, status={status}, location_id={location_id}")
+
+    filters = {
+        "status": status.value if status else None,
+        "priority": priority.value if priority else None,
+        "type": type.value if type else None,
+        "location_id": location_id,
+    }
+    with alert_store_errors():
+        try:
+            alerts, next_cursor = await alert_store.list_alerts(db, filters, page_size, cursor=cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        total = await alert_store.count(db, filters) if include_total else None
 
     return AlertListResponse(
-        alerts=paged_alerts,
-        total=total,
-        page=page,
+        alerts=[Alert(**alert) for alert in alerts],
         page_size=page_size,
+        next_cursor=next_cursor,
+        total=total,
     )
 
 
 @router.get("/{alert_id}", response_model=AlertDetailResponse, summary="アラート詳細取得")
 async def get_alert_detail(
     alert_id: int = Path(..., ge=1, description="アラートID"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     指定されたIDのアラート詳細情報を取得します。
-    推奨アクションと関連アラートの情報も含まれます。
+    推奨アクションと関連アラート（同じ拠点で発生中のアラート）の情報も含まれます。
     """
     app_logger.info(f"Getting alert detail for ID: {alert_id}")
-    
-    all_alerts = generate_dummy_alerts()
-    
-    # 該当アラートを検索
-    alert = None
-    for a in all_alerts:
-        if a.id == alert_id:
-            alert = a
-            break
-    
-    if not alert:
+
+    with alert_store_errors():
+        row = await alert_store.get(db, alert_id)
+    if not row:
         raise HTTPException(status_code=404, detail="アラートが見つかりません")
-    
-    # 推奨アクションを生成
-    recommended_actions = []
-    if alert.type == AlertType.ATTENDANCE:
-        recommended_actions = [
-            "他拠点から応援人員を配置",
-            "在宅勤務可能な従業員を緊急配置",
-            "優先度の低い工程から人員を一時的に移動",
-        ]
-    elif alert.type == AlertType.PRODUCTIVITY:
-        recommended_actions = [
-            "熟練者を配置して生産性を向上",
-            "作業手順の見直しと改善",
-            "休憩時間の調整による効率化",
-        ]
-    elif alert.type == AlertType.SKILL_GAP:
-        recommended_actions = [
-            "スキルトレーニングの実施",
-            "熟練者とのペア作業を設定",
-            "一時的に他拠点から熟練者を配置",
-        ]
-    elif alert.type == AlertType.WORKLOAD:
-        recommended_actions = [
-            "全拠点での人員配置見直し",
-            "残業対応の事前調整",
-            "外部リソースの活用検討",
-        ]
-    else:
-        recommended_actions = [
-            "システム管理者に連絡",
-            "手動でのデータ確認実施",
-        ]
-    
-    # 関連アラートID（ダミー）
-    related_alerts = [i for i in range(1, 16) if i != alert_id][:3]
-    
+    alert = Alert(**row)
+
+    related_alerts = [
+        active["id"] for active in alert_engine.active_alerts
+        if active["id"] != alert_id and active.get("location_name") == alert.location_name
+    ][:3]
+
     return AlertDetailResponse(
         alert=alert,
-        recommended_actions=recommended_actions,
+        recommended_actions=RECOMMENDED_ACTIONS.get(alert.type, DEFAULT_RECOMMENDED_ACTIONS),
         related_alerts=related_alerts,
     )
 
@@ -225,31 +305,30 @@ async def get_alert_detail(
 @router.post("/{alert_id}/acknowledge", summary="アラート確認")
 async def acknowledge_alert(
     alert_id: int = Path(..., ge=1, description="アラートID"),
+    db: AsyncSession = Depends(get_db)
 ):
     """
     指定されたアラートを確認済みとしてマークします。
     """
     app_logger.info(f"Acknowledging alert ID: {alert_id}")
 
-    all_alerts = generate_dummy_alerts()
-
-    # 該当アラートを検索
-    alert_exists = any(a.id == alert_id for a in all_alerts)
-
-    if not alert_exists:
+    with alert_store_errors():
+        alert = await alert_store.acknowledge(db, alert_id)
+    if not alert:
         raise HTTPException(status_code=404, detail="アラートが見つかりません")
 
     return {
         "message": "アラートを確認しました",
         "alert_id": alert_id,
-        "acknowledged_at": datetime.now().isoformat(),
+        "status": alert["status"],
+        "acknowledged_at": alert["acknowledged_at"],
     }
 
 
 @router.post("/{alert_id}/resolve", summary="アラート解消提案")
 async def resolve_alert(
     alert_id: int = Path(..., ge=1, description="アラートID"),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     指定されたアラートをAIで解消する提案を生成します。
@@ -258,16 +337,10 @@ async def resolve_alert(
     """
     app_logger.info(f"アラート解消提案生成: ID {alert_id}")
 
-    # まずアラートを生成してIDで検索
+    # 最新の状況で評価してから発生中のアラートをIDで検索
     alert_service = AlertService()
     all_alerts = await alert_service.check_all_alerts(db)
-
-    # 該当アラートを検索（IDではなくtypeで検索）
-    # 実際の実装ではDBに保存されたアラートを取得
-    if alert_id > len(all_alerts):
-        raise HTTPException(status_code=404, detail="アラートが見つかりません")
-
-    target_alert = all_alerts[min(alert_id - 1, len(all_alerts) - 1)] if all_alerts else None
+    target_alert = next((alert for alert in all_alerts if alert.get("id") == alert_id), None)
 
     if not target_alert:
         raise HTTPException(status_code=404, detail="アラートが見つかりません")
@@ -76,7 +76,7 @@ async def send_chat_message(request: ChatMessageRequest):
 
     from app.services.integrated_llm_service import IntegratedLLMService
     from app.services.conversation_store import conversation_store
-    from app.db.session import get_db
+    from app.db.session import get_read_db
 
     try:
         # 会話履歴から直前の提案を取得
@@ -86,7 +86,7 @@ async def send_chat_message(request: ChatMessageRequest):
         llm_service = IntegratedLLMService()
 
         # 非同期DB接続を取得
-        async for db in get_db():
+        async for db in get_read_db():
             result = await llm_service.process_message(
                 message=request.message,
                 context={**request.context, "last_suggestion": last_suggestion} if last_suggestion else request.context,
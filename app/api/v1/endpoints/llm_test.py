@@ -8,8 +8,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.services.ollama_service import OllamaService
 from app.services.integrated_llm_service import IntegratedLLMService
-from app.services.chroma_service import ChromaService
-from app.db.session import get_db
+from app.services.chroma_connection import chroma_connection
+from app.services.operator_capability_index import operator_capability_index
+from app.db.session import get_db, get_read_db
 from app.core.logging import app_logger
 
 router = APIRouter()
@@ -125,44 +126,58 @@ async def test_integrated_llm(
 
 
 @router.post("/rag-search", response_model=RAGSearchResponse)
-async def rag_search(request: RAGSearchRequest):
-    """RAG検索専用エンドポイント（ChromaDBセマンティック検索）"""
+async def rag_search(
+    request: RAGSearchRequest,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """RAG検索専用エンドポイント（業務・工程指定時は能力インデックス、それ以外はChromaDBセマンティック検索）"""
     try:
         import time
         start_time = time.time()
 
-        chroma_service = ChromaService()
-
-        # 工程が指定されている場合は最適なオペレータを検索
+        # 工程が指定されている場合は能力インデックスからスキルレベル順に取得（ChromaDBは使わない）
         if request.business_id and request.process_id:
             app_logger.info(
                 f"RAG検索: 業務{request.business_id}の工程{request.process_id}に最適なオペレータを検索"
             )
-            operators = chroma_service.find_best_operators_for_process(
+            await operator_capability_index.ensure_loaded(db)
+            operators = operator_capability_index.lookup(
                 business_id=request.business_id,
                 process_id=request.process_id,
-                location_id=request.location_id,
-                n_results=request.n_results
+                location=request.location_id,
+                limit=request.n_results
             )
-        else:
-            # 汎用セマンティック検索
-            app_logger.info(f"RAG検索: '{request.query}' のセマンティック検索")
-            results = chroma_service.query_similar(
-                query_text=request.query,
-                n_results=request.n_results
+            return RAGSearchResponse(
+                query=request.query,
+                recommended_operators=operators,
+                total_documents=operator_capability_index.stats()["capabilities"],
+                search_time_ms=round((time.time() - start_time) * 1000, 2)
             )
 
-            # 結果を整形
-            operators = []
-            for i, doc in enumerate(results.get("documents", [])):
-                metadata = results.get("metadatas", [])[i] if i < len(results.get("metadatas", [])) else {}
-                distance = results.get("distances", [])[i] if i < len(results.get("distances", [])) else 0
+        # 汎用セマンティック検索（自由文のクエリ、接続断中は待たずに503を返す）
+        chroma_service = await chroma_connection.aget_service()
+        if chroma_service is None:
+            raise HTTPException(
+                status_code=503,
+                detail=f"ChromaDBに接続できません（{chroma_connection.state}、バックグラウンドで再接続中）"
+            )
+        app_logger.info(f"RAG検索: '{request.query}' のセマンティック検索")
+        results = chroma_service.query_similar(
+            query_text=request.query,
+            n_results=request.n_results
+        )
+
+        # 結果を整形
+        operators = []
+        for i, doc in enumerate(results.get("documents", [])):
+            metadata = results.get("metadatas", [])[i] if i < len(results.get("metadatas", [])) else {}
+            distance = results.get("distances", [])[i] if i < len(results.get("distances", [])) else 0
 
-                operators.append({
-                    "document": doc,
-                    "metadata": metadata,
-                    "relevance_score": round(1 - distance, 4)
-                })
+            operators.append({
+                "document": doc,
+                "metadata": metadata,
+                "relevance_score": round(1 - distance, 4)
+            })
 
         # 統計情報
         stats = chroma_service.get_collection_stats()
@@ -175,6 +190,8 @@ async def rag_search(request: RAGSearchRequest):
             search_time_ms=search_time_ms
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         app_logger.error(f"Error in RAG search: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.schemas.requests.simulation import WhatIfRequest
+from app.schemas.responses.simulation import WhatIfResponse
+from app.services.capacity_simulator import CapacitySimulator
+from app.services.database_service import DatabaseService
+from app.db.session import get_read_db
+from app.core.logging import app_logger
+
+router = APIRouter()
+
+
+@router.post("/what-if", response_model=WhatIfResponse, summary="配置変更のwhat-ifシミュレーション")
+async def simulate_what_if(
+    request: WhatIfRequest,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    複数の配置変更案について、現在の滞留件数と配置人数から完了時刻をシミュレーションします。
+
+    例: 「札幌 エントリ1に2人移動したら何時に終わる？」→ 案ごとの完了見込み（p50/p90）を比較
+    """
+    app_logger.info(f"what-ifシミュレーション開始: {len(request.plans)}案")
+
+    inputs = await DatabaseService().fetch_simulation_inputs(db)
+    if not inputs.get("progress_snapshots"):
+        raise HTTPException(status_code=404, detail="進捗スナップショットが見つかりません")
+
+    simulator = CapacitySimulator(runs=request.runs, horizon_minutes=request.horizon_minutes)
+    return await simulator.evaluate_plans(
+        [plan.dict() for plan in request.plans],
+        inputs["current_assignments"],
+        inputs["progress_snapshots"],
+        seed=request.seed
+    )
@@ -9,6 +9,9 @@ from app.schemas.responses.status import (
     LocationStatus
 )
 from app.core.logging import app_logger
+from app.db.session import get_pool_metrics
+from app.services.alert_scheduler import alert_scheduler
+from app.services.chroma_connection import chroma_connection
 
 router = APIRouter()
 
@@ -153,6 +156,42 @@ async def get_detailed_metrics(
     }
 
 
+@router.get("/db-pool", summary="DB接続プールメトリクス")
+async def get_db_pool_metrics():
+    """
+    書き込み用・読み取り用エンジンの接続プール状況を取得します。
+    貸出中・オーバーフロー接続数と接続待ち時間を含みます。
+    """
+    return {
+        "pools": get_pool_metrics(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@router.get("/chromadb", summary="ChromaDB接続状態")
+async def get_chromadb_status():
+    """
+    ChromaDBへの接続状態を取得します。
+    接続断中は連続失敗回数、直近のエラー、次回の再接続までの秒数を含みます。
+    """
+    return {
+        "connection": chroma_connection.status(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+@router.get("/alert-scheduler", summary="アラート評価スケジューラーの状態")
+async def get_alert_scheduler_status():
+    """
+    アラート評価スケジューラーの状態を取得します。
+    評価回数、配信中の購読者数、評価エンジンが読んだ最新のスナップショット時刻を含みます。
+    """
+    return {
+        "scheduler": alert_scheduler.status(),
+        "timestamp": datetime.now().isoformat()
+    }
+
+
 @router.get("/health", summary="ヘルスチェック")
 async def health_check():
     """
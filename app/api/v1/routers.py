@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import alerts, chat, approvals, status, llm_test
+from app.api.v1.endpoints import alerts, chat, approvals, status, llm_test, simulation, admin
 
 api_router = APIRouter()
 
@@ -8,4 +8,6 @@ api_router.include_router(alerts.router, prefix="/alerts", tags=["alerts"])
 api_router.include_router(chat.router, prefix="/chat", tags=["chat"])
 api_router.include_router(approvals.router, prefix="/approvals", tags=["approvals"])
 api_router.include_router(status.router, prefix="/status", tags=["status"])
-api_router.include_router(llm_test.router, prefix="/llm-test", tags=["llm-test"])
\ No newline at end of file
+api_router.include_router(llm_test.router, prefix="/llm-test", tags=["llm-test"])
+api_router.include_router(simulation.router, prefix="/simulation", tags=["simulation"])
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
\ No newline at end of file
@@ -22,6 +22,22 @@ class Settings(BaseSettings):
     DATABASE_URL: str = Field(...)
     DATABASE_POOL_SIZE: int = Field(default=20)
     DATABASE_MAX_OVERFLOW: int = Field(default=40)
+    DATABASE_QUERY_CONCURRENCY: int = Field(default=4)
+    DATABASE_POOL_TIMEOUT: int = Field(default=30)
+    DATABASE_POOL_RECYCLE: int = Field(default=1800)
+    DATABASE_STATEMENT_TIMEOUT_MS: int = Field(default=30000)
+    # 遅延解決データをCTEによる1クエリで取得
+    DATABASE_CONSOLIDATED_QUERIES: bool = Field(default=False)
+    # 大量行の取得をサーバーサイドカーソルで分割する件数
+    DATABASE_STREAM_PARTITION_SIZE: int = Field(default=100)
+    # 読み取り用レプリカ（未設定の場合はDATABASE_URLを共用）
+    DATABASE_READ_URL: str = Field(default="")
+    DATABASE_READ_POOL_SIZE: int = Field(default=20)
+    DATABASE_READ_MAX_OVERFLOW: int = Field(default=40)
+    # スロークエリログ
+    SLOW_QUERY_THRESHOLD_MS: int = Field(default=500)
+    SLOW_QUERY_LOG_SIZE: int = Field(default=100)
+    SLOW_QUERY_EXPLAIN: bool = Field(default=True)
     
     # Redis設定
     REDIS_URL: str = Field(default="redis://localhost:6379/0")
@@ -55,6 +71,30 @@ class Settings(BaseSettings):
     CHROMADB_EXTERNAL_PORT: int = Field(default=8002)
     CHROMADB_AUTH_TOKEN: str = Field(default="aimee-chroma-token")
     CHROMADB_COLLECTION: str = Field(default="aimee_knowledge")
+    CHROMADB_PARTITIONED: bool = Field(default=False)  # 種別ごとのコレクションに分割（scripts/migrate_chroma_partitions.py実行後にtrue）
+    CHROMADB_RECONNECT_INITIAL_SECONDS: float = Field(default=1.0)  # 接続断時の最初の再接続待ち（失敗ごとに倍増）
+    CHROMADB_RECONNECT_MAX_SECONDS: float = Field(default=60.0)  # 再接続待ちの上限
+    CHROMADB_HEALTH_CHECK_SECONDS: float = Field(default=30.0)  # 接続中のハートビート間隔
+    
+    # ChromaDB投入パイプライン設定
+    CHROMA_INGEST_BATCH_SIZE: int = Field(default=1000)  # 1回のupsert件数（ChromaDBの上限5461以下）
+    CHROMA_INGEST_MAX_IN_FLIGHT: int = Field(default=4)  # 同時実行するupsert数
+    CHROMA_INGEST_WORKERS: int = Field(default=2)  # チャンク作成のプロセス数（0: イベントループ内で作成）
+    CHROMA_INGEST_OPERATORS_PER_TASK: int = Field(default=500)  # ワーカー1タスクあたりのオペレータ数
+    CHROMA_SYNC_CHECKPOINT_PATH: str = Field(default="logs/chroma_sync_checkpoint.json")  # 中断再開用チェックポイント
+    CHROMA_SYNC_CHECKPOINT_INTERVAL: int = Field(default=10)  # チェックポイントを保存するワーカータスク間隔
+    
+    # ローカルベクトルインデックス設定（小規模コレクションをプロセス内で検索）
+    LOCAL_VECTOR_INDEX_PARTITIONS: List[str] = Field(default=["manager_rules"])  # ローカル検索するパーティション（CHROMADB_PARTITIONED時のみ）
+    LOCAL_VECTOR_INDEX_DIR: str = Field(default="data/vector_index")  # 埋め込み行列（.npy）の保存先
+    LOCAL_VECTOR_INDEX_REFRESH_SECONDS: int = Field(default=300)  # ChromaDBとの差分確認間隔
+    LOCAL_VECTOR_INDEX_MAX_DOCUMENTS: int = Field(default=5000)  # これを超えるコレクションはサーバーで検索
+    
+    # ハイブリッド検索設定（文字n-gramのBM25字句検索をベクトル検索とRRFで統合）
+    LEXICAL_INDEX_ENABLED: bool = Field(default=True)
+    LEXICAL_INDEX_PATH: str = Field(default="data/lexical_index.json")  # 字句インデックスの保存先
+    RRF_K: int = Field(default=60)  # Reciprocal Rank Fusionの順位平滑化定数
+    RRF_CANDIDATE_MULTIPLIER: int = Field(default=3)  # 統合前に各検索で取得する件数（n_resultsの倍数）
     
     # RAG設定
     CHUNK_SIZE: int = Field(default=512)
@@ -62,6 +102,38 @@ class Settings(BaseSettings):
     SIMILARITY_THRESHOLD: float = Field(default=0.7)
     ENABLE_VECTOR_CACHE: bool = Field(default=True)
     CACHE_TTL_SECONDS: int = Field(default=3600)
+    RAG_CACHE_MAX_ENTRIES: int = Field(default=1000)  # 埋め込み・検索結果キャッシュそれぞれの最大件数（LRU）
+    RAG_CACHE_VERSION_CHECK_SECONDS: int = Field(default=30)  # 別プロセスの投入（データバージョン更新）の確認間隔
+    RAG_DUPLICATE_SIMILARITY: float = Field(default=0.95)  # これ以上類似する管理者ルールは重複として除外
+    RAG_RULE_TOKEN_BUDGET: int = Field(default=600)  # プロンプトに入れる管理者ルール本文の合計トークン数（概算）
+    OPERATOR_INDEX_TTL_SECONDS: int = Field(default=300)  # オペレータ能力インデックスの再読込間隔
+    
+    # セマンティックチャンキング設定（管理者ルール文書の投入時、最大文字数はCHUNK_SIZE）
+    SEMANTIC_CHUNK_THRESHOLD: float = Field(default=0.75)  # 直前の文との類似度がこれ未満なら分割
+    SEMANTIC_CHUNK_WINDOW: int = Field(default=3)  # 類似度を比較する直前の文数
+    SEMANTIC_CHUNK_MIN_CHARS: int = Field(default=100)  # これ未満のチャンクは隣に結合
+    SEMANTIC_CHUNK_EMBED_BATCH_SIZE: int = Field(default=256)  # 1回の埋め込み計算に渡す文数
+    SEMANTIC_CHUNK_WORKERS: int = Field(default=2)  # 分割のプロセス数（0: 単一プロセス）
+    SEMANTIC_CHUNK_PARALLEL_MIN_DOCUMENTS: int = Field(default=500)  # これ未満の文書数は単一プロセスで分割
+    
+    # アラート評価設定
+    ALERT_SNAPSHOT_WINDOW: int = Field(default=60)  # 1回の評価で読む進捗スナップショットの最大件数（前回評価以降の新しい行のみ）
+    ALERT_SCHEDULER_ENABLED: bool = Field(default=True)  # バックグラウンドで評価し、/alerts/checkは保持中の結果を返す
+    ALERT_EVALUATION_INTERVAL_SECONDS: float = Field(default=60.0)  # 新しい行がなくても評価する間隔
+    ALERT_CHANGE_POLL_SECONDS: float = Field(default=5.0)  # 新しいスナップショットの有無を確認する間隔
+    ALERT_SUBSCRIBER_QUEUE_SIZE: int = Field(default=32)  # SSE/WebSocket購読者ごとの未送信イベントの上限
+    ALERT_STORE_ENABLED: bool = Field(default=True)  # 発生したアラートをalertsテーブルに保存（一覧・詳細APIの取得元）
+    ALERT_SUPPRESSION_SECONDS: float = Field(default=900.0)  # 解消後にこの期間内に再発した同じフィンガープリント（種別＋拠点＋工程）は通知しない
+    ALERT_ESCALATION_STEP: float = Field(default=0.5)  # 超過の度合いが通知時の(1 + この値)倍以上になったら優先度を上げて再通知
+    ALERT_STATE_PATH: str = Field(default="data/alert_state.json")  # フィンガープリントごとの通知状態の保存先
+    ALERT_STATE_SAVE_INTERVAL_SECONDS: float = Field(default=60.0)  # 通知状態をファイルへ保存する間隔
+    ASSIGNMENT_HISTORY_MINUTES: int = Field(default=480)  # 長時間配置の判定で初回に読むログイン記録の範囲（配置開始時刻の復元用）
+    
+    # 容量シミュレーション設定
+    SIMULATION_RUNS: int = Field(default=500)
+    SIMULATION_HORIZON_MINUTES: int = Field(default=480)
+    SIMULATION_MAX_WORKERS: int = Field(default=2)
+    SIMULATION_BLOCK_CELLS: int = Field(default=1_000_000)  # 1回に生成する乱数の上限（試行×分）。試行をこの単位に分けて計算し、全試行が完了したら打ち切る
     
     # セキュリティ設定
     SECRET_KEY: str = Field(...)
@@ -78,14 +150,15 @@ class Settings(BaseSettings):
         env_file = ".env"
         case_sensitive = True
         
-    @validator("CORS_ORIGINS", pre=True)
+    @validator("CORS_ORIGINS", "LOCAL_VECTOR_INDEX_PARTITIONS", pre=True)
     def parse_cors_origins(cls, v):
         if isinstance(v, str):
             import json
             return json.loads(v)
         return v
     
-    @validator("ENABLE_PARALLEL_PROCESSING", "STREAMING_RESPONSE", "ENABLE_VECTOR_CACHE", pre=True)
+    @validator("ENABLE_PARALLEL_PROCESSING", "STREAMING_RESPONSE", "ENABLE_VECTOR_CACHE", "LEXICAL_INDEX_ENABLED",
+               "ALERT_SCHEDULER_ENABLED", "ALERT_STORE_ENABLED", pre=True)
     def parse_bool(cls, v):
         if isinstance(v, str):
             return v.lower() in ('true', '1', 'yes')
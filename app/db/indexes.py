@@ -0,0 +1,132 @@
+"""
+Composite index definitions matched to DatabaseService query shapes
+
+Each entry names the query it serves so that index changes can be reviewed
+together with the SQL in app/services/database_service.py. Indexes are
+applied by scripts/apply_indexes.py and verified by scripts/verify_query_plans.py.
+"""
+from typing import Any, Dict, List
+
+
+INDEX_DEFINITIONS: List[Dict[str, Any]] = [
+    {
+        # _fetch_current_assignments: record_time = (SELECT MAX(record_time)) ORDER BY process_name
+        # MAX() is resolved from the index and the latest snapshot is read without touching the table
+        "table": "login_records_by_location",
+        "name": "idx_lrbl_record_time_cover",
+        "columns": [
+            "record_time", "process_name", "business_name",
+            "sapporo", "tokyo", "osaka", "okinawa", "sasebo",
+            "login_now", "login_today",
+        ],
+        "serves": ["_fetch_current_assignments", "AlertEngine._evaluate_entry_balance"],
+    },
+    {
+        # _fetch_recent_snapshots / _fetch_completion_prediction_data:
+        # total_waiting > 0 ORDER BY snapshot_time DESC LIMIT 10 (backward index scan)
+        # AlertEngine: snapshot_time > :since ORDER BY snapshot_time DESC (range scan of new rows only)
+        "table": "progress_snapshots",
+        "name": "idx_ps_snapshot_time_waiting",
+        "columns": ["snapshot_time", "total_waiting"],
+        "serves": ["_fetch_recent_snapshots", "_fetch_completion_prediction_data", "AlertEngine._evaluate_snapshots"],
+    },
+    {
+        # AssignmentTracker: MAX(record_time) on every change poll, then record_time > :since ORDER BY record_time
+        # (range scan of new rows only); covers the per-operator assignment columns
+        "table": "login_records",
+        "name": "idx_lr_record_time_operator",
+        "columns": ["record_time", "operator_id", "business_id", "process_id"],
+        "serves": ["AssignmentTracker.refresh", "AssignmentTracker.has_new_records"],
+    },
+    # AlertStore.list_alerts: one filter = :value ORDER BY created_at DESC, id DESC with the (created_at, id) keyset.
+    # InnoDB appends the primary key, so each index reads a single-filter page in order without a filesort
+    # (idx_alerts_filter in ALERTS_TABLE_DDL only serves this when all four filters are bound)
+    *[
+        {
+            "table": "alerts",
+            "name": f"idx_alerts_{column}_created",
+            "columns": [column, "created_at"],
+            "serves": ["AlertStore.list_alerts"],
+        }
+        for column in ("status", "priority", "type", "location_id")
+    ],
+    {
+        # Joins from operators on (operator_id, business_id, process_id); covers work_level
+        "table": "operator_process_capabilities",
+        "name": "idx_opc_operator_business_process",
+        "columns": ["operator_id", "business_id", "process_id", "work_level"],
+        "serves": [
+            "_fetch_actual_allocation", "_fetch_available_operators",
+            "_fetch_skill_matching", "_fetch_status_data",
+            "_fetch_operator_capability_sets",
+        ],
+    },
+    {
+        # Joins driven from processes (process_name IN (...)) into capabilities
+        "table": "operator_process_capabilities",
+        "name": "idx_opc_business_process_operator",
+        "columns": ["business_id", "process_id", "operator_id", "work_level"],
+        "serves": ["_fetch_skill_matching", "_fetch_resource_allocation_data"],
+    },
+    {
+        # o.is_valid = 1 with join to locations
+        "table": "operators",
+        "name": "idx_operators_valid_location",
+        "columns": ["is_valid", "location_id", "operator_id", "operator_name"],
+        "serves": [
+            "_fetch_actual_allocation", "_fetch_available_operators",
+            "_fetch_skill_matching", "_fetch_resource_allocation_data",
+            "_fetch_operator_capability_sets",
+        ],
+    },
+    {
+        # p.process_name IN ('エントリ1', ...) resolved to (business_id, process_id)
+        "table": "processes",
+        "name": "idx_processes_name_business_process",
+        "columns": ["process_name", "business_id", "process_id", "process_category"],
+        "serves": ["_fetch_available_operators", "_fetch_skill_matching"],
+    },
+    {
+        # owr.record_date >= DATE_SUB(CURDATE(), INTERVAL 7 DAY) per operator; covers work_count
+        "table": "operator_work_records",
+        "name": "idx_owr_operator_date",
+        "columns": ["operator_id", "record_date", "work_count"],
+        "serves": ["_fetch_resource_allocation_data", "_fetch_status_data"],
+    },
+]
+
+
+# Intents exercised by the plan verifier; together they run every DatabaseService query
+VERIFIED_INTENTS: List[Dict[str, Any]] = [
+    {"intent_type": "delay_resolution", "entities": {"location": "札幌", "process": "エントリ1"}},
+    {"intent_type": "completion_time_prediction", "entities": {}},
+    {"intent_type": "resource_allocation", "entities": {"location": "札幌", "process": "エントリ1"}},
+    {"intent_type": "status_check", "entities": {"location": "札幌"}},
+    {"intent_type": "general", "entities": {}},
+]
+
+
+# AlertStore.list_alerts filters exercised by the plan verifier: unfiltered, each single filter and all four
+VERIFIED_ALERT_FILTERS: List[Dict[str, Any]] = [
+    {},
+    {"status": "new"},
+    {"priority": "high"},
+    {"type": "correction_threshold"},
+    {"location_id": 1},
+    {"status": "new", "priority": "high", "type": "correction_threshold", "location_id": 1},
+]
+
+
+# Small dimension tables where a full scan is cheaper than an index lookup
+FULL_SCAN_ALLOWED_TABLES = {"locations", "businesses", "processes"}
+
+
+def create_index_sql(index: Dict[str, Any]) -> str:
+    """CREATE INDEX statement for a definition"""
+    columns = ", ".join(f"`{c}`" for c in index["columns"])
+    return f"CREATE INDEX `{index['name']}` ON `{index['table']}` ({columns})"
+
+
+def drop_index_sql(index: Dict[str, Any]) -> str:
+    """DROP INDEX statement for a definition (rollback)"""
+    return f"DROP INDEX `{index['name']}` ON `{index['table']}`"
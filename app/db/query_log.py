@@ -0,0 +1,168 @@
+"""
+Statement timing and slow-query log
+
+Every statement executed through an instrumented engine is timed with
+SQLAlchemy cursor events. Statements slower than SLOW_QUERY_THRESHOLD_MS are
+kept in a bounded ring buffer together with their parameters, row count and
+an EXPLAIN plan captured on a separate pooled connection (skipped while the
+pool is saturated, so diagnostics never take a connection a request is waiting for).
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.core.logging import app_logger
+
+
+# Per-request statement capture (used by the detail=True debug output)
+_captured_queries: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("captured_queries", default=None)
+
+# Pending EXPLAIN tasks (held so they are not garbage collected mid-flight)
+_explain_tasks: Set[asyncio.Task] = set()
+
+
+def _format_parameters(parameters: Any, limit: int = 500) -> Optional[str]:
+    if parameters is None or parameters == () or parameters == {}:
+        return None
+    text = repr(parameters)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+class SlowQueryLog:
+    """Bounded ring buffer of slow statements plus global timing counters"""
+
+    def __init__(self, maxlen: int):
+        self._lock = threading.Lock()
+        self._entries = deque(maxlen=maxlen)
+        self.statement_count = 0
+        self.total_ms = 0.0
+        self.slow_count = 0
+
+    def observe(self, duration_ms: float):
+        with self._lock:
+            self.statement_count += 1
+            self.total_ms += duration_ms
+
+    def record(self, entry: Dict[str, Any]):
+        with self._lock:
+            self.slow_count += 1
+            self._entries.append(entry)
+
+    def entries(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Slow statements, newest first"""
+        with self._lock:
+            items = list(reversed(self._entries))
+        return items[:limit] if limit else items
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "statement_count": self.statement_count,
+                "total_ms": round(self.total_ms, 3),
+                "avg_ms": round(self.total_ms / self.statement_count, 3) if self.statement_count else 0.0,
+                "slow_count": self.slow_count,
+                "buffered": len(self._entries),
+                "capacity": self._entries.maxlen,
+                "threshold_ms": settings.SLOW_QUERY_THRESHOLD_MS,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+slow_query_log = SlowQueryLog(settings.SLOW_QUERY_LOG_SIZE)
+
+
+@contextmanager
+def capture_queries():
+    """
+    Collect every statement executed in the current context (including
+    concurrent sub-queries spawned from it)
+    """
+    queries: List[Dict[str, Any]] = []
+    token = _captured_queries.set(queries)
+    try:
+        yield queries
+    finally:
+        _captured_queries.reset(token)
+
+
+async def _explain(engine: AsyncEngine, entry: Dict[str, Any], statement: str, parameters: Any):
+    """Run EXPLAIN for a slow statement on its own pooled connection"""
+    pool = engine.sync_engine.pool
+    if hasattr(pool, "size") and pool.checkedout() >= pool.size():
+        entry["explain_error"] = "skipped: connection pool saturated"
+        return
+    try:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(slow_query_log=False)
+            result = await conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+            entry["explain"] = [
+                {key: (value if isinstance(value, (int, float, str)) or value is None else str(value))
+                 for key, value in row._mapping.items()}
+                for row in result
+            ]
+    except Exception as e:
+        entry["explain_error"] = str(e)
+
+
+def instrument_engine(engine: AsyncEngine, name: str):
+    """Attach timing listeners to an async engine"""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # Kept on the per-execution context so a failed statement leaves nothing behind on the connection
+        context._query_start_time = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - context._query_start_time) * 1000
+        if not context.execution_options.get("slow_query_log", True):
+            return
+        slow_query_log.observe(duration_ms)
+
+        captured = _captured_queries.get()
+        if captured is not None:
+            captured.append({
+                "sql": statement,
+                "params": _format_parameters(parameters),
+                "duration_ms": round(duration_ms, 3),
+                "row_count": cursor.rowcount,
+            })
+
+        if duration_ms < settings.SLOW_QUERY_THRESHOLD_MS:
+            return
+
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "engine": name,
+            "duration_ms": round(duration_ms, 3),
+            "statement": statement,
+            "parameters": _format_parameters(parameters),
+            "row_count": cursor.rowcount,
+            "explain": None,
+        }
+        slow_query_log.record(entry)
+        app_logger.warning(f"Slow query ({duration_ms:.1f}ms, {cursor.rowcount} rows): {' '.join(statement.split())[:200]}")
+
+        # EXPLAIN only reads (SELECT / WITH ... SELECT); the current connection may still be streaming results,
+        # so the plan is captured asynchronously on another connection
+        if settings.SLOW_QUERY_EXPLAIN and statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                return
+            task = loop.create_task(_explain(engine, entry, statement, parameters))
+            _explain_tasks.add(task)
+            task.add_done_callback(_explain_tasks.discard)
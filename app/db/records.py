@@ -0,0 +1,176 @@
+"""
+Compact row records for large result sets
+
+Rows from the operator / capability fetches are stored as plain tuples in a
+RecordList instead of one dict per row. Low-cardinality string columns
+(location, business and process names) are interned so that every row of a
+result set shares the same string objects.
+
+Plain tuples of strings and numbers are untracked by the cyclic garbage
+collector after their first collection, so large result sets do not make later
+full collections more expensive (NamedTuple instances, being tuple subclasses,
+would stay tracked). Consumers still see NamedTuple records: indexing and
+iteration wrap each stored tuple on access, and the records keep a read-only,
+dict-like interface (get / [] / keys / items) so existing code using
+``row.get("operator_name")`` keeps working.
+"""
+from collections import namedtuple
+from operator import itemgetter
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Sequence, Type
+
+
+class RecordMixin:
+    """Dict-style read access for NamedTuple records"""
+
+    __slots__ = ()
+
+    _fields: Sequence[str]
+    _interned: FrozenSet[str] = frozenset()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default) if key in self._fields else default
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            if key not in self._fields:
+                raise KeyError(key)
+            return getattr(self, key)
+        return super().__getitem__(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._fields
+
+    def keys(self) -> Sequence[str]:
+        return self._fields
+
+    def items(self) -> Iterable:
+        return zip(self._fields, self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(zip(self._fields, self))
+
+    @classmethod
+    def partition_builder(cls, keys: Iterable[str]) -> Callable[[Sequence[Sequence[Any]]], List[tuple]]:
+        """
+        Return a function converting a partition of result rows into plain tuples
+
+        Column positions are resolved once per result set from ``keys``. The
+        partition is transposed so that interning and tuple construction run
+        column-wise in C (map / zip) rather than per field in Python. Interned
+        strings are shared across all partitions of the result set.
+        """
+        keys = list(keys)
+        positions = [keys.index(field) for field in cls._fields]
+        interned = [field in cls._interned for field in cls._fields]
+        strings: Dict[Any, Any] = {}
+        intern_value = strings.setdefault
+
+        def build(partition: Sequence[Sequence[Any]]) -> List[tuple]:
+            if not partition:
+                return []
+            columns = list(zip(*partition))
+            values = [
+                map(intern_value, columns[position], columns[position]) if intern_it else columns[position]
+                for position, intern_it in zip(positions, interned)
+            ]
+            return list(zip(*values))
+
+        return build
+
+
+class RecordList(list):
+    """
+    List of rows stored as plain tuples and exposed as ``record_type`` records
+
+    Slicing, copy(), filter() and group_by() return RecordLists sharing the
+    stored tuples.
+    """
+
+    def __init__(self, record_type: Type[RecordMixin], rows: Iterable[tuple] = ()):
+        super().__init__(rows)
+        self.record_type = record_type
+
+    def __iter__(self) -> Iterator[RecordMixin]:
+        return map(self.record_type._make, super().__iter__())
+
+    def __reversed__(self) -> Iterator[RecordMixin]:
+        return map(self.record_type._make, super().__reversed__())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RecordList(self.record_type, super().__getitem__(index))
+        return self.record_type._make(super().__getitem__(index))
+
+    def copy(self) -> "RecordList":
+        return RecordList(self.record_type, super().__iter__())
+
+    def rows(self) -> Iterator[tuple]:
+        """Stored tuples without record wrapping"""
+        return super().__iter__()
+
+    def filter(self, field: str, values: Iterable[Any]) -> "RecordList":
+        """Rows whose ``field`` is one of ``values``"""
+        values = set(values)
+        get = itemgetter(self.record_type._fields.index(field))
+        return RecordList(self.record_type, (row for row in super().__iter__() if get(row) in values))
+
+    def group_by(self, *fields: str) -> Dict[Any, "RecordList"]:
+        """
+        Group rows by one or more fields, preserving order
+
+        A single field gives scalar keys, several fields give tuple keys.
+        """
+        key = itemgetter(*(self.record_type._fields.index(field) for field in fields))
+        groups: Dict[Any, RecordList] = {}
+        for row in super().__iter__():
+            group_key = key(row)
+            group = groups.get(group_key)
+            if group is None:
+                group = groups[group_key] = RecordList(self.record_type)
+            list.append(group, row)
+        return groups
+
+
+_HIERARCHY_FIELDS = frozenset({
+    "location_name", "business_category", "business_name", "process_category", "process_name",
+})
+
+
+class ProcessAllocation(RecordMixin, namedtuple("ProcessAllocation", [
+    "location_name", "business_category", "business_name",
+    "process_category", "process_name", "operator_count",
+])):
+    """Valid operator count per location x business x process"""
+
+    __slots__ = ()
+    _interned = _HIERARCHY_FIELDS
+
+
+class OperatorCapability(RecordMixin, namedtuple("OperatorCapability", [
+    "operator_id", "operator_name", "location_name", "business_category",
+    "business_name", "process_category", "process_name", "work_level",
+])):
+    """One capability of a valid operator (4-layer hierarchy included)"""
+
+    __slots__ = ()
+    _interned = _HIERARCHY_FIELDS
+
+
+class SkillMatch(RecordMixin, namedtuple("SkillMatch", [
+    "operator_id", "operator_name", "location_name",
+    "target_business_category", "target_business_name",
+    "target_process_category", "target_process_name",
+    "current_business_category", "current_business_name",
+    "current_process_category", "current_process_name",
+    "target_skill_level",
+])):
+    """Holder of a target-process skill paired with one of their current capabilities"""
+
+    __slots__ = ()
+    _interned = frozenset({
+        "location_name",
+        "target_business_category", "target_business_name",
+        "target_process_category", "target_process_name",
+        "current_business_category", "current_business_name",
+        "current_process_category", "current_process_name",
+    })
@@ -1,21 +1,145 @@
 """
 Database session management
 """
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
 from app.core.config import settings
+from app.db.query_log import instrument_engine
+
+
+class PoolMetrics:
+    """
+    Connection pool wait-time gauges
+
+    SQLAlchemy has no "before checkout" event, so the wait time is measured
+    by the instrumented pool class below.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+        self.timeouts = 0
+        self.errors = 0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += seconds
+            self.last_wait = seconds
+            self.max_wait = max(self.max_wait, seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "last_wait_ms": round(self.last_wait * 1000, 3),
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+            }
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection"""
+
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        except Exception:
+            # Connection failures (server down, auth errors) are not pool exhaustion
+            self.metrics.record_error()
+            raise
+        self.metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+
+def _apply_statement_timeout(engine: AsyncEngine):
+    """Set a per-session statement timeout on every new MySQL connection"""
+    if engine.dialect.name != "mysql" or settings.DATABASE_STATEMENT_TIMEOUT_MS <= 0:
+        return
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def set_timeout(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # MAX_EXECUTION_TIME applies to read-only SELECT statements
+        cursor.execute(f"SET SESSION MAX_EXECUTION_TIME = {int(settings.DATABASE_STATEMENT_TIMEOUT_MS)}")
+        cursor.close()
+
+
+def create_engine(url: str, pool_size: int, max_overflow: int, name: str) -> AsyncEngine:
+    """Create an async engine with a sized, instrumented pool and statement timing"""
+    pool_class = type("InstrumentedQueuePool", (InstrumentedQueuePool,), {"metrics": PoolMetrics()})
+    engine = create_async_engine(
+        url,
+        echo=settings.DEBUG,
+        future=True,
+        poolclass=pool_class,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+    _apply_statement_timeout(engine)
+    instrument_engine(engine, name)
+    return engine
 
 
-# Create the async engine
-engine = create_async_engine(
+# Write engine (approvals and other writes)
+write_engine = create_engine(
     settings.DATABASE_URL,
-    echo=settings.DEBUG,
-    future=True,
-    pool_pre_ping=True
+    settings.DATABASE_POOL_SIZE,
+    settings.DATABASE_MAX_OVERFLOW,
+    "write",
 )
 
-# Create the async session factory
+# Read engine (analytics queries); falls back to the primary when no replica is configured
+if settings.DATABASE_READ_URL:
+    read_engine = create_engine(
+        settings.DATABASE_READ_URL,
+        settings.DATABASE_READ_POOL_SIZE,
+        settings.DATABASE_READ_MAX_OVERFLOW,
+        "read",
+    )
+else:
+    read_engine = write_engine
+
+# Backward compatible alias
+engine = write_engine
+
+# Create the async session factories
 async_session_factory = async_sessionmaker(
-    engine,
+    write_engine,
+    class_=AsyncSession,
+    expire_on_commit=False
+)
+
+read_session_factory = async_sessionmaker(
+    read_engine,
     class_=AsyncSession,
     expire_on_commit=False
 )
@@ -23,10 +147,53 @@ async_session_factory = async_sessionmaker(
 
 async def get_db() -> AsyncSession:
     """
-    Dependency to get database session
+    Dependency to get database session (write engine)
     """
     async with async_session_factory() as session:
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
+
+
+async def get_read_db() -> AsyncSession:
+    """
+    Dependency to get a read-only database session (read replica if configured)
+    """
+    async with read_session_factory() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+async def dispose_engines():
+    """
+    Close all pooled connections (application shutdown)
+    """
+    await write_engine.dispose()
+    if read_engine is not write_engine:
+        await read_engine.dispose()
+
+
+def get_pool_metrics() -> Dict[str, Any]:
+    """
+    Pool gauges for the write and read engines
+    """
+    engines = {"write": write_engine}
+    if read_engine is not write_engine:
+        engines["read"] = read_engine
+
+    metrics = {}
+    for name, eng in engines.items():
+        pool = eng.pool
+        metrics[name] = {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            # QueuePool.overflow() is negative while the base pool is not exhausted
+            "overflow": max(pool.overflow(), 0),
+            "wait": pool.metrics.snapshot(),
+        }
+    metrics["replica_configured"] = read_engine is not write_engine
+    return metrics
@@ -5,14 +5,31 @@ from contextlib import asynccontextmanager
 from app.core.config import settings
 from app.core.logging import app_logger
 from app.api.v1.routers import api_router
+from app.services.alert_scheduler import alert_scheduler
+from app.services.alert_store import alert_store
+from app.services.capacity_simulator import CapacitySimulator
+from app.services.chroma_connection import chroma_connection
+from app.db.session import dispose_engines
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     app_logger.info(f"Starting {settings.APP_NAME} v{settings.APP_VERSION}")
     app_logger.info(f"Environment: {settings.ENVIRONMENT}")
+    # Connect to ChromaDB in the background so startup never blocks on it
+    chroma_connection.start()
+    # The alert list/detail APIs and the scheduler read and write the alerts table (CREATE TABLE IF NOT EXISTS)
+    if settings.ALERT_STORE_ENABLED:
+        await alert_store.ensure_table()
+    # Evaluate alerts in the background; /alerts/check serves the cached set
+    if settings.ALERT_SCHEDULER_ENABLED:
+        alert_scheduler.start()
     yield
     app_logger.info("Shutting down application")
+    await alert_scheduler.stop()
+    chroma_connection.stop()
+    CapacitySimulator.shutdown_executor()
+    await dispose_engines()
 
 
 app = FastAPI(
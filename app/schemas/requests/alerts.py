@@ -0,0 +1,15 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+
+class AlertBatchResolveRequest(BaseModel):
+    alert_ids: Optional[List[int]] = Field(None, min_length=1, max_length=100, description="解消提案を生成するアラートID（省略時は発生中の全アラート）")
+    detail: bool = Field(False, description="デバッグ情報を含めるかどうか")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "alert_ids": [1, 2, 3],
+                "detail": False
+            }
+        }
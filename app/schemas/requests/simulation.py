@@ -0,0 +1,42 @@
+from pydantic import BaseModel, Field
+from typing import List, Dict, Any, Optional
+
+
+class TransferPlan(BaseModel):
+    id: Optional[str] = Field(None, description="配置変更案ID（省略時は連番）")
+    changes: List[Dict[str, Any]] = Field(..., description="配置変更内容（提案のchangesと同じ形式）")
+
+
+class WhatIfRequest(BaseModel):
+    plans: List[TransferPlan] = Field(..., min_length=1, max_length=50, description="評価する配置変更案")
+    runs: Optional[int] = Field(None, ge=10, le=10000, description="モンテカルロ試行回数")
+    horizon_minutes: Optional[int] = Field(None, ge=10, le=1440, description="シミュレーション期間（分）")
+    seed: Optional[int] = Field(None, description="乱数シード（再現性が必要な場合）")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "plans": [
+                    {
+                        "id": "sapporo_entry1_plus2",
+                        "changes": [
+                            {"from": "東京", "to": "札幌", "process": "エントリ1", "count": 2}
+                        ]
+                    },
+                    {
+                        "id": "correction_to_entry1",
+                        "changes": [
+                            {
+                                "from_business_category": "SS",
+                                "from_process_name": "補正",
+                                "to_business_category": "SS",
+                                "to_process_name": "エントリ1",
+                                "count": 2
+                            }
+                        ]
+                    }
+                ],
+                "runs": 500,
+                "horizon_minutes": 480
+            }
+        }
@@ -10,6 +10,10 @@ class AlertType(str, Enum):
     SKILL_GAP = "skill_gap"
     WORKLOAD = "workload"
     SYSTEM = "system"
+    CORRECTION_THRESHOLD = "correction_threshold"
+    SS_MASSIVE = "ss_massive"
+    LONG_ASSIGNMENT = "long_assignment"
+    ENTRY_BALANCE = "entry_balance"
 
 
 class AlertPriority(str, Enum):
@@ -35,8 +39,11 @@ class Alert(BaseModel):
     message: str = Field(..., description="アラート詳細メッセージ")
     location_id: Optional[int] = Field(None, description="拠点ID")
     location_name: Optional[str] = Field(None, description="拠点名")
-    employee_id: Optional[int] = Field(None, description="従業員ID")
+    process_name: Optional[str] = Field(None, description="工程名")
+    employee_id: Optional[str] = Field(None, description="従業員ID（オペレータID）")
     employee_name: Optional[str] = Field(None, description="従業員名")
+    threshold: Optional[float] = Field(None, description="アラート基準値")
+    current_value: Optional[float] = Field(None, description="検知時の値")
     created_at: datetime = Field(..., description="作成日時")
     updated_at: datetime = Field(..., description="更新日時")
     acknowledged_at: Optional[datetime] = Field(None, description="確認日時")
@@ -53,8 +60,11 @@ class Alert(BaseModel):
                 "message": "横浜拠点でデータ入力工程の人員が3名不足しています。",
                 "location_id": 3,
                 "location_name": "横浜",
+                "process_name": None,
                 "employee_id": None,
                 "employee_name": None,
+                "threshold": None,
+                "current_value": None,
                 "created_at": "2025-09-16T08:30:00",
                 "updated_at": "2025-09-16T08:30:00",
                 "acknowledged_at": None,
@@ -64,10 +74,10 @@ class Alert(BaseModel):
 
 
 class AlertListResponse(BaseModel):
-    alerts: List[Alert] = Field(..., description="アラート一覧")
-    total: int = Field(..., description="総件数")
-    page: int = Field(1, description="現在のページ番号")
+    alerts: List[Alert] = Field(..., description="アラート一覧（新しい順）")
     page_size: int = Field(20, description="1ページあたりの件数")
+    next_cursor: Optional[str] = Field(None, description="次のページのカーソル（最後のページはNone）")
+    total: Optional[int] = Field(None, description="総件数（include_total指定時のみ）")
     
     class Config:
         json_schema_extra = {
@@ -82,17 +92,20 @@ class AlertListResponse(BaseModel):
                         "message": "横浜拠点でデータ入力工程の人員が3名不足しています。",
                         "location_id": 3,
                         "location_name": "横浜",
+                        "process_name": None,
                         "employee_id": None,
                         "employee_name": None,
+                        "threshold": None,
+                        "current_value": None,
                         "created_at": "2025-09-16T08:30:00",
                         "updated_at": "2025-09-16T08:30:00",
                         "acknowledged_at": None,
                         "resolved_at": None,
                     }
                 ],
-                "total": 15,
-                "page": 1,
                 "page_size": 20,
+                "next_cursor": "MjAyNS0wOS0xNlQwODozMDowMHwx",
+                "total": None,
             }
         }
 
@@ -114,8 +127,11 @@ class AlertDetailResponse(BaseModel):
                     "message": "横浜拠点でデータ入力工程の人員が3名不足しています。",
                     "location_id": 3,
                     "location_name": "横浜",
+                    "process_name": None,
                     "employee_id": None,
                     "employee_name": None,
+                    "threshold": None,
+                    "current_value": None,
                     "created_at": "2025-09-16T08:30:00",
                     "updated_at": "2025-09-16T08:30:00",
                     "acknowledged_at": None,
@@ -0,0 +1,36 @@
+from pydantic import BaseModel, Field
+from typing import List, Dict, Optional, Any
+
+
+class FinishDistribution(BaseModel):
+    p50_minutes: Optional[float] = Field(None, description="完了までの時間の中央値（分）")
+    p90_minutes: Optional[float] = Field(None, description="完了までの時間の90%点（分）")
+    on_time_probability: float = Field(..., description="シミュレーション期間内に完了する確率")
+    expected_finish_time: Optional[str] = Field(None, description="予測完了時刻（p50）")
+
+
+class ProcessFinish(FinishDistribution):
+    backlog: int = Field(..., description="滞留件数")
+    staff: float = Field(..., description="配置人数")
+
+
+class BaselineResult(BaseModel):
+    staffing: Dict[str, float] = Field(..., description="工程別の現在の配置人数")
+    processes: Dict[str, ProcessFinish] = Field(..., description="工程別の完了見込み")
+    overall: FinishDistribution = Field(..., description="全工程の完了見込み")
+
+
+class PlanResult(BaseModel):
+    plan_id: str = Field(..., description="配置変更案ID")
+    staffing: Dict[str, float] = Field(..., description="変更後の工程別配置人数")
+    processes: Dict[str, ProcessFinish] = Field(..., description="工程別の完了見込み")
+    overall: FinishDistribution = Field(..., description="全工程の完了見込み")
+    delay_change_minutes: Optional[float] = Field(None, description="現状比の完了時間の変化（分）")
+    capacity_change_ratio: Optional[float] = Field(None, description="現状比の処理能力の変化率")
+
+
+class WhatIfResponse(BaseModel):
+    snapshot_time: Optional[Any] = Field(None, description="基準とした進捗スナップショットの時刻")
+    backlogs: Dict[str, int] = Field(..., description="工程別の滞留件数")
+    baseline: BaselineResult = Field(..., description="現状配置のシミュレーション結果")
+    plans: List[PlanResult] = Field(..., description="配置変更案の評価結果（完了が早い順）")
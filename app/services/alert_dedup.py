@@ -0,0 +1,254 @@
+"""
+アラートの重複排除
+フィンガープリント（種別＋拠点＋工程、業務バランスは＋業務）ごとの通知状態を保持し、抑制期間内の再発を通知せず、悪化した場合のみ優先度を上げて再通知する
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from app.core.config import settings
+from app.core.logging import app_logger
+from app.services.alert_engine import PRIORITY_ORDER
+
+
+# 優先度の順位（PRIORITY_ORDERの値）→ 優先度
+PRIORITY_BY_RANK = {rank: priority for priority, rank in PRIORITY_ORDER.items()}
+
+
+def alert_fingerprint(alert: Dict[str, Any]) -> str:
+    """
+    アラートのフィンガープリント（種別＋拠点＋工程、同じ拠点・工程のオペレータ別アラートは1つにまとまる）
+    工程を持たない業務バランスのアラートは業務名も含め、業務ごとに分ける
+    """
+    fingerprint = f"{alert['type']}|{alert.get('location_name') or ''}|{alert.get('process_name') or ''}"
+    if alert.get("business_name"):
+        fingerprint += f"|{alert['business_name']}"
+    return fingerprint
+
+
+def alert_severity(alert: Dict[str, Any]) -> float:
+    """基準に対する超過の度合い（current_value / threshold、基準がなければcurrent_value）"""
+    current_value = alert.get("current_value") or 0
+    threshold = alert.get("threshold")
+    return float(current_value) / float(threshold) if threshold else float(current_value)
+
+
+class FingerprintState(NamedTuple):
+    """フィンガープリント1件の通知状態（時刻はUNIX時刻）"""
+    opened_at: float              # 今回の発生の開始時刻
+    last_seen: float              # 最後に発生中と判定した時刻
+    notified_at: float            # 最後に通知した時刻
+    priority_rank: int            # 通知済みの優先度（PRIORITY_ORDERの値、エスカレーションで小さくなる）
+    severity: float               # 通知時の超過の度合い
+    escalations: int              # エスカレーション回数
+    suppressed: int               # 抑制した再発の回数
+    generation: int               # 通知のたびに増える番号（解消提案の再利用判定に使う）
+    cleared_at: Optional[float]   # 解消した時刻（発生中はNone）
+
+
+class AlertDeduplicator:
+    """
+    フィンガープリント単位のアラート通知の判定
+
+    - 初めて発生したフィンガープリント、または解消からALERT_SUPPRESSION_SECONDS以上経って再発したものは新規として通知する
+    - 解消から抑制期間内に再発したものは新規として通知しない（基準付近で発生と解消を繰り返す場合の通知を抑える）。
+      ただし解消は配信済みのため、発生中に戻ったことは再発（reopened）として返す
+    - 発生中に優先度が上がった、または超過の度合いが通知時の(1 + ALERT_ESCALATION_STEP)倍以上になった場合は
+      優先度を1段階上げて再通知する（以降、同じフィンガープリントのアラートは上げた優先度で返す）
+    - 状態は1フィンガープリントにつきタプル1つで保持し、ALERT_STATE_SAVE_INTERVAL_SECONDSごとにファイルへ保存する
+      （再起動後も抑制期間・エスカレーションを引き継ぐ）。抑制期間を過ぎた解消済みの状態は削除する
+    - 解消提案はフィンガープリント・通知番号・依頼文章ごとに保持し、次の通知まで同じ内容のアラートで再利用する
+      （同じフィンガープリントでもオペレータ等が異なるアラートには別の提案を使う）
+    """
+
+    def __init__(
+        self,
+        suppression_seconds: Optional[float] = None,
+        escalation_step: Optional[float] = None,
+        path: Optional[str] = None,
+        save_interval_seconds: Optional[float] = None
+    ):
+        """
+        Args:
+            suppression_seconds: 解消後に再発を通知しない期間（秒）
+            escalation_step: 再通知する超過の度合いの増加率
+            path: 状態の保存先
+            save_interval_seconds: 状態をファイルへ保存する間隔（秒）
+        """
+        self.suppression_seconds = settings.ALERT_SUPPRESSION_SECONDS if suppression_seconds is None else suppression_seconds
+        self.escalation_step = settings.ALERT_ESCALATION_STEP if escalation_step is None else escalation_step
+        self.path = Path(path or settings.ALERT_STATE_PATH)
+        self.save_interval_seconds = save_interval_seconds or settings.ALERT_STATE_SAVE_INTERVAL_SECONDS
+        self._states: Dict[str, FingerprintState] = {}
+        self._resolutions: Dict[str, Tuple[int, Dict[str, Dict[str, Any]]]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def apply(self, alerts: List[Dict[str, Any]], now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        評価結果の発生中アラートを通知状態に反映
+
+        Args:
+            alerts: アラート評価エンジンの発生中アラート
+            now: 判定時刻（UNIX時刻、デフォルトは現在時刻）
+
+        Returns:
+            alerts: fingerprint・escalations付きのアラート（エスカレーション済みの優先度に置き換え）
+            new: 新規に通知するアラート（フィンガープリントごとに最も重いもの、occurrences付き）
+            escalated: 悪化により再通知するアラート
+            reopened: 抑制期間内に再発したアラート（新規としては通知しないが、解消済みの表示を戻す）
+            cleared: 解消したフィンガープリント
+            suppressed: 抑制した再発の数
+        """
+        now = time.time() if now is None else now
+        self._ensure_loaded()
+
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for alert in alerts:
+            groups.setdefault(alert_fingerprint(alert), []).append(alert)
+
+        new, escalated, reopened, suppressed = [], [], [], 0
+        with self._lock:
+            for fingerprint, members in groups.items():
+                worst = min(
+                    members,
+                    key=lambda alert: (PRIORITY_ORDER.get(alert["priority"], len(PRIORITY_ORDER)), -alert_severity(alert))
+                )
+                rank = PRIORITY_ORDER.get(worst["priority"], len(PRIORITY_ORDER))
+                severity = alert_severity(worst)
+                state = self._states.get(fingerprint)
+
+                if state is None or (state.cleared_at is not None and now - state.cleared_at >= self.suppression_seconds):
+                    state = FingerprintState(
+                        opened_at=now, last_seen=now, notified_at=now, priority_rank=rank, severity=severity,
+                        escalations=0, suppressed=0, generation=(state.generation if state else 0) + 1, cleared_at=None,
+                    )
+                    notify = new
+                elif self._worsened(state, rank, severity):
+                    state = state._replace(
+                        last_seen=now, notified_at=now,
+                        priority_rank=max(min(rank, state.priority_rank - 1), 0),
+                        severity=severity, escalations=state.escalations + 1,
+                        generation=state.generation + 1, cleared_at=None,
+                    )
+                    notify = escalated
+                elif state.cleared_at is not None:
+                    state = state._replace(last_seen=now, suppressed=state.suppressed + 1, cleared_at=None)
+                    suppressed += 1
+                    notify = reopened
+                else:
+                    state = state._replace(last_seen=now)
+                    notify = None
+                self._states[fingerprint] = state
+
+                for alert in members:
+                    alert["fingerprint"] = fingerprint
+                    alert["escalations"] = state.escalations
+                    if state.priority_rank < PRIORITY_ORDER.get(alert["priority"], len(PRIORITY_ORDER)):
+                        alert["priority"] = PRIORITY_BY_RANK[state.priority_rank]
+                if notify is not None:
+                    notify.append({**worst, "occurrences": len(members)})
+
+            cleared = []
+            for fingerprint, state in list(self._states.items()):
+                if fingerprint in groups:
+                    continue
+                if state.cleared_at is None:
+                    self._states[fingerprint] = state._replace(cleared_at=now)
+                    self._resolutions.pop(fingerprint, None)
+                    cleared.append(fingerprint)
+                elif now - state.cleared_at >= self.suppression_seconds:
+                    del self._states[fingerprint]
+
+            self._dirty = True
+
+        return {
+            "alerts": alerts, "new": new, "escalated": escalated, "reopened": reopened,
+            "cleared": cleared, "suppressed": suppressed,
+        }
+
+    def _worsened(self, state: FingerprintState, rank: int, severity: float) -> bool:
+        """通知時より優先度が上がった、または超過の度合いが(1 + escalation_step)倍以上になったか"""
+        if rank < state.priority_rank:
+            return True
+        return state.severity > 0 and severity >= state.severity * (1 + self.escalation_step)
+
+    def cached_resolution(self, fingerprint: str, message: str) -> Optional[Dict[str, Any]]:
+        """前回の通知以降に同じフィンガープリント・同じ依頼文章で生成した解消提案"""
+        with self._lock:
+            state = self._states.get(fingerprint)
+            cached = self._resolutions.get(fingerprint)
+            if state is None or cached is None or cached[0] != state.generation:
+                return None
+            return cached[1].get(message)
+
+    def remember_resolution(self, fingerprint: str, message: str, resolution: Dict[str, Any]):
+        """解消提案を次の通知まで再利用できるよう依頼文章ごとに保持（発生中のフィンガープリントのみ）"""
+        with self._lock:
+            state = self._states.get(fingerprint)
+            if state is None or state.cleared_at is not None:
+                return
+            cached = self._resolutions.get(fingerprint)
+            if cached is None or cached[0] != state.generation:
+                cached = self._resolutions[fingerprint] = (state.generation, {})
+            cached[1][message] = resolution
+
+    def save_if_due(self):
+        """前回の保存からsave_interval_seconds以上経っていて変更があれば保存"""
+        if self._dirty and time.monotonic() - self._saved_at >= self.save_interval_seconds:
+            self.save()
+
+    def save(self):
+        """状態をファイルに保存（一時ファイルに書いてから置き換え）"""
+        if not self._loaded:
+            # 読み込み前に保存すると保存済みの状態を空で上書きしてしまう
+            return
+        with self._lock:
+            payload = {fingerprint: list(state) for fingerprint, state in self._states.items()}
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            temp_path.write_text(json.dumps({"states": payload}, ensure_ascii=False), encoding="utf-8")
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            self._dirty = True
+            app_logger.error(f"アラート通知状態の保存エラー: {e}")
+
+    def _ensure_loaded(self):
+        """初回の判定前に保存済みの状態を読み込む"""
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path.exists():
+            return
+        try:
+            payload = json.loads(self.path.read_text(encoding="utf-8"))
+            states = {fingerprint: FingerprintState(*values) for fingerprint, values in payload["states"].items()}
+        except Exception as e:
+            app_logger.warning(f"アラート通知状態を読み込めません（初期状態から開始）: {e}")
+            return
+        with self._lock:
+            self._states.update(states)
+        app_logger.info(f"アラート通知状態読み込み: {len(states)}件 ({self.path})")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            open_states = [state for state in self._states.values() if state.cleared_at is None]
+            return {
+                "fingerprints": len(self._states),
+                "open": len(open_states),
+                "escalated": sum(1 for state in open_states if state.escalations),
+                "suppressed_total": sum(state.suppressed for state in self._states.values()),
+                "cached_resolutions": sum(len(cached[1]) for cached in self._resolutions.values()),
+            }
+
+
+# アプリケーション全体で共有する重複排除（通知状態をリクエスト間で保持する）
+alert_deduplicator = AlertDeduplicator()
@@ -0,0 +1,458 @@
+"""
+アラート評価エンジン
+進捗スナップショット・ログイン状況・ログイン記録のうち前回評価以降の行だけを読み、全アラート基準をまとめて判定する
+"""
+import asyncio
+import itertools
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import app_logger
+from app.services.assignment_tracker import AssignmentTracker, assignment_tracker
+
+
+# やばい基準（rag_contextから取得したルール）
+ALERT_THRESHOLDS = {
+    # 補正工程の残件数基準
+    "correction_threshold_shinagawa": 50,   # 品川: 50件以上
+    "correction_threshold_osaka": 100,      # 大阪: 100件以上
+
+    # SS大量受領基準
+    "ss_massive_threshold": 1000,           # SS受領1000件以上
+
+    # 長時間配置基準
+    "max_assignment_minutes": 60,           # 1時間以上は危険
+
+    # 処理バランス基準
+    "entry_balance_threshold": 0.3,         # エントリ1・2の差が30%以上
+}
+
+# 補正工程の残件数基準と拠点の対応
+# progress_snapshotsの補正残件は全拠点の合計のため、拠点ごとには判定せず最も低い基準で1件のアラートにする
+CORRECTION_THRESHOLD_LOCATIONS = {
+    "correction_threshold_shinagawa": "品川",
+    "correction_threshold_osaka": "大阪",
+}
+
+PRIORITY_ORDER = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
+SNAPSHOTS_SOURCE = "progress_snapshots"
+LOGIN_RECORDS_SOURCE = "login_records_by_location"
+ASSIGNMENTS_SOURCE = "login_records"
+
+# 前回評価以降の進捗スナップショット（idx_ps_snapshot_time_waitingの逆順スキャン、新しい順）
+NEW_SNAPSHOTS_QUERY = text("""
+    SELECT
+        snapshot_time,
+        total_waiting,
+        processing,
+        correction_waiting
+    FROM progress_snapshots
+    WHERE snapshot_time > :since
+    ORDER BY snapshot_time DESC
+    LIMIT :limit
+""")
+
+# 初回評価用（直近の進捗スナップショット、新しい順）
+LATEST_SNAPSHOTS_QUERY = text("""
+    SELECT
+        snapshot_time,
+        total_waiting,
+        processing,
+        correction_waiting
+    FROM progress_snapshots
+    ORDER BY snapshot_time DESC
+    LIMIT :limit
+""")
+
+# 最新のログイン状況の時刻（idx_lrbl_record_time_coverから解決）
+LATEST_RECORD_TIME_QUERY = text("SELECT MAX(record_time) AS record_time FROM login_records_by_location")
+
+# 最新の進捗スナップショットの時刻（idx_ps_snapshot_time_waitingから解決）
+LATEST_SNAPSHOT_TIME_QUERY = text("SELECT MAX(snapshot_time) AS snapshot_time FROM progress_snapshots")
+
+# 業務ごとのエントリ1・2のログイン人数
+ENTRY_BALANCE_QUERY = text("""
+    SELECT
+        business_name,
+        SUM(CASE WHEN process_name = 'エントリ1' THEN login_now ELSE 0 END) AS entry1,
+        SUM(CASE WHEN process_name = 'エントリ2' THEN login_now ELSE 0 END) AS entry2
+    FROM login_records_by_location
+    WHERE record_time = :record_time
+      AND process_name IN ('エントリ1', 'エントリ2')
+    GROUP BY business_name
+    ORDER BY business_name
+""")
+
+
+def _timestamp(value: Any) -> Optional[str]:
+    """DBの時刻値を文字列に（DATETIME・文字列どちらの列にも対応）"""
+    if value is None:
+        return None
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def snapshot_rules(thresholds: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """進捗スナップショットで判定する基準（1行の値と閾値の比較）"""
+    rules = []
+    correction_thresholds = {
+        location: thresholds[name] for name, location in CORRECTION_THRESHOLD_LOCATIONS.items() if name in thresholds
+    }
+    if correction_thresholds:
+        location = min(correction_thresholds, key=correction_thresholds.get)
+        rules.append({
+            "key": "correction_threshold:全拠点",
+            "type": "correction_threshold",
+            "priority": "high",
+            "metric": "correction_waiting",
+            "threshold": correction_thresholds[location],
+            "threshold_location": location,
+            "location_name": "全拠点",
+            "process_name": "補正",
+            "rule_source": f"placement_rule: {location}補正残件基準（全拠点の補正残件に適用）",
+        })
+    if "ss_massive_threshold" in thresholds:
+        rules.append({
+            "key": "ss_massive",
+            "type": "ss_massive",
+            "priority": "critical",
+            "metric": "outstanding",
+            "threshold": thresholds["ss_massive_threshold"],
+            "location_name": "全拠点",
+            "process_name": None,
+            "rule_source": "processing_rule: SS大量時対応",
+        })
+    return rules
+
+
+class AlertEngine:
+    """
+    アラート基準の判定と発生中アラートの管理
+
+    - 進捗スナップショットは前回評価で読んだ最新時刻より新しい行だけを読み（最大ALERT_SNAPSHOT_WINDOW件）、
+      全基準を「行×基準」の行列としてNumPyでまとめて判定する
+    - ログイン状況は最新時刻が変わった場合のみ、業務ごとのエントリ1・2人数を1クエリで集計する
+    - 長時間配置はAssignmentTrackerに新しいログイン記録を反映し、基準時間を超えた配置を範囲検索で求める
+    - 新しい行がない取得元は再判定せず、前回のアラートをそのまま使う
+    - アラートはキー（種別＋拠点・業務）で管理し、基準を超え続けている間は同じID・初回検知時刻を引き継ぐ
+    """
+
+    def __init__(
+        self,
+        thresholds: Optional[Dict[str, Any]] = None,
+        snapshot_window: Optional[int] = None,
+        tracker: Optional[AssignmentTracker] = None
+    ):
+        """
+        Args:
+            thresholds: アラート基準（デフォルトはALERT_THRESHOLDS）
+            snapshot_window: 1回の評価で読む進捗スナップショットの最大件数
+            tracker: オペレータの配置時間トラッカー
+        """
+        self.thresholds = dict(ALERT_THRESHOLDS if thresholds is None else thresholds)
+        self.snapshot_window = snapshot_window or settings.ALERT_SNAPSHOT_WINDOW
+        self.tracker = tracker or assignment_tracker
+        self._rules = snapshot_rules(self.thresholds)
+        self._active: Dict[str, Dict[str, Any]] = {}
+        self._ids = itertools.count(1)
+        self._last_snapshot_time: Any = None
+        self._last_record_time: Any = None
+        self._evaluated_at: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def active_alerts(self) -> List[Dict[str, Any]]:
+        """発生中のアラート（優先度順、同じ優先度は初回検知順）"""
+        alerts = sorted(
+            self._active.values(),
+            key=lambda alert: (PRIORITY_ORDER.get(alert["priority"], len(PRIORITY_ORDER)), alert["id"])
+        )
+        return [dict(alert) for alert in alerts]
+
+    def bind_ids(self, ids: Dict[str, int]):
+        """発生中のアラートのIDを保存先（アラート履歴ストア）のIDに置き換える"""
+        for key, alert_id in ids.items():
+            alert = self._active.get(key)
+            if alert is not None:
+                alert["id"] = alert_id
+
+    def get(self, alert_id: int) -> Optional[Dict[str, Any]]:
+        """発生中のアラートをIDで取得"""
+        for alert in self._active.values():
+            if alert["id"] == alert_id:
+                return dict(alert)
+        return None
+
+    async def has_new_rows(self, db: AsyncSession) -> bool:
+        """前回評価以降に進捗スナップショット・ログイン状況・ログイン記録が追加されたか（インデックスのみで判定）"""
+        snapshot_time = (await db.execute(LATEST_SNAPSHOT_TIME_QUERY)).scalar()
+        if snapshot_time is not None and snapshot_time != self._last_snapshot_time:
+            return True
+        record_time = (await db.execute(LATEST_RECORD_TIME_QUERY)).scalar()
+        if record_time is not None and record_time != self._last_record_time:
+            return True
+        if "max_assignment_minutes" not in self.thresholds:
+            return False
+        try:
+            return await self.tracker.has_new_records(db)
+        except Exception as e:
+            # ログイン記録を読めない場合も他の取得元の変化検知は止めない（評価時にエラーを記録する）
+            app_logger.debug(f"ログイン記録の更新確認エラー: {e}")
+            return False
+
+    async def evaluate(self, db: AsyncSession) -> Dict[str, Any]:
+        """
+        新しい行を読んでアラートを再判定（同時呼び出しでも評価は1つずつ）
+
+        Args:
+            db: データベースセッション
+
+        Returns:
+            alerts: 発生中のアラート
+            new: 今回新たに発生したアラート
+            cleared: 今回解消したアラートのキー
+            evaluated: 取得元ごとの読み込み行数
+        """
+        async with self._lock:
+            changes = {"new": [], "cleared": []}
+            evaluated = {SNAPSHOTS_SOURCE: 0, LOGIN_RECORDS_SOURCE: 0, ASSIGNMENTS_SOURCE: 0}
+
+            try:
+                evaluated[SNAPSHOTS_SOURCE] = await self._evaluate_snapshots(db, changes)
+            except Exception as e:
+                # 前回評価時刻は進めず、次回に同じ行を読み直す
+                app_logger.error(f"進捗スナップショットのアラート評価エラー: {e}")
+
+            try:
+                evaluated[LOGIN_RECORDS_SOURCE] = await self._evaluate_entry_balance(db, changes)
+            except Exception as e:
+                app_logger.error(f"エントリバランスのアラート評価エラー: {e}")
+
+            try:
+                evaluated[ASSIGNMENTS_SOURCE] = await self._evaluate_long_assignments(db, changes)
+            except Exception as e:
+                app_logger.error(f"長時間配置のアラート評価エラー: {e}")
+
+            self._evaluated_at = datetime.now()
+            if changes["new"] or changes["cleared"]:
+                app_logger.info(
+                    f"アラート評価: 発生中{len(self._active)}件 "
+                    f"(新規{len(changes['new'])}件, 解消{len(changes['cleared'])}件)"
+                )
+            return {
+                "alerts": self.active_alerts,
+                "new": [dict(alert) for alert in changes["new"]],
+                "cleared": changes["cleared"],
+                "evaluated": evaluated,
+            }
+
+    async def _evaluate_snapshots(self, db: AsyncSession, changes: Dict[str, List]) -> int:
+        """前回以降の進捗スナップショットで補正残件・SS大量受領を判定"""
+        if not self._rules:
+            return 0
+        if self._last_snapshot_time is None:
+            result = await db.execute(LATEST_SNAPSHOTS_QUERY, {"limit": self.snapshot_window})
+        else:
+            result = await db.execute(
+                NEW_SNAPSHOTS_QUERY, {"since": self._last_snapshot_time, "limit": self.snapshot_window}
+            )
+        # 古い順に並べ替え
+        rows = list(result)[::-1]
+        if not rows:
+            return 0
+
+        metrics = {
+            "correction_waiting": np.array([row.correction_waiting or 0 for row in rows], dtype=np.float64),
+            # 受領済みで未完了の件数（待ち＋処理中）
+            "outstanding": np.array([(row.total_waiting or 0) + (row.processing or 0) for row in rows], dtype=np.float64),
+        }
+        values = np.column_stack([metrics[rule["metric"]] for rule in self._rules])
+        breached = values >= np.array([rule["threshold"] for rule in self._rules], dtype=np.float64)
+
+        # 基準ごとの直近の連続超過の開始行（今回読んだ全行で超過していれば0）
+        row_numbers = np.arange(len(rows))[:, None]
+        streak_start = np.where(~breached, row_numbers, -1).max(axis=0) + 1
+
+        latest = rows[-1]
+        candidates = {}
+        for column, rule in enumerate(self._rules):
+            if not breached[-1, column]:
+                continue
+            current_value = int(values[-1, column])
+            candidates[rule["key"]] = (
+                self._build_snapshot_alert(rule, current_value, rows[streak_start[column]].snapshot_time),
+                # 途中で基準を下回った行があれば別のアラートとして扱う
+                streak_start[column] == 0
+            )
+
+        self._merge(SNAPSHOTS_SOURCE, candidates, _timestamp(latest.snapshot_time), changes)
+        self._last_snapshot_time = latest.snapshot_time
+        return len(rows)
+
+    async def _evaluate_entry_balance(self, db: AsyncSession, changes: Dict[str, List]) -> int:
+        """最新のログイン状況が更新されていればエントリ1・2のバランスを判定"""
+        threshold = self.thresholds.get("entry_balance_threshold")
+        if threshold is None:
+            return 0
+        record_time = (await db.execute(LATEST_RECORD_TIME_QUERY)).scalar()
+        if record_time is None or record_time == self._last_record_time:
+            return 0
+
+        rows = list(await db.execute(ENTRY_BALANCE_QUERY, {"record_time": record_time}))
+        entry1 = np.array([row.entry1 or 0 for row in rows], dtype=np.float64)
+        entry2 = np.array([row.entry2 or 0 for row in rows], dtype=np.float64)
+        larger = np.maximum(entry1, entry2)
+        ratios = np.divide(np.abs(entry1 - entry2), larger, out=np.zeros_like(larger), where=larger > 0)
+
+        candidates = {}
+        for row, ratio, count1, count2 in zip(rows, ratios, entry1, entry2):
+            if ratio >= threshold:
+                alert = self._build_entry_balance_alert(row.business_name, float(ratio), int(count1), int(count2), record_time)
+                candidates[alert["alert_key"]] = (alert, True)
+
+        self._merge(LOGIN_RECORDS_SOURCE, candidates, _timestamp(record_time), changes)
+        self._last_record_time = record_time
+        return len(rows)
+
+    async def _evaluate_long_assignments(self, db: AsyncSession, changes: Dict[str, List]) -> int:
+        """新しいログイン記録を配置に反映し、基準時間以上同じ工程にいるオペレータを判定"""
+        minutes = self.thresholds.get("max_assignment_minutes")
+        if minutes is None:
+            return 0
+        read = await self.tracker.refresh(db)
+        if not read:
+            return 0
+
+        candidates = {}
+        for assignment in self.tracker.exceeding(minutes):
+            alert = self._build_long_assignment_alert(assignment, minutes)
+            previous = self._active.get(alert["alert_key"])
+            # 工程が変わって再び基準を超えた場合は別のアラートとして扱う
+            continued = previous is not None and previous["assignment_started_at"] == alert["assignment_started_at"]
+            candidates[alert["alert_key"]] = (alert, continued)
+
+        self._merge(ASSIGNMENTS_SOURCE, candidates, _timestamp(self.tracker.last_record_time), changes)
+        return read
+
+    def _merge(self, source: str, candidates: Dict[str, tuple], observed_at: Optional[str], changes: Dict[str, List]):
+        """取得元の判定結果で発生中アラートを更新（継続中のアラートはIDと初回検知時刻を引き継ぐ）"""
+        for key in [key for key, alert in self._active.items() if alert["source"] == source and key not in candidates]:
+            del self._active[key]
+            changes["cleared"].append(key)
+
+        for key, (alert, continued) in candidates.items():
+            previous = self._active.get(key)
+            if previous is not None and continued:
+                alert["id"] = previous["id"]
+                alert["first_detected_at"] = previous["first_detected_at"]
+            else:
+                if previous is not None:
+                    changes["cleared"].append(key)
+                alert["id"] = next(self._ids)
+                changes["new"].append(alert)
+            alert["source"] = source
+            alert["last_observed_at"] = observed_at
+            self._active[key] = alert
+
+    def _build_snapshot_alert(self, rule: Dict[str, Any], current_value: int, breached_since: Any) -> Dict[str, Any]:
+        threshold = rule["threshold"]
+        if rule["type"] == "correction_threshold":
+            title = "補正工程残件アラート（全拠点）"
+            message = (
+                f"全拠点の補正残件が{current_value}件です（{rule['threshold_location']}基準: {threshold}件以上）。"
+                f"補正工程への人員配置が必要です。"
+            )
+        else:
+            title = "SS案件大量受領アラート"
+            message = (
+                f"SS案件を{current_value}件受領しました（基準: {threshold:,}件以上）。"
+                f"納品1時間前に人員集中が必要です。"
+            )
+        return {
+            "alert_key": rule["key"],
+            "type": rule["type"],
+            "priority": rule["priority"],
+            "title": title,
+            "message": message,
+            "location_id": None,
+            "location_name": rule["location_name"],
+            "process_name": rule["process_name"],
+            "threshold": threshold,
+            "current_value": current_value,
+            "rule_source": rule["rule_source"],
+            "first_detected_at": _timestamp(breached_since),
+        }
+
+    def _build_entry_balance_alert(
+        self,
+        business_name: str,
+        ratio: float,
+        entry1: int,
+        entry2: int,
+        record_time: Any
+    ) -> Dict[str, Any]:
+        threshold = self.thresholds["entry_balance_threshold"]
+        return {
+            "alert_key": f"entry_balance:{business_name}",
+            "type": "entry_balance",
+            "priority": "medium",
+            "title": f"エントリバランスアラート（{business_name}）",
+            "message": (
+                f"{business_name}のエントリ1が{entry1}人、エントリ2が{entry2}人で差が{ratio:.0%}です"
+                f"（基準: {threshold:.0%}以上）。ダブルエントリの処理が滞留します。"
+            ),
+            "location_id": None,
+            "location_name": "全拠点",
+            "business_name": business_name,
+            "process_name": "エントリ1" if entry1 < entry2 else "エントリ2",
+            "threshold": threshold,
+            "current_value": round(ratio, 3),
+            "rule_source": "processing_rule: エントリ1・2バランス",
+            "first_detected_at": _timestamp(record_time),
+        }
+
+    def _build_long_assignment_alert(self, assignment: Dict[str, Any], minutes: float) -> Dict[str, Any]:
+        operator = assignment["operator_id"]
+        if assignment.get("operator_name"):
+            operator = f"{operator}（{assignment['operator_name']}）"
+        process_name = assignment.get("process_name") or "不明な"
+        started_at = datetime.fromisoformat(assignment["started_at"])
+        return {
+            "alert_key": f"long_assignment:{assignment['operator_id']}",
+            "type": "long_assignment",
+            "priority": "medium",
+            "title": "長時間配置の検出",
+            "message": (
+                f"オペレータID: {operator} が{process_name}工程に{assignment['elapsed_minutes']}分配置されています"
+                f"（基準: {minutes}分以上で集中力低下）。配置転換を検討してください。"
+            ),
+            "location_id": assignment.get("location_id"),
+            "location_name": assignment.get("location_name"),
+            "operator_id": assignment["operator_id"],
+            "operator_name": assignment.get("operator_name"),
+            "process_name": assignment.get("process_name"),
+            "threshold": minutes,
+            "current_value": assignment["elapsed_minutes"],
+            "rule_source": "placement_rule: 長時間配置制限",
+            "assignment_started_at": assignment["started_at"],
+            # 基準時間を超えた時刻
+            "first_detected_at": (started_at + timedelta(minutes=minutes)).isoformat(),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active_alerts": len(self._active),
+            "last_snapshot_time": _timestamp(self._last_snapshot_time),
+            "last_record_time": _timestamp(self._last_record_time),
+            "assignments": self.tracker.stats(),
+            "evaluated_at": self._evaluated_at.isoformat() if self._evaluated_at else None,
+        }
+
+
+# アプリケーション全体で共有するエンジン（評価状態をリクエスト間で保持する）
+alert_engine = AlertEngine()
@@ -0,0 +1,222 @@
+"""
+アラート評価スケジューラー
+バックグラウンドでアラートを評価して発生中のアラートを保持し、変化を購読者（SSE/WebSocket）へ配信する
+"""
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import app_logger
+from app.services.alert_dedup import AlertDeduplicator, alert_deduplicator
+from app.services.alert_engine import AlertEngine, alert_engine
+from app.services.alert_store import AlertStore, alert_store, is_missing_table
+
+
+class AlertScheduler:
+    """
+    アラートの定期評価と配信
+
+    - ALERT_CHANGE_POLL_SECONDSごとに進捗スナップショット・ログイン状況の最新時刻だけを確認し、
+      新しい行があれば即座に評価する（新しい行がなくてもALERT_EVALUATION_INTERVAL_SECONDSごとに評価）
+    - 評価結果はcurrent()でそのまま返せる形で保持するため、ダッシュボードの数に関係なくDBへの問い合わせは一定
+    - 評価結果はAlertDeduplicatorでフィンガープリント単位に判定し、新規・エスカレーション・再発・解消があった場合のみ
+      購読者のキューへ差分だけを配信する（値が変わっただけの場合は配信しない。抑制期間内の再発は新規としては
+      通知しないが、配信済みの解消を打ち消すためreopenedとして配信する）。
+      キューが溢れた購読者には差分を捨てて最新の全件を送り直す
+    - ALERT_STORE_ENABLEDの場合は評価ごとにアラート履歴ストアへ差分を保存し、アラートIDを保存先のIDに揃える
+    """
+
+    def __init__(
+        self,
+        engine: Optional[AlertEngine] = None,
+        interval_seconds: Optional[float] = None,
+        poll_seconds: Optional[float] = None,
+        queue_size: Optional[int] = None,
+        store: Optional[AlertStore] = None,
+        deduplicator: Optional[AlertDeduplicator] = None
+    ):
+        """
+        Args:
+            engine: アラート評価エンジン
+            interval_seconds: 新しい行がなくても評価する間隔（秒）
+            poll_seconds: 新しい行の有無を確認する間隔（秒）
+            queue_size: 購読者ごとの未送信イベントの上限
+            store: アラート履歴ストア（デフォルトはALERT_STORE_ENABLEDの場合のみ共有のストア）
+            deduplicator: フィンガープリント単位の通知判定
+        """
+        self.engine = engine or alert_engine
+        self.interval_seconds = interval_seconds or settings.ALERT_EVALUATION_INTERVAL_SECONDS
+        self.poll_seconds = poll_seconds or settings.ALERT_CHANGE_POLL_SECONDS
+        self.queue_size = queue_size or settings.ALERT_SUBSCRIBER_QUEUE_SIZE
+        self.store = store or (alert_store if settings.ALERT_STORE_ENABLED else None)
+        self.deduplicator = deduplicator or alert_deduplicator
+
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._current: Optional[Dict[str, Any]] = None
+        self._version = 0
+        self._last_run: Optional[float] = None
+        self._evaluations = 0
+        self._last_error: Optional[str] = None
+        self._store_missing = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """評価ループを開始（実行中のイベントループ内で呼び出す）"""
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run(), name="alert-scheduler")
+
+    async def stop(self):
+        """評価ループを停止"""
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        self.deduplicator.save()
+
+    def current(self) -> Optional[Dict[str, Any]]:
+        """直近の評価結果（未評価ならNone）"""
+        return self._current
+
+    async def run_once(self, db: AsyncSession) -> Dict[str, Any]:
+        """
+        アラートを評価し、変化があれば購読者へ配信
+
+        Args:
+            db: データベースセッション
+
+        Returns:
+            評価結果（version, alert_count, alerts, checked_at）
+        """
+        async with self._lock:
+            first = self._current is None
+            result = await self.engine.evaluate(db)
+            notifications = self.deduplicator.apply(result["alerts"])
+            alerts, new, escalated, reopened = (
+                notifications[group] for group in ("alerts", "new", "escalated", "reopened")
+            )
+            if self.store is not None:
+                ids = await self._store(alerts)
+                alerts, new, escalated, reopened = (
+                    [{**alert, "id": ids.get(alert["alert_key"], alert["id"])} for alert in group]
+                    for group in (alerts, new, escalated, reopened)
+                )
+            self._last_run = time.monotonic()
+            self._evaluations += 1
+
+            changed = first or new or escalated or reopened or notifications["cleared"]
+            if changed:
+                self._version += 1
+            # 値だけの変化は配信しないが、current()は常に最新の値を返す
+            self._current = {
+                "version": self._version,
+                "alert_count": len(alerts),
+                "alerts": alerts,
+                "checked_at": datetime.now().isoformat(),
+            }
+            if first:
+                # 初回評価より前に購読したクライアントには全件を送る
+                self._publish({"event": "snapshot", **self._current})
+            elif changed:
+                self._publish({
+                    "event": "changed",
+                    "version": self._version,
+                    "alert_count": len(alerts),
+                    "new": new,
+                    "escalated": escalated,
+                    "reopened": reopened,
+                    "cleared": notifications["cleared"],
+                    "checked_at": self._current["checked_at"],
+                })
+            self.deduplicator.save_if_due()
+            return self._current
+
+    async def _store(self, alerts: List[Dict[str, Any]]) -> Dict[str, int]:
+        """発生中のアラートをアラート履歴ストアへ保存し、alert_key → 保存先のIDを返す"""
+        try:
+            ids = await self.store.sync(alerts)
+        except Exception as e:
+            # 保存できなくても配信は止めない（次回の評価で差分をまとめて保存する）
+            if not is_missing_table(e):
+                app_logger.error(f"アラート履歴の保存エラー: {e}")
+            elif not self._store_missing:
+                app_logger.error("アラート履歴テーブル（alerts）がないため保存をスキップします（scripts/create_alert_store.pyで作成）")
+            self._store_missing = is_missing_table(e)
+            return {}
+        self._store_missing = False
+        self.engine.bind_ids(ids)
+        return ids
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        変化の配信を受け取るキューを登録（使い終わったらunsubscribe()を呼ぶ）
+
+        評価済みであれば最初のイベントとして現在の全件（event: snapshot）が入っている
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        if self._current is not None:
+            queue.put_nowait({"event": "snapshot", **self._current})
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _publish(self, event: Dict[str, Any]):
+        for queue in list(self._subscribers):
+            if queue.full():
+                # 受信が追いつかない購読者は途中の差分を捨てて全件を送り直す
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"event": "snapshot", **self._current})
+            else:
+                queue.put_nowait(event)
+
+    async def _run(self):
+        from app.db.session import read_session_factory
+
+        app_logger.info(
+            f"アラート評価スケジューラー開始（確認間隔{self.poll_seconds}秒, 評価間隔{self.interval_seconds}秒）"
+        )
+        while True:
+            try:
+                async with read_session_factory() as db:
+                    due = self._last_run is None or time.monotonic() - self._last_run >= self.interval_seconds
+                    if due or await self.engine.has_new_rows(db):
+                        await self.run_once(db)
+                self._last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._last_error = f"{type(e).__name__}: {e}"
+                app_logger.error(f"アラート評価スケジューラーエラー: {e}")
+            await asyncio.sleep(self.poll_seconds)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "version": self._version,
+            "evaluations": self._evaluations,
+            "subscribers": len(self._subscribers),
+            "checked_at": self._current["checked_at"] if self._current else None,
+            "last_error": self._last_error,
+            "engine": self.engine.stats(),
+            "deduplication": self.deduplicator.stats(),
+        }
+
+
+# アプリケーション全体で共有するスケジューラー
+alert_scheduler = AlertScheduler()
@@ -2,32 +2,25 @@
 アラート基準判定サービス
 管理者ノウハウ（RAGコンテキスト）に基づいてアラートを自動生成
 """
-from typing import List, Dict, Any, Optional
+import asyncio
+import time
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
 
+from app.core.config import settings
 from app.core.logging import app_logger
+from app.services.alert_dedup import alert_deduplicator, alert_fingerprint
+from app.services.alert_engine import ALERT_THRESHOLDS, alert_engine
+from app.services.alert_scheduler import alert_scheduler
+from app.services.chroma_connection import chroma_connection
 
 
 class AlertService:
     """アラート基準判定とアラート生成を管理するサービス"""
 
     # やばい基準（rag_contextから取得したルール）
-    ALERT_THRESHOLDS = {
-        # 補正工程の残件数基準
-        "correction_threshold_shinagawa": 50,   # 品川: 50件以上
-        "correction_threshold_osaka": 100,      # 大阪: 100件以上
-
-        # SS大量受領基準
-        "ss_massive_threshold": 1000,           # SS受領1000件以上
-
-        # 長時間配置基準
-        "max_assignment_minutes": 60,           # 1時間以上は危険
-
-        # 処理バランス基準
-        "entry_balance_threshold": 0.3,         # エントリ1・2の差が30%以上
-    }
+    ALERT_THRESHOLDS = ALERT_THRESHOLDS
 
     def __init__(self):
         """初期化"""
@@ -37,121 +30,63 @@ class AlertService:
         """
         全てのアラート基準をチェックして、該当するアラートを生成
 
+        判定は共有のアラート評価エンジンで行い、前回評価以降に追加された行だけを読む。
+        基準を超え続けているアラートは評価をまたいで同じIDのまま返す。
+        変化があればスケジューラー経由でSSE/WebSocketの購読者にも配信される。
+
         Args:
             db: データベースセッション
 
         Returns:
-            アラートリスト
+            発生中のアラートリスト
         """
-        alerts = []
-
         try:
-            # 1. 補正工程の残件数チェック
-            correction_alerts = await self._check_correction_threshold(db)
-            alerts.extend(correction_alerts)
-
-            # 2. SS大量受領チェック
-            ss_alerts = await self._check_ss_massive_threshold(db)
-            alerts.extend(ss_alerts)
-
-            # 3. 長時間配置チェック
-            long_assignment_alerts = await self._check_long_assignment(db)
-            alerts.extend(long_assignment_alerts)
-
-            # 4. 処理バランスチェック
-            balance_alerts = await self._check_entry_balance(db)
-            alerts.extend(balance_alerts)
-
-            app_logger.info(f"アラートチェック完了: {len(alerts)}件のアラートを生成")
-            return alerts
+            result = await alert_scheduler.run_once(db)
+            app_logger.info(f"アラートチェック完了: {result['alert_count']}件のアラートが発生中")
+            return result["alerts"]
 
         except Exception as e:
             app_logger.error(f"アラートチェックエラー: {e}")
             return []
 
-    async def _check_correction_threshold(self, db: AsyncSession) -> List[Dict[str, Any]]:
-        """補正工程の残件数が基準を超えているかチェック"""
-        alerts = []
-
-        try:
-            # TODO: progress_snapshotsテーブルから実際の残件数を取得
-            # 現在は固定値で表示せず (アラート条件に該当するデータがないため非表示)
-            pass
-
-        except Exception as e:
-            app_logger.error(f"補正工程チェックエラー: {e}")
-
-        return alerts
-
-    async def _check_ss_massive_threshold(self, db: AsyncSession) -> List[Dict[str, Any]]:
-        """SS大量受領をチェック"""
-        alerts = []
-
-        try:
-            # TODO: 実際のDBから受領件数を取得
-            # 現在は固定値で表示 (常にアラート表示)
-            ss_received = 1269  # 固定値
-
-            if ss_received >= self.ALERT_THRESHOLDS["ss_massive_threshold"]:
-                alerts.append({
-                    "type": "ss_massive",
-                    "priority": "critical",
-                    "title": "SS案件大量受領アラート",
-                    "message": f"SS案件を{ss_received}件受領しました（基準: 1,000件以上）。納品1時間前に人員集中が必要です。",
-                    "location_id": None,
-                    "location_name": "全拠点",
-                    "threshold": 1000,
-                    "current_value": ss_received,
-                    "rule_source": "processing_rule: SS大量時対応"
-                })
-
-        except Exception as e:
-            app_logger.error(f"SS大量受領チェックエラー: {e}")
-
-        return alerts
-
-    async def _check_long_assignment(self, db: AsyncSession) -> List[Dict[str, Any]]:
-        """長時間配置をチェック"""
-        alerts = []
-
-        try:
-            # TODO: 実際のdaily_assignmentsから長時間配置を検出
-            # 現在は固定値で表示 (常にアラート表示)
-            alerts.append({
-                "type": "long_assignment",
-                "priority": "medium",
-                "title": "長時間配置の検出",
-                "message": "オペレータID: a1234567 がエントリ1工程に90分配置されています（基準: 60分以上で集中力低下）。配置転換を検討してください。",
-                "location_id": None,
-                "location_name": None,
-                "threshold": 60,
-                "current_value": 90,
-                "rule_source": "placement_rule: 長時間配置制限"
-            })
-
-        except Exception as e:
-            app_logger.error(f"長時間配置チェックエラー: {e}")
-
-        return alerts
-
-    async def _check_entry_balance(self, db: AsyncSession) -> List[Dict[str, Any]]:
-        """エントリ1・2の処理バランスをチェック"""
-        alerts = []
+    async def get_long_assignments(
+        self,
+        db: AsyncSession,
+        minutes: Optional[float] = None,
+        location_name: Optional[str] = None,
+        process_name: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        同じ工程に長時間配置されているオペレータを取得
 
-        try:
-            # TODO: progress_snapshotsテーブルから実際のエントリ件数を取得
-            # 現在は固定値で表示せず (アラート条件に該当するデータがないため非表示)
-            pass
+        新しいログイン記録だけを配置時間トラッカーに反映し、配置開始時刻の範囲検索で求める
 
-        except Exception as e:
-            app_logger.error(f"エントリバランスチェックエラー: {e}")
+        Args:
+            db: データベースセッション
+            minutes: 配置時間の基準（分、デフォルトはmax_assignment_minutes）
+            location_name: 拠点名で絞り込む
+            process_name: 工程名で絞り込む
 
-        return alerts
+        Returns:
+            基準、基準時刻、該当オペレータの配置情報（配置時間の長い順）
+        """
+        tracker = alert_engine.tracker
+        if minutes is None:
+            minutes = self.ALERT_THRESHOLDS["max_assignment_minutes"]
+        await tracker.refresh(db)
+        assignments = tracker.exceeding(minutes, location_name=location_name, process_name=process_name)
+        return {
+            "minutes": minutes,
+            "as_of": tracker.last_record_time.isoformat() if tracker.last_record_time else None,
+            "count": len(assignments),
+            "assignments": assignments,
+        }
 
     async def resolve_alert_with_ai(
         self,
         alert: Dict[str, Any],
-        db: AsyncSession
+        db: AsyncSession,
+        detail: bool = False
     ) -> Dict[str, Any]:
         """
         アラートをAIで解消する提案を生成
@@ -159,18 +94,163 @@ class AlertService:
         Args:
             alert: アラート情報
             db: データベースセッション
+            detail: デバッグ情報を含めるかどうか
 
         Returns:
             解消提案
         """
+        return (await self.resolve_alerts_with_ai([alert], db, detail=detail))[0]
+
+    async def resolve_alerts_with_ai(
+        self,
+        alerts: List[Dict[str, Any]],
+        db: AsyncSession,
+        detail: bool = False
+    ) -> List[Dict[str, Any]]:
+        """
+        複数のアラートの解消提案を生成
+
+        Args:
+            alerts: アラート情報のリスト
+            db: データベースセッション
+            detail: デバッグ情報を含めるかどうか
+
+        Returns:
+            解消提案のリスト（alertsと同じ順）
+        """
+        resolutions: List[Optional[Dict[str, Any]]] = [None] * len(alerts)
+        async for index, resolution in self._resolve_alerts(alerts, db, detail):
+            resolutions[index] = resolution
+        return resolutions
+
+    async def resolve_alerts_as_completed(
+        self,
+        alerts: List[Dict[str, Any]],
+        db: AsyncSession,
+        detail: bool = False
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        複数のアラートの解消提案を並行生成し、完了した順に返す
+
+        Args:
+            alerts: アラート情報のリスト
+            db: データベースセッション
+            detail: デバッグ情報を含めるかどうか
+
+        Yields:
+            解消提案（alert_idで元のアラートと対応付ける）
+        """
+        async for _, resolution in self._resolve_alerts(alerts, db, detail):
+            yield resolution
+
+    async def _resolve_alerts(
+        self,
+        alerts: List[Dict[str, Any]],
+        db: AsyncSession,
+        detail: bool
+    ) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """
+        アラートの解消提案を並行生成（完了した順に(アラートの位置, 提案)を返す）
+
+        - 依頼文章が同じアラート（同じ状況）は1件だけLLMで生成して共有し、
+          同じフィンガープリントの前回の通知以降に同じ依頼文章で生成済みの提案があれば再利用する（detail指定時は再利用しない）
+        - 全アラートの管理者ルールを1回の一括検索で取得する
+        - DBデータは共有スナップショットで取得し、同じクエリは全アラートで1回だけ実行する
+        - LLMへの同時リクエストはOllamaの並列数（OLLAMA_NUM_PARALLEL）までに抑える
+        """
         from app.services.integrated_llm_service import IntegratedLLMService
 
-        try:
-            # アラートから依頼文章を生成
-            message = self._generate_message_from_alert(alert)
+        if not alerts:
+            return
+
+        # フィンガープリントは通知の単位のため、オペレータ・業務が異なるアラートも含む。
+        # 提案は依頼文章（アラートの内容）が同じものの間でだけ共有する
+        groups: Dict[Tuple[str, str], List[int]] = {}
+        for index, alert in enumerate(alerts):
+            fingerprint = alert.get("fingerprint") or alert_fingerprint(alert)
+            groups.setdefault((fingerprint, self._generate_message_from_alert(alert)), []).append(index)
+
+        pending: Dict[Tuple[str, str], List[int]] = {}
+        for key, indexes in groups.items():
+            cached = None if detail else alert_deduplicator.cached_resolution(*key)
+            if cached is None:
+                pending[key] = indexes
+                continue
+            for index in indexes:
+                yield index, self._shared_resolution(cached, alerts[index], key[0])
+        if not pending:
+            return
+
+        llm_service = IntegratedLLMService()
+        # 依頼文章ごとの代表（最初のアラート）で生成
+        representatives = [alerts[indexes[0]] for indexes in pending.values()]
+        messages = [message for _, message in pending]
 
+        try:
+            await chroma_connection.wait_first_attempt()
+            rule_lists = llm_service.search_manager_rules([
+                (message, self._rag_entities_from_alert(alert))
+                for message, alert in zip(messages, representatives)
+            ])
+        except Exception as e:
+            app_logger.error(f"アラート解消用の管理者ルール検索エラー: {e}")
+            rule_lists = None
+        if rule_lists is None:
+            # 一括検索できない場合はアラートごとの処理に任せる
+            rule_lists = [None] * len(representatives)
+
+        slots = asyncio.Semaphore(max(settings.OLLAMA_NUM_PARALLEL, 1))
+
+        async def resolve(key: Tuple[str, str], alert: Dict[str, Any], manager_rules) -> Tuple[Tuple[str, str], Dict[str, Any]]:
+            async with slots:
+                return key, await self._resolve_alert(llm_service, alert, key[1], manager_rules, db, detail)
+
+        started = time.perf_counter()
+        # タスクは共有スナップショットのスコープ内で作成し、スコープをタスクに引き継ぐ
+        with llm_service.db_service.shared_snapshot():
+            tasks = [
+                asyncio.ensure_future(resolve(key, alert, manager_rules))
+                for key, alert, manager_rules in zip(pending, representatives, rule_lists)
+            ]
+        try:
+            for completed in asyncio.as_completed(tasks):
+                key, resolution = await completed
+                if "error" not in resolution:
+                    alert_deduplicator.remember_resolution(*key, resolution)
+                representative, *others = pending[key]
+                yield representative, resolution
+                for index in others:
+                    yield index, self._shared_resolution(resolution, alerts[index], key[0])
+        finally:
+            # 呼び出し側が途中で止めた場合（クライアント切断など）は残りをキャンセル
+            for task in tasks:
+                task.cancel()
+        app_logger.info(
+            f"アラート解消提案を一括生成: {len(alerts)}件（LLM生成{len(pending)}件） ({time.perf_counter() - started:.1f}秒)"
+        )
+
+    @staticmethod
+    def _shared_resolution(resolution: Dict[str, Any], alert: Dict[str, Any], fingerprint: str) -> Dict[str, Any]:
+        """同じ内容のアラートで生成済みの解消提案を別のアラートの提案として返す"""
+        return {
+            **resolution,
+            "alert_id": alert.get("id"),
+            "shared_from": resolution.get("alert_id"),
+            "fingerprint": fingerprint,
+        }
+
+    async def _resolve_alert(
+        self,
+        llm_service,
+        alert: Dict[str, Any],
+        message: str,
+        manager_rules: Optional[List[Dict[str, Any]]],
+        db: AsyncSession,
+        detail: bool = False
+    ) -> Dict[str, Any]:
+        """アラート1件の解消提案を生成（管理者ルールは検索済みのものを使用）"""
+        try:
             # 統合LLMサービスで処理
-            llm_service = IntegratedLLMService()
             result = await llm_service.process_message(
                 message=message,
                 context={
@@ -180,16 +260,20 @@ class AlertService:
                     "current_value": alert.get("current_value")
                 },
                 db=db,
-                detail=True
+                detail=detail,
+                manager_rules=manager_rules
             )
 
-            return {
+            resolution = {
                 "alert_id": alert.get("id"),
                 "resolution": result.get("response"),
                 "suggestion": result.get("suggestion"),
                 "rag_results": result.get("rag_results"),
                 "metadata": result.get("metadata")
             }
+            if detail:
+                resolution["debug_info"] = result.get("debug_info")
+            return resolution
 
         except Exception as e:
             app_logger.error(f"アラート解消提案エラー: {e}")
@@ -198,6 +282,14 @@ class AlertService:
                 "error": str(e)
             }
 
+    def _rag_entities_from_alert(self, alert: Dict[str, Any]) -> Dict[str, Any]:
+        """管理者ルール検索に使うアラートの拠点・工程（「全拠点」は拠点として扱わない）"""
+        location = alert.get("location_name")
+        return {
+            "location": location if location != "全拠点" else None,
+            "process_name": alert.get("process_name"),
+        }
+
     def _generate_message_from_alert(self, alert: Dict[str, Any]) -> str:
         """アラートから依頼文章を生成"""
         alert_type = alert.get("type")
@@ -206,16 +298,22 @@ class AlertService:
         current_value = alert.get("current_value")
 
         if alert_type == "correction_threshold":
-            return f"{location}の補正工程に{current_value}件の未処理があります（基準: {threshold}件）。人員を配置してください。"
+            # 補正残件は拠点別ではなく全拠点の合計
+            return f"全拠点の補正残件が{current_value}件あります（基準: {threshold}件）。補正工程に人員を配置してください。"
 
         elif alert_type == "ss_massive":
             return f"SS案件を{current_value}件受領しました（基準: {threshold}件）。納品1時間前までに人員集中が必要です。対応策を提案してください。"
 
         elif alert_type == "long_assignment":
-            return f"オペレータが1つの工程に{current_value}分配置されています（基準: {threshold}分以上で集中力低下）。配置転換を提案してください。"
+            operator = alert.get("operator_name") or alert.get("operator_id") or "オペレータ"
+            if location:
+                operator = f"{location}の{operator}"
+            process = alert.get("process_name") or "1つの"
+            return f"{operator}が{process}工程に{current_value}分配置されています（基準: {threshold}分以上で集中力低下）。配置転換を提案してください。"
 
         elif alert_type == "entry_balance":
-            return f"エントリ1・2の処理バランスが悪化しています（差: {current_value}、基準: {threshold}以上）。バランス調整を提案してください。"
+            business = f"{alert['business_name']}の" if alert.get("business_name") else ""
+            return f"{business}エントリ1・2の処理バランスが悪化しています（差: {current_value}、基準: {threshold}以上）。バランス調整を提案してください。"
 
         else:
             return alert.get("message", "アラートが発生しています。対応策を提案してください。")
@@ -0,0 +1,362 @@
+"""
+アラート履歴ストア
+発生したアラートをalertsテーブルに保存し、一覧（キーセットページネーション）・ID指定の取得・確認を提供する
+"""
+import asyncio
+import base64
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.logging import app_logger
+from app.db.indexes import INDEX_DEFINITIONS, create_index_sql
+
+
+# アラート履歴テーブル（アプリ起動時にAlertStore.ensure_table()、またはscripts/create_alert_store.pyで作成）
+# - open_key: 発生中はalert_key、解消後はNULL。UNIQUEのため複数ワーカーが同じアラートを保存しても1行にまとまる
+# - idx_alerts_filter: 一覧の絞り込み（status, priority, type, location_id）をすべて指定した場合のキーセット
+# - idx_alerts_{列}_created: 絞り込み1つ＋created_at順のキーセット（app.db.indexesの定義、既存テーブルにはapply_indexes.pyで追加）
+# - idx_alerts_created: 絞り込みなしの一覧
+ALERT_LIST_INDEXES = [index for index in INDEX_DEFINITIONS if index["table"] == "alerts"]
+
+ALERTS_TABLE_DDL = """
+CREATE TABLE IF NOT EXISTS `alerts` (
+    `id` BIGINT NOT NULL AUTO_INCREMENT,
+    `alert_key` VARCHAR(191) NOT NULL,
+    `open_key` VARCHAR(191) NULL,
+    `type` VARCHAR(32) NOT NULL,
+    `priority` VARCHAR(16) NOT NULL,
+    `status` VARCHAR(16) NOT NULL DEFAULT 'new',
+    `title` VARCHAR(255) NOT NULL,
+    `message` TEXT NOT NULL,
+    `location_id` INT NULL,
+    `location_name` VARCHAR(64) NULL,
+    `process_name` VARCHAR(64) NULL,
+    `operator_id` VARCHAR(32) NULL,
+    `operator_name` VARCHAR(64) NULL,
+    `threshold` DOUBLE NULL,
+    `current_value` DOUBLE NULL,
+    `rule_source` VARCHAR(255) NULL,
+    `detected_at` DATETIME(6) NULL,
+    `created_at` DATETIME(6) NOT NULL,
+    `updated_at` DATETIME(6) NOT NULL,
+    `acknowledged_at` DATETIME(6) NULL,
+    `resolved_at` DATETIME(6) NULL,
+    PRIMARY KEY (`id`),
+    UNIQUE KEY `uq_alerts_open_key` (`open_key`),
+    KEY `idx_alerts_filter` (`status`, `priority`, `type`, `location_id`, `created_at`),
+    KEY `idx_alerts_created` (`created_at`),
+    {list_indexes}
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+""".format(list_indexes=",\n    ".join(
+    f"KEY `{index['name']}` ({', '.join(f'`{column}`' for column in index['columns'])})"
+    for index in ALERT_LIST_INDEXES
+))
+
+# 一覧・詳細で返す列（レスポンスのAlertに合わせる）
+ALERT_COLUMNS = """
+    id, type, priority, status, title, message,
+    location_id, location_name, process_name,
+    operator_id AS employee_id, operator_name AS employee_name,
+    threshold, current_value,
+    created_at, updated_at, acknowledged_at, resolved_at
+"""
+
+# 一覧の絞り込み条件（idx_alerts_filterの列順）
+FILTER_COLUMNS = ("status", "priority", "type", "location_id")
+
+# 発生中として保存済みのアラート（起動直後に読み、以降はメモリ上で対応を保持する）
+OPEN_ALERTS_QUERY = text("""
+    SELECT id, alert_key, detected_at
+    FROM alerts
+    WHERE open_key IS NOT NULL
+""")
+
+OPEN_ALERT_ID_QUERY = text("SELECT id FROM alerts WHERE open_key = :alert_key")
+
+INSERT_ALERT = text("""
+    INSERT INTO alerts (
+        alert_key, open_key, type, priority, status, title, message,
+        location_id, location_name, process_name, operator_id, operator_name,
+        threshold, current_value, rule_source, detected_at, created_at, updated_at
+    ) VALUES (
+        :alert_key, :alert_key, :type, :priority, 'new', :title, :message,
+        :location_id, :location_name, :process_name, :operator_id, :operator_name,
+        :threshold, :current_value, :rule_source, :detected_at, :now, :now
+    )
+""")
+
+UPDATE_ALERT = text("""
+    UPDATE alerts
+    SET priority = :priority, title = :title, message = :message,
+        threshold = :threshold, current_value = :current_value, updated_at = :now
+    WHERE id = :id
+""")
+
+RESOLVE_ALERT = text("""
+    UPDATE alerts
+    SET status = 'resolved', open_key = NULL, resolved_at = :now, updated_at = :now
+    WHERE id = :id AND open_key IS NOT NULL
+""")
+
+ACKNOWLEDGE_ALERT = text("""
+    UPDATE alerts
+    SET status = 'acknowledged', acknowledged_at = :now, updated_at = :now
+    WHERE id = :id AND status = 'new'
+""")
+
+GET_ALERT_QUERY = text(f"SELECT {ALERT_COLUMNS} FROM alerts WHERE id = :id")
+
+EXISTING_ALERT_INDEXES_QUERY = text("""
+    SELECT DISTINCT index_name
+    FROM information_schema.statistics
+    WHERE table_schema = DATABASE() AND table_name = 'alerts'
+""")
+
+# テーブルが存在しない場合のMySQLのエラー番号（ER_NO_SUCH_TABLE）
+ER_NO_SUCH_TABLE = 1146
+
+
+def is_missing_table(error: BaseException) -> bool:
+    """alertsテーブルが作成されていないことによるエラーか"""
+    if not isinstance(error, DBAPIError):
+        return False
+    args = getattr(error.orig, "args", ())
+    return (bool(args) and args[0] == ER_NO_SUCH_TABLE) or "no such table" in str(error.orig)
+
+
+def _as_datetime(value: Any) -> Optional[datetime]:
+    """DBの時刻値・ISO形式の文字列をdatetimeに"""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def encode_cursor(created_at: Any, alert_id: int) -> str:
+    """一覧の続きを取得するためのカーソル（最後の行のcreated_atとid）"""
+    raw = f"{_as_datetime(created_at).isoformat()}|{alert_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    カーソルを(created_at, id)に戻す
+
+    Raises:
+        ValueError: 不正なカーソル
+    """
+    try:
+        created_at, alert_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(alert_id)
+    except Exception as e:
+        raise ValueError(f"不正なカーソルです: {cursor}") from e
+
+
+class AlertStore:
+    """
+    アラート履歴の保存と参照
+
+    - sync()は評価ごとの発生中アラートと保存済みの発生中アラートの差分だけを書き込む
+      （新規はINSERT、内容が変わったものはUPDATE、消えたものは解消済みにする）
+    - 発生中アラートのalert_key→IDの対応はメモリに保持し、起動直後の1回だけテーブルから読む
+    - 一覧は(created_at, id)の降順のキーセットページネーションで、何ページ目でも読む行数はlimit件
+    """
+
+    def __init__(self, session_factory=None):
+        """
+        Args:
+            session_factory: 書き込み用のセッションファクトリ（デフォルトはasync_session_factory）
+        """
+        self._session_factory = session_factory
+        # alert_key → (ID, 初回検知時刻, 保存済みの内容)
+        self._open: Optional[Dict[str, Tuple[int, Optional[datetime], Optional[tuple]]]] = None
+        self._lock = asyncio.Lock()
+
+    def _factory(self):
+        if self._session_factory is None:
+            from app.db.session import async_session_factory
+            self._session_factory = async_session_factory
+        return self._session_factory
+
+    async def ensure_table(self) -> bool:
+        """
+        alertsテーブルと一覧用のインデックスを作成（作成済みなら何もしない、アプリ起動時に呼ぶ）
+
+        Returns:
+            テーブルを利用できるか（MySQL以外・権限不足で作成できない場合はFalse）
+        """
+        try:
+            async with self._factory()() as db:
+                if db.bind.dialect.name != "mysql":
+                    app_logger.warning("アラート履歴テーブルの自動作成はMySQLのみ対応（scripts/create_alert_store.pyを参照）")
+                    return False
+                # MySQLのDDLは暗黙コミットされる
+                await db.execute(text(ALERTS_TABLE_DDL))
+                existing = {row[0] for row in await db.execute(EXISTING_ALERT_INDEXES_QUERY)}
+                for index in ALERT_LIST_INDEXES:
+                    if index["name"] not in existing:
+                        app_logger.info(f"アラート履歴のインデックス作成: {index['name']}")
+                        await db.execute(text(create_index_sql(index)))
+        except Exception as e:
+            app_logger.error(f"アラート履歴テーブルを作成できません: {e}")
+            return False
+        return True
+
+    async def sync(self, alerts: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        発生中のアラートを保存
+
+        Args:
+            alerts: アラート評価エンジンの発生中アラート
+
+        Returns:
+            alert_key → 保存先のアラートID
+        """
+        async with self._lock:
+            async with self._factory()() as db:
+                if self._open is None:
+                    loaded = {
+                        row.alert_key: (row.id, _as_datetime(row.detected_at), None)
+                        for row in await db.execute(OPEN_ALERTS_QUERY)
+                    }
+                else:
+                    loaded = self._open
+                stored = dict(loaded)
+                now = datetime.now()
+                active = {alert["alert_key"]: alert for alert in alerts}
+
+                for key in [key for key in stored if key not in active]:
+                    await db.execute(RESOLVE_ALERT, {"id": stored.pop(key)[0], "now": now})
+
+                for key, alert in active.items():
+                    detected_at = _as_datetime(alert.get("first_detected_at"))
+                    content = (alert["priority"], alert["title"], alert["message"], alert.get("current_value"))
+                    previous = stored.get(key)
+                    if previous is not None and previous[2] is not None and previous[1] != detected_at:
+                        # 基準を一度下回ってから再び超えたアラートは別の行にする
+                        # （起動前に保存された行は初回検知時刻が異なっても引き継ぐ）
+                        await db.execute(RESOLVE_ALERT, {"id": previous[0], "now": now})
+                        previous = None
+                    if previous is None:
+                        stored[key] = (await self._insert(db, alert, detected_at, now), detected_at, content)
+                    elif previous[2] != content:
+                        await db.execute(UPDATE_ALERT, {**self._params(alert), "id": previous[0], "now": now})
+                        stored[key] = (previous[0], detected_at, content)
+
+                await db.commit()
+            self._open = stored
+            return {key: value[0] for key, value in stored.items()}
+
+    async def _insert(
+        self,
+        db: AsyncSession,
+        alert: Dict[str, Any],
+        detected_at: Optional[datetime],
+        now: datetime
+    ) -> int:
+        """発生中のアラートを1行追加（他のワーカーが保存済みならその行のIDを返す）"""
+        try:
+            async with db.begin_nested():
+                result = await db.execute(
+                    INSERT_ALERT, {**self._params(alert), "alert_key": alert["alert_key"], "detected_at": detected_at, "now": now}
+                )
+            return result.lastrowid
+        except IntegrityError:
+            return (await db.execute(OPEN_ALERT_ID_QUERY, {"alert_key": alert["alert_key"]})).scalar_one()
+
+    @staticmethod
+    def _params(alert: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "type": alert["type"],
+            "priority": alert["priority"],
+            "title": alert["title"],
+            "message": alert["message"],
+            "location_id": alert.get("location_id"),
+            "location_name": alert.get("location_name"),
+            "process_name": alert.get("process_name"),
+            "operator_id": alert.get("operator_id"),
+            "operator_name": alert.get("operator_name"),
+            "threshold": alert.get("threshold"),
+            "current_value": alert.get("current_value"),
+            "rule_source": alert.get("rule_source"),
+        }
+
+    async def list_alerts(
+        self,
+        db: AsyncSession,
+        filters: Dict[str, Any],
+        limit: int,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        アラート一覧（新しい順）
+
+        Args:
+            db: データベースセッション
+            filters: status, priority, type, location_idの絞り込み（Noneの条件は使わない）
+            limit: 取得件数
+            cursor: 前のページのnext_cursor
+
+        Returns:
+            アラートのリストと次のページのカーソル（最後のページならNone）
+
+        Raises:
+            ValueError: 不正なカーソル
+        """
+        conditions, params = self._conditions(filters)
+        if cursor:
+            created_at, alert_id = decode_cursor(cursor)
+            conditions.append("(created_at, id) < (:cursor_created_at, :cursor_id)")
+            params.update({"cursor_created_at": created_at, "cursor_id": alert_id})
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        # 1件多く読んで次のページの有無を判定
+        query = text(f"SELECT {ALERT_COLUMNS} FROM alerts {where} ORDER BY created_at DESC, id DESC LIMIT :limit")
+        rows = [dict(row._mapping) for row in await db.execute(query, {**params, "limit": limit + 1})]
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+        return rows, next_cursor
+
+    async def count(self, db: AsyncSession, filters: Dict[str, Any]) -> int:
+        """絞り込み条件に該当する件数"""
+        conditions, params = self._conditions(filters)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return (await db.execute(text(f"SELECT COUNT(*) FROM alerts {where}"), params)).scalar() or 0
+
+    @staticmethod
+    def _conditions(filters: Dict[str, Any]) -> Tuple[List[str], Dict[str, Any]]:
+        conditions, params = [], {}
+        for column in FILTER_COLUMNS:
+            value = filters.get(column)
+            if value is not None:
+                conditions.append(f"{column} = :{column}")
+                params[column] = value
+        return conditions, params
+
+    async def get(self, db: AsyncSession, alert_id: int) -> Optional[Dict[str, Any]]:
+        """IDでアラートを取得（主キー検索）"""
+        row = (await db.execute(GET_ALERT_QUERY, {"id": alert_id})).first()
+        return dict(row._mapping) if row else None
+
+    async def acknowledge(self, db: AsyncSession, alert_id: int) -> Optional[Dict[str, Any]]:
+        """
+        アラートを確認済みにする（新規のアラートのみ状態を変える）
+
+        Returns:
+            更新後のアラート（存在しなければNone）
+        """
+        await db.execute(ACKNOWLEDGE_ALERT, {"id": alert_id, "now": datetime.now()})
+        await db.commit()
+        alert = await self.get(db, alert_id)
+        if alert is not None:
+            app_logger.info(f"アラート確認: ID {alert_id} ({alert['status']})")
+        return alert
+
+
+# アプリケーション全体で共有するストア（発生中アラートとIDの対応を保持する）
+alert_store = AlertStore()
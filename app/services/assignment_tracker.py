@@ -0,0 +1,187 @@
+"""
+配置時間トラッカー
+オペレータごとの現在の工程と配置開始時刻をメモリに保持し、「N分以上同じ工程に配置されている人」を範囲検索で返す
+"""
+import asyncio
+import bisect
+import itertools
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+
+
+# 前回反映以降のオペレータ単位のログイン記録（記録時刻ごとに、その時点でログイン中の全オペレータと担当工程）
+NEW_LOGIN_RECORDS_QUERY = text("""
+    SELECT
+        lr.record_time,
+        lr.operator_id,
+        o.operator_name,
+        o.location_id,
+        l.location_name,
+        lr.business_id,
+        lr.process_id,
+        p.process_name
+    FROM login_records lr
+    LEFT JOIN operators o ON o.operator_id = lr.operator_id
+    LEFT JOIN locations l ON l.location_id = o.location_id
+    LEFT JOIN processes p ON p.business_id = lr.business_id AND p.process_id = lr.process_id
+    WHERE lr.record_time > :since
+    ORDER BY lr.record_time
+""")
+
+# 最新のログイン記録の時刻
+LATEST_LOGIN_RECORD_TIME_QUERY = text("SELECT MAX(record_time) AS record_time FROM login_records")
+
+# 配置情報としてログイン記録から引き継ぐ列
+ASSIGNMENT_COLUMNS = (
+    "operator_id", "operator_name", "location_id", "location_name",
+    "business_id", "process_id", "process_name",
+)
+
+
+def _as_datetime(value: Any) -> Optional[datetime]:
+    """DBの時刻値をdatetimeに（DATETIME・文字列どちらの列にも対応）"""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+class AssignmentTracker:
+    """
+    オペレータの現在の配置（工程と開始時刻）
+
+    - ログイン記録を記録時刻ごとのスナップショットとして古い順に反映する。
+      同じ工程のままなら開始時刻を維持し、工程が変わったら記録時刻から数え直し、記録から消えたら（ログアウト）削除する
+    - 開始時刻は(開始時刻, オペレータID)の昇順リストでも保持するため、
+      「基準時刻のN分前以前に開始した配置」は二分探索で求まる先頭区間になる（全件走査しない）
+    - 初回は直近ASSIGNMENT_HISTORY_MINUTES分の記録を読んで開始時刻を復元する。
+      読み込んだ範囲の先頭から同じ工程にいるオペレータは、その時刻を開始時刻とみなす（実際より短く見積もる）
+    """
+
+    def __init__(self, history_minutes: Optional[int] = None):
+        """
+        Args:
+            history_minutes: 初回に読むログイン記録の範囲（分）
+        """
+        self.history_minutes = history_minutes or settings.ASSIGNMENT_HISTORY_MINUTES
+        self._assignments: Dict[Any, Dict[str, Any]] = {}
+        self._starts: List[Tuple[datetime, Any]] = []
+        self._last_record_time: Optional[datetime] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def last_record_time(self) -> Optional[datetime]:
+        """反映済みの最新の記録時刻"""
+        return self._last_record_time
+
+    def apply_snapshot(self, record_time: Any, rows: Iterable[Mapping[str, Any]]):
+        """
+        1時点のログイン記録を反映
+
+        Args:
+            record_time: 記録時刻（反映済みの最新時刻より新しいこと）
+            rows: その時刻にログイン中の全オペレータの記録
+        """
+        record_time = _as_datetime(record_time)
+        logged_in = set()
+        for row in rows:
+            operator_id = row["operator_id"]
+            logged_in.add(operator_id)
+            assignment = self._assignments.get(operator_id)
+            if assignment is not None \
+                    and (assignment["business_id"], assignment["process_id"]) == (row["business_id"], row["process_id"]):
+                continue
+            if assignment is not None:
+                self._remove_start(assignment)
+            assignment = {column: row.get(column) for column in ASSIGNMENT_COLUMNS}
+            assignment["started_at"] = record_time
+            self._assignments[operator_id] = assignment
+            bisect.insort(self._starts, (record_time, operator_id))
+
+        for operator_id in [operator_id for operator_id in self._assignments if operator_id not in logged_in]:
+            self._remove_start(self._assignments.pop(operator_id))
+        self._last_record_time = record_time
+
+    def _remove_start(self, assignment: Dict[str, Any]):
+        entry = (assignment["started_at"], assignment["operator_id"])
+        index = bisect.bisect_left(self._starts, entry)
+        if index < len(self._starts) and self._starts[index] == entry:
+            del self._starts[index]
+
+    def exceeding(
+        self,
+        minutes: float,
+        as_of: Optional[datetime] = None,
+        location_name: Optional[str] = None,
+        process_name: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        同じ工程にminutes分以上配置されているオペレータ
+
+        Args:
+            minutes: 配置時間の基準（分）
+            as_of: 基準時刻（デフォルトは反映済みの最新の記録時刻）
+            location_name: 拠点名で絞り込む
+            process_name: 工程名で絞り込む
+
+        Returns:
+            配置情報（started_at, elapsed_minutes付き）のリスト（配置時間の長い順）
+        """
+        as_of = _as_datetime(as_of) or self._last_record_time
+        if as_of is None:
+            return []
+        cutoff = as_of - timedelta(minutes=minutes)
+        end = bisect.bisect_right(self._starts, cutoff, key=itemgetter(0))
+
+        results = []
+        for started_at, operator_id in itertools.islice(self._starts, end):
+            assignment = self._assignments[operator_id]
+            if location_name and assignment["location_name"] != location_name:
+                continue
+            if process_name and assignment["process_name"] != process_name:
+                continue
+            results.append({
+                **assignment,
+                "started_at": started_at.isoformat(),
+                "elapsed_minutes": int((as_of - started_at).total_seconds() // 60),
+            })
+        return results
+
+    async def has_new_records(self, db: AsyncSession) -> bool:
+        """反映済みの時刻より新しいログイン記録があるか"""
+        record_time = _as_datetime((await db.execute(LATEST_LOGIN_RECORD_TIME_QUERY)).scalar())
+        return record_time is not None and record_time != self._last_record_time
+
+    async def refresh(self, db: AsyncSession) -> int:
+        """
+        前回反映以降のログイン記録を読んで配置を更新（同時呼び出しでも反映は1つずつ）
+
+        Returns:
+            読み込んだ行数（新しい記録がなければ0）
+        """
+        async with self._lock:
+            latest = _as_datetime((await db.execute(LATEST_LOGIN_RECORD_TIME_QUERY)).scalar())
+            if latest is None or latest == self._last_record_time:
+                return 0
+            since = self._last_record_time or latest - timedelta(minutes=self.history_minutes)
+
+            rows = [row._mapping for row in await db.execute(NEW_LOGIN_RECORDS_QUERY, {"since": since})]
+            for record_time, snapshot in itertools.groupby(rows, key=itemgetter("record_time")):
+                self.apply_snapshot(record_time, snapshot)
+            return len(rows)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "operators": len(self._assignments),
+            "last_record_time": self._last_record_time.isoformat() if self._last_record_time else None,
+            "history_minutes": self.history_minutes,
+        }
+
+
+# アプリケーション全体で共有するトラッカー（配置開始時刻をリクエスト間で保持する）
+assignment_tracker = AssignmentTracker()
@@ -0,0 +1,423 @@
+"""
+容量シミュレーションサービス
+progress_snapshotsと現在の配置人数から工程別の滞留消化をモンテカルロで予測
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.logging import app_logger
+
+
+# 完了判定の乱数を生成する期間の単位（分）。この単位ごとに全試行の完了を確認して打ち切る
+BLOCK_MINUTES = 60
+
+# login_records_by_locationの拠点列（DatabaseServiceで日本語名に変換済み）
+LOCATION_COLUMNS = ["札幌", "東京", "大阪", "沖縄", "佐世保"]
+
+
+def simulate_drain(
+    backlogs: Dict[str, int],
+    staffing: Dict[str, float],
+    rates: Dict[str, float],
+    runs: int,
+    horizon_minutes: int,
+    sigma: float,
+    seed: Optional[int] = None,
+    block_cells: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    工程別の滞留消化を1分刻みの離散イベントとしてモンテカルロ実行
+
+    各試行で工程ごとの生産性係数（対数正規）を引き、1分あたりの処理件数を
+    ポアソン分布で生成する。試行×時間の2次元配列をblock_cells以下のブロックに分けて計算し、
+    ブロック内の全試行が完了した時点で残りの期間は生成しない（メモリ使用量は期間・試行回数に比例しない）。
+    プロセスプールからも呼び出せるようモジュール関数として定義している。
+
+    Args:
+        backlogs: 工程名 → 滞留件数
+        staffing: 工程名 → 配置人数
+        rates: 工程名 → 1人あたり処理件数（件/分）
+        runs: 試行回数
+        horizon_minutes: シミュレーション期間（分）
+        sigma: 生産性係数のばらつき
+        seed: 乱数シード
+        block_cells: 1回に生成する乱数の上限（試行×分、デフォルトはSIMULATION_BLOCK_CELLS）
+
+    Returns:
+        工程別・全体の完了時間分布（分）。期間内に終わらない場合はNone
+    """
+    # 工程ごとに独立した乱数系列を使い、人数が変わった工程以外の結果を揃える
+    streams = np.random.SeedSequence(seed).spawn(len(backlogs))
+    block_cells = block_cells or settings.SIMULATION_BLOCK_CELLS
+    block_minutes = min(horizon_minutes, BLOCK_MINUTES)
+    chunk_runs = max(min(runs, block_cells // block_minutes), 1)
+    finish = {}
+    makespan = np.zeros(runs)
+
+    for (process, backlog), stream in zip(sorted(backlogs.items()), streams):
+        rng = np.random.default_rng(stream)
+        staff = max(float(staffing.get(process, 0)), 0.0)
+        rate = rates.get(process, CapacitySimulator.DEFAULT_RATE_PER_MINUTE)
+
+        if backlog <= 0:
+            minutes = np.zeros(runs)
+        elif staff <= 0:
+            minutes = np.full(runs, np.inf)
+        else:
+            multiplier = rng.lognormal(-sigma ** 2 / 2, sigma, size=(runs, 1))
+            lam = staff * rate * multiplier
+            # 試行のまとまりごとに独立した乱数系列を使い、打ち切り位置が変わっても他のまとまりの乱数は揃える
+            chunk_streams = stream.spawn((runs + chunk_runs - 1) // chunk_runs)
+            minutes = np.full(runs, np.inf)
+            for start, chunk_stream in zip(range(0, runs, chunk_runs), chunk_streams):
+                chunk = slice(start, start + chunk_runs)
+                minutes[chunk] = _drain_chunk(
+                    np.random.default_rng(chunk_stream), lam[chunk], backlog, horizon_minutes, block_minutes
+                )
+
+        finish[process] = _summarize(minutes, horizon_minutes)
+        finish[process].update({"backlog": int(backlog), "staff": staff})
+        makespan = np.maximum(makespan, minutes)
+
+    return {
+        "processes": finish,
+        "overall": _summarize(makespan, horizon_minutes),
+        "runs": runs
+    }
+
+
+def _drain_chunk(
+    rng: np.random.Generator,
+    lam: np.ndarray,
+    backlog: int,
+    horizon_minutes: int,
+    block_minutes: int
+) -> np.ndarray:
+    """試行のまとまり1つの完了時間（分）を期間の先頭からblock_minutesずつ計算し、全試行が完了したら打ち切る"""
+    processed_total = np.zeros(len(lam), dtype=np.int64)
+    minutes = np.full(len(lam), np.inf)
+    for offset in range(0, horizon_minutes, block_minutes):
+        width = min(block_minutes, horizon_minutes - offset)
+        cumulative = processed_total[:, None] + np.cumsum(rng.poisson(lam, size=(len(lam), width)), axis=1)
+        done = cumulative >= backlog
+        finished = np.isinf(minutes) & done[:, -1]
+        minutes[finished] = offset + done[finished].argmax(axis=1) + 1
+        processed_total = cumulative[:, -1]
+        if not np.isinf(minutes).any():
+            break
+    return minutes
+
+
+def _summarize(minutes: np.ndarray, horizon_minutes: int) -> Dict[str, Any]:
+    """完了時間の分布を集約（期間内に終わらない試行はinfとして扱う）"""
+    # infを含むため補間しない分位点を使用
+    p50 = float(np.quantile(minutes, 0.5, method="higher"))
+    p90 = float(np.quantile(minutes, 0.9, method="higher"))
+    return {
+        "p50_minutes": p50 if np.isfinite(p50) else None,
+        "p90_minutes": p90 if np.isfinite(p90) else None,
+        "on_time_probability": round(float(np.mean(minutes <= horizon_minutes)), 3)
+    }
+
+
+def _simulate_plan_worker(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """プロセスプール用のエントリポイント（pickle可能な引数のみ受け取る）"""
+    result = simulate_drain(
+        payload["backlogs"],
+        payload["staffing"],
+        payload["rates"],
+        payload["runs"],
+        payload["horizon_minutes"],
+        payload["sigma"],
+        payload["seed"],
+        payload.get("block_cells")
+    )
+    result["plan_id"] = payload["plan_id"]
+    return result
+
+
+class CapacitySimulator:
+    """配置変更のwhat-ifシミュレーションを行うサービス"""
+
+    # 工程別の1人あたり処理件数（件/分）
+    PROCESS_RATES_PER_MINUTE = {
+        "エントリ1": 1.5,
+        "エントリ2": 1.5,
+        "補正": 0.8,
+        "SV補正": 0.5,
+        "目検": 1.0,
+    }
+    DEFAULT_RATE_PER_MINUTE = 1.0
+
+    # 工程とprogress_snapshotsの滞留列の対応（エントリはダブルエントリのため両工程で同じ件数）
+    BACKLOG_COLUMNS = {
+        "エントリ1": "entry_count",
+        "エントリ2": "entry_count",
+        "補正": "correction_waiting",
+        "SV補正": "sv_correction_waiting",
+    }
+
+    # 生産性係数のばらつき（対数正規のσ）
+    PRODUCTIVITY_SIGMA = 0.2
+
+    _executor: Optional[ProcessPoolExecutor] = None
+
+    def __init__(
+        self,
+        runs: Optional[int] = None,
+        horizon_minutes: Optional[int] = None
+    ):
+        self.runs = runs or settings.SIMULATION_RUNS
+        self.horizon_minutes = horizon_minutes or settings.SIMULATION_HORIZON_MINUTES
+
+    @classmethod
+    def get_executor(cls) -> ProcessPoolExecutor:
+        """プロセスプールを遅延生成"""
+        if cls._executor is None:
+            cls._executor = ProcessPoolExecutor(max_workers=settings.SIMULATION_MAX_WORKERS)
+            app_logger.info(f"シミュレーション用プロセスプール起動: {settings.SIMULATION_MAX_WORKERS}ワーカー")
+        return cls._executor
+
+    @classmethod
+    def shutdown_executor(cls):
+        """プロセスプールを停止（アプリ終了時）"""
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+
+    def extract_backlogs(self, snapshots: List[Dict[str, Any]]) -> Dict[str, int]:
+        """最新スナップショットから工程別の滞留件数を取得"""
+        if not snapshots:
+            return {}
+
+        latest = snapshots[0]
+        backlogs = {}
+        for process, column in self.BACKLOG_COLUMNS.items():
+            value = latest.get(column)
+            if value is not None:
+                backlogs[process] = int(value)
+        return backlogs
+
+    def build_staffing(self, current_assignments: List[Dict[str, Any]]) -> Dict[str, float]:
+        """現在の配置状況（login_records_by_location）から工程別の人数を集計"""
+        staffing = {}
+        for row in current_assignments:
+            process = row.get("process_name")
+            if not process:
+                continue
+            count = sum(row.get(loc) or 0 for loc in LOCATION_COLUMNS)
+            staffing[process] = staffing.get(process, 0) + count
+        return staffing
+
+    def apply_plan(
+        self,
+        staffing: Dict[str, float],
+        changes: List[Dict[str, Any]]
+    ) -> Dict[str, float]:
+        """
+        配置変更を工程別人数に反映
+
+        工程別人数は全拠点の合計のため、同じ工程のまま拠点だけを移る移動（旧形式の拠点間移動、
+        SS内の同一工程の移動）は人数を変えない。SS内の別工程からの移動は移動元から減算して移動先に加算し、
+        非SSからの移動は滞留をモデル化していない業務からの応援とみなして移動先への加算のみ行う。
+        """
+        planned = dict(staffing)
+        for change in changes:
+            count = change.get("count", 0) or 0
+            to_process = change.get("to_process_name") or change.get("process")
+            if not to_process or count <= 0:
+                continue
+            if change.get("to_business_category") not in (None, "SS"):
+                continue
+
+            from_business = change.get("from_business_category")
+            from_process = change.get("from_process_name") or change.get("process")
+            if from_business in (None, "SS") and from_process == to_process:
+                # 工程別人数に既に含まれている
+                continue
+
+            planned[to_process] = planned.get(to_process, 0) + count
+            if from_business == "SS" and from_process in planned:
+                planned[from_process] = max(planned[from_process] - count, 0)
+        return planned
+
+    def _payload(
+        self,
+        plan_id: str,
+        backlogs: Dict[str, int],
+        staffing: Dict[str, float],
+        seed: Optional[int]
+    ) -> Dict[str, Any]:
+        return {
+            "plan_id": plan_id,
+            "backlogs": backlogs,
+            "staffing": staffing,
+            "rates": self.PROCESS_RATES_PER_MINUTE,
+            "runs": self.runs,
+            "horizon_minutes": self.horizon_minutes,
+            "sigma": self.PRODUCTIVITY_SIGMA,
+            "seed": seed,
+            "block_cells": settings.SIMULATION_BLOCK_CELLS
+        }
+
+    async def score_plan(
+        self,
+        changes: List[Dict[str, Any]],
+        db_data: Dict[str, Any],
+        seed: int = 0
+    ) -> Optional[Dict[str, Any]]:
+        """
+        提案生成用に単一の配置変更案を評価（基準と変更案をプロセスプールで並列実行）
+
+        Args:
+            changes: 配置変更のリスト
+            db_data: DatabaseServiceの取得結果（current_assignments, progress_snapshots）
+            seed: 乱数シード（基準と変更案で共通の乱数系列を使用）
+
+        Returns:
+            基準との比較結果。滞留データがない場合はNone
+        """
+        snapshots = db_data.get("progress_snapshots") or db_data.get("recent_alerts") or []
+        backlogs = self.extract_backlogs(snapshots)
+        if not backlogs:
+            return None
+
+        staffing = self.build_staffing(db_data.get("current_assignments", []))
+        planned = self.apply_plan(staffing, changes)
+
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+        baseline, result = await asyncio.gather(
+            loop.run_in_executor(executor, _simulate_plan_worker, self._payload("baseline", backlogs, staffing, seed)),
+            loop.run_in_executor(executor, _simulate_plan_worker, self._payload("plan", backlogs, planned, seed))
+        )
+        return self.compare(baseline, result, staffing, planned)
+
+    async def evaluate_plans(
+        self,
+        plans: List[Dict[str, Any]],
+        current_assignments: List[Dict[str, Any]],
+        snapshots: List[Dict[str, Any]],
+        seed: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        複数の配置変更案をプロセスプールで並列評価
+
+        Args:
+            plans: {"id", "changes"} のリスト
+            current_assignments: 現在の配置状況
+            snapshots: 進捗スナップショット（新しい順）
+            seed: 乱数シード
+
+        Returns:
+            基準シミュレーションと各案の比較結果
+        """
+        backlogs = self.extract_backlogs(snapshots)
+        staffing = self.build_staffing(current_assignments)
+        # 全案で共通の乱数系列を使い、案の差だけを比較する
+        if seed is None:
+            seed = int(np.random.SeedSequence().entropy % (2 ** 32))
+
+        payloads = [self._payload("baseline", backlogs, staffing, seed)]
+        planned_staffing = {}
+        for i, plan in enumerate(plans):
+            plan_id = plan.get("id") or f"plan_{i + 1}"
+            planned_staffing[plan_id] = self.apply_plan(staffing, plan.get("changes", []))
+            payloads.append(self._payload(plan_id, backlogs, planned_staffing[plan_id], seed))
+
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor()
+        outputs = await asyncio.gather(*[
+            loop.run_in_executor(executor, _simulate_plan_worker, payload)
+            for payload in payloads
+        ])
+
+        baseline = outputs[0]
+        results = [
+            self.compare(baseline, output, staffing, planned_staffing[output["plan_id"]])
+            for output in outputs[1:]
+        ]
+        # 全体完了見込み（p50）が早い順に並べる
+        results.sort(key=lambda r: r["overall"]["p50_minutes"] if r["overall"]["p50_minutes"] is not None else float("inf"))
+
+        snapshot_time = snapshots[0].get("snapshot_time") if snapshots else None
+        for summary in [baseline] + results:
+            summary["overall"]["expected_finish_time"] = self.finish_time(
+                snapshot_time, summary["overall"]["p50_minutes"]
+            )
+        app_logger.info(f"what-ifシミュレーション完了: {len(plans)}案 × {self.runs}試行")
+
+        return {
+            "snapshot_time": snapshot_time,
+            "backlogs": backlogs,
+            "baseline": {
+                "staffing": staffing,
+                "processes": baseline["processes"],
+                "overall": baseline["overall"]
+            },
+            "plans": results
+        }
+
+    def compare(
+        self,
+        baseline: Dict[str, Any],
+        result: Dict[str, Any],
+        staffing: Dict[str, float],
+        planned: Dict[str, float]
+    ) -> Dict[str, Any]:
+        """基準と変更案の完了時間・処理能力を比較"""
+        base_p50 = baseline["overall"]["p50_minutes"]
+        plan_p50 = result["overall"]["p50_minutes"]
+        delay_change = None
+        if base_p50 is not None and plan_p50 is not None:
+            delay_change = plan_p50 - base_p50
+
+        base_capacity = sum(
+            staffing.get(p, 0) * self.PROCESS_RATES_PER_MINUTE.get(p, self.DEFAULT_RATE_PER_MINUTE)
+            for p in baseline["processes"]
+        )
+        plan_capacity = sum(
+            planned.get(p, 0) * self.PROCESS_RATES_PER_MINUTE.get(p, self.DEFAULT_RATE_PER_MINUTE)
+            for p in result["processes"]
+        )
+        capacity_change = (plan_capacity - base_capacity) / base_capacity if base_capacity > 0 else None
+
+        return {
+            "plan_id": result["plan_id"],
+            "staffing": planned,
+            "processes": result["processes"],
+            "overall": result["overall"],
+            "delay_change_minutes": delay_change,
+            "capacity_change_ratio": round(capacity_change, 3) if capacity_change is not None else None
+        }
+
+    def format_impact(self, comparison: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """比較結果を提案のimpact形式（文字列）に変換"""
+        if comparison is None:
+            return {"productivity": "不明", "delay": "不明", "quality": "維持"}
+
+        capacity = comparison.get("capacity_change_ratio")
+        productivity = f"{capacity * 100:+.0f}%" if capacity is not None else "不明"
+
+        delay_change = comparison.get("delay_change_minutes")
+        if delay_change is not None:
+            delay = f"{delay_change:+.0f}分"
+        elif comparison["overall"]["p50_minutes"] is not None:
+            # 基準では期間内に終わらないが、変更案では終わる
+            delay = f"{comparison['overall']['p50_minutes']:.0f}分で完了見込み"
+        else:
+            delay = f"{self.horizon_minutes}分以内に完了見込みなし"
+
+        return {"productivity": productivity, "delay": delay, "quality": "維持"}
+
+    @staticmethod
+    def finish_time(snapshot_time: Optional[Any], minutes: Optional[float]) -> Optional[str]:
+        """スナップショット時刻に完了分数を加算した予測完了時刻"""
+        if minutes is None or not isinstance(snapshot_time, datetime):
+            return None
+        return (snapshot_time + timedelta(minutes=minutes)).isoformat()
@@ -0,0 +1,230 @@
+"""
+ChromaDB接続管理
+接続断をバックグラウンドで検知・再接続し、接続断中の検索は待たずにスキップさせる
+"""
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import httpx
+
+from app.core.config import settings
+from app.core.logging import app_logger
+
+
+CONNECTED = "connected"
+CONNECTING = "connecting"
+DISCONNECTED = "disconnected"
+
+# 初回接続の完了を待つ最大秒数（起動直後のリクエスト・スクリプトからの利用向け）
+FIRST_CONNECT_WAIT_SECONDS = 5.0
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """ChromaDBサーバーに到達できないことによるエラーか"""
+    if isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    # HttpClientの生成時はValueError（"Could not connect to a Chroma server..."等）で通知される
+    return isinstance(error, ValueError) and "connect" in str(error).lower()
+
+
+class ChromaConnectionManager:
+    """
+    ChromaServiceの接続状態を管理
+
+    - get_service()は接続中のみChromaServiceを返し、それ以外は待たずにNoneを返す（呼び出し側はRAGなしで続行）
+    - 接続断の間は監視スレッドが指数バックオフ（ジッター付き）で再接続を試みる
+    - 接続中もCHROMADB_HEALTH_CHECK_SECONDSごとにハートビートで死活を確認し、
+      検索中の接続エラーはreport_failure()で即座に接続断へ切り替える
+    """
+
+    def __init__(
+        self,
+        initial_backoff: Optional[float] = None,
+        max_backoff: Optional[float] = None,
+        health_check_seconds: Optional[float] = None
+    ):
+        """
+        Args:
+            initial_backoff: 最初の再接続待ち（秒、失敗ごとに倍増）
+            max_backoff: 再接続待ちの上限（秒）
+            health_check_seconds: 接続中のハートビート間隔（秒）
+        """
+        self.initial_backoff = initial_backoff or settings.CHROMADB_RECONNECT_INITIAL_SECONDS
+        self.max_backoff = max_backoff or settings.CHROMADB_RECONNECT_MAX_SECONDS
+        self.health_check_seconds = health_check_seconds or settings.CHROMADB_HEALTH_CHECK_SECONDS
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._first_attempt = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._state = DISCONNECTED
+        self._service = None
+        self._consecutive_failures = 0
+        self._reconnects = 0
+        self._last_error: Optional[str] = None
+        self._last_failure_at: Optional[datetime] = None
+        self._connected_at: Optional[datetime] = None
+        self._next_retry_at: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def start(self):
+        """監視スレッドを開始（起動済みなら何もしない。接続はスレッドで行うため呼び出し元は待たない）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="chroma-connection", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """監視スレッドを停止"""
+        self._stopping.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+
+    def get_service(self, wait: bool = True):
+        """
+        接続中のChromaService
+
+        Args:
+            wait: 初回接続の完了を最大FIRST_CONNECT_WAIT_SECONDS待つか
+                （スレッドを止めて待つため、イベントループ上ではFalseにするかaget_service()を使う）
+
+        Returns:
+            ChromaService（接続断・再接続中はNone）
+        """
+        self.start()
+        if wait and not self._first_attempt.is_set():
+            self._first_attempt.wait(FIRST_CONNECT_WAIT_SECONDS)
+        return self._service if self._state == CONNECTED else None
+
+    async def wait_first_attempt(self):
+        """初回接続の完了を最大FIRST_CONNECT_WAIT_SECONDS待つ（イベントループを止めずに別スレッドで待つ）"""
+        self.start()
+        if not self._first_attempt.is_set():
+            await asyncio.to_thread(self._first_attempt.wait, FIRST_CONNECT_WAIT_SECONDS)
+
+    async def aget_service(self):
+        """get_service()の非同期版（初回接続の待機でイベントループを止めない）"""
+        await self.wait_first_attempt()
+        return self.get_service(wait=False)
+
+    def report_failure(self, error: BaseException) -> bool:
+        """
+        検索中に発生したエラーを通知し、接続エラーなら接続断に切り替えて再接続を開始
+
+        Returns:
+            接続エラーとして扱ったか
+        """
+        if not is_connection_error(error):
+            return False
+        with self._lock:
+            if self._state != CONNECTED:
+                return True
+            self._mark_down(error)
+        app_logger.warning(f"ChromaDB接続断を検知、バックグラウンドで再接続します: {error}")
+        self._wakeup.set()
+        return True
+
+    def _mark_down(self, error: BaseException):
+        """接続断に切り替え（ロック内で呼び出す）"""
+        self._state = DISCONNECTED
+        self._service = None
+        self._consecutive_failures += 1
+        self._last_error = f"{type(error).__name__}: {error}"
+        self._last_failure_at = datetime.now()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            if self._state == CONNECTED:
+                self._wakeup.wait(self.health_check_seconds)
+                self._wakeup.clear()
+                if not self._stopping.is_set() and self._state == CONNECTED:
+                    self._heartbeat()
+                continue
+
+            if self._connect():
+                continue
+            self._first_attempt.set()
+            delay = self._backoff_delay()
+            self._next_retry_at = time.monotonic() + delay
+            app_logger.warning(
+                f"ChromaDB接続失敗（連続{self._consecutive_failures}回）、{delay:.1f}秒後に再試行: {self._last_error}"
+            )
+            self._stopping.wait(delay)
+
+    def _backoff_delay(self) -> float:
+        """失敗回数に応じた再接続待ち（同時に復旧した複数プロセスが一斉に接続しないよう±20%のジッター）"""
+        exponent = min(self._consecutive_failures - 1, 30)
+        delay = min(self.initial_backoff * (2 ** exponent), self.max_backoff)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _connect(self) -> bool:
+        """接続を作り直してハートビートで確認"""
+        from app.services.chroma_service import ChromaService
+
+        with self._lock:
+            self._state = CONNECTING
+        try:
+            ChromaService.reset_connection()
+            service = ChromaService()
+            service.client.heartbeat()
+        except Exception as e:
+            with self._lock:
+                self._mark_down(e)
+            return False
+
+        with self._lock:
+            recovered = self._consecutive_failures > 0
+            self._service = service
+            self._state = CONNECTED
+            self._connected_at = datetime.now()
+            self._consecutive_failures = 0
+            self._next_retry_at = None
+            if recovered:
+                self._reconnects += 1
+        self._first_attempt.set()
+        app_logger.info("ChromaDB再接続成功" if recovered else "ChromaDB接続成功")
+        return True
+
+    def _heartbeat(self):
+        service = self._service
+        try:
+            service.client.heartbeat()
+        except Exception as e:
+            with self._lock:
+                if self._service is service:
+                    self._mark_down(e)
+            app_logger.warning(f"ChromaDBハートビート失敗、再接続します: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        next_retry = None
+        if self._state != CONNECTED and self._next_retry_at is not None:
+            next_retry = round(max(self._next_retry_at - time.monotonic(), 0.0), 1)
+        return {
+            "state": self._state,
+            "server": f"{settings.CHROMADB_HOST}:{settings.CHROMADB_PORT}",
+            "monitoring": self._thread is not None and self._thread.is_alive(),
+            "connected_since": self._connected_at.isoformat() if self._state == CONNECTED and self._connected_at else None,
+            "consecutive_failures": self._consecutive_failures,
+            "reconnects": self._reconnects,
+            "last_error": self._last_error,
+            "last_failure_at": self._last_failure_at.isoformat() if self._last_failure_at else None,
+            "next_retry_in_seconds": next_retry,
+        }
+
+
+# アプリケーション全体で共有する接続管理
+chroma_connection = ChromaConnectionManager()
@@ -0,0 +1,614 @@
+"""
+ChromaDB投入パイプライン
+オペレータ・工程データを一括取得し、チャンク作成とupsertを並行実行する
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import app_logger
+from app.services.chroma_service import ChromaService, build_operator_chunks, build_process_chunks
+from app.services.semantic_chunker import SemanticChunker, build_manager_rule_chunks, chunk_documents_parallel
+
+
+OperatorGroup = Tuple[Dict[str, Any], List[Dict[str, Any]]]
+
+
+# 有効オペレータとその処理可能工程を1クエリで取得（オペレータ単位に連続して並ぶ）
+# 再開時は前回チェックポイントのオペレータIDより後から取得する
+OPERATOR_CAPABILITIES_QUERY = """
+    SELECT
+        o.operator_id,
+        o.operator_name,
+        o.location_id,
+        o.is_valid,
+        o.belong_code,
+        opc.business_id,
+        opc.process_id,
+        opc.work_level
+    FROM operators o
+    LEFT JOIN operator_process_capabilities opc ON opc.operator_id = o.operator_id
+    WHERE o.is_valid = 1
+    {resume_condition}
+    ORDER BY o.operator_id, opc.business_id, opc.process_id
+"""
+
+VALID_OPERATOR_IDS_QUERY = text("""
+    SELECT operator_id
+    FROM operators
+    WHERE is_valid = 1
+""")
+
+PROCESSES_QUERY = text("""
+    SELECT business_id, process_id, level_id, process_name,
+           process_name_detail, process_category
+    FROM processes
+""")
+
+OPERATOR_FIELDS = ("operator_id", "operator_name", "location_id", "is_valid", "belong_code")
+CAPABILITY_FIELDS = ("business_id", "process_id", "work_level")
+
+# パイプラインが管理するチャンク種別（差分同期で削除対象になり得るもの）
+OPERATOR_CHUNK_TYPES = ["operator_basic", "operator_capability"]
+PROCESS_CHUNK_TYPES = ["process_business", "process_detail"]
+MANAGER_RULE_CHUNK_TYPES = ["manager_rule"]
+
+
+def chunk_content_hash(chunk: Dict[str, Any]) -> str:
+    """ドキュメント本文とメタデータ（content_hash自体を除く）のハッシュ"""
+    metadata = {key: value for key, value in chunk["metadata"].items() if key != "content_hash"}
+    payload = json.dumps([chunk["document"], metadata], ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def with_content_hash(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """各チャンクのメタデータにcontent_hashを付与"""
+    for chunk in chunks:
+        chunk["metadata"]["content_hash"] = chunk_content_hash(chunk)
+    return chunks
+
+
+def _build_operator_chunks_worker(groups: List[OperatorGroup]) -> List[Dict[str, Any]]:
+    """ワーカープロセス: オペレータ群のチャンクを作成"""
+    chunks = []
+    for operator, capabilities in groups:
+        chunks.extend(build_operator_chunks(operator, capabilities))
+    return with_content_hash(chunks)
+
+
+class IngestionProgress:
+    """投入の進捗とスループットを集計"""
+
+    def __init__(self, interval_seconds: float = 5.0):
+        self.interval_seconds = interval_seconds
+        self.started = time.perf_counter()
+        self._last_report = self.started
+        self.operators = 0
+        self.chunks_built = 0
+        self.chunks_unchanged = 0
+        self.chunks_upserted = 0
+        self.chunks_deleted = 0
+        self.batches = 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self, force: bool = False):
+        """一定間隔で進捗をログ出力"""
+        now = time.perf_counter()
+        if not force and now - self._last_report < self.interval_seconds:
+            return
+        self._last_report = now
+        elapsed = max(now - self.started, 1e-9)
+        app_logger.info(
+            f"投入進捗: オペレータ {self.operators}名, チャンク作成 {self.chunks_built}件 "
+            f"(変更なし {self.chunks_unchanged}件), upsert {self.chunks_upserted}件, "
+            f"削除 {self.chunks_deleted}件 ({self.batches}バッチ), "
+            f"{self.chunks_built / elapsed:.1f}件/秒, 経過 {elapsed:.1f}秒"
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = self.elapsed
+        return {
+            "operators": self.operators,
+            "chunks_built": self.chunks_built,
+            "chunks_unchanged": self.chunks_unchanged,
+            "chunks_upserted": self.chunks_upserted,
+            "chunks_deleted": self.chunks_deleted,
+            "batches": self.batches,
+            "elapsed_seconds": round(elapsed, 3),
+            "chunks_per_second": round(self.chunks_built / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+class SyncCheckpoint:
+    """
+    中断した同期を再開するためのチェックポイント（JSONファイル）
+
+    オペレータはoperator_id順に処理するため、upsertが完了した最後のオペレータIDを保存する。
+    """
+
+    def __init__(self, path: str, collection_name: str):
+        self.path = Path(path)
+        self.collection_name = collection_name
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """同じコレクションのチェックポイントがあれば返す"""
+        if not self.path.exists():
+            return None
+        try:
+            checkpoint = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            app_logger.warning(f"チェックポイントを読み込めません（最初から同期します）: {e}")
+            return None
+        if checkpoint.get("collection") != self.collection_name:
+            return None
+        return checkpoint
+
+    def save(self, last_operator_id: str, delta: bool):
+        """最後に完了したオペレータIDを保存（一時ファイル経由で置き換え）"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        temp_path.write_text(json.dumps({
+            "collection": self.collection_name,
+            "last_operator_id": last_operator_id,
+            "delta": delta,
+            "updated_at": datetime.now().isoformat(),
+        }, ensure_ascii=False), encoding="utf-8")
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        """同期完了時にチェックポイントを削除"""
+        if self.path.exists():
+            self.path.unlink()
+
+
+class ChromaIngestionPipeline:
+    """
+    MySQL → チャンク作成 → ChromaDB upsert のパイプライン
+
+    - オペレータと処理可能工程はサーバーサイドカーソルの1クエリで取得（N+1クエリを解消）
+    - チャンク作成はプロセスプールで並列実行
+    - upsertはバッチ単位で並行実行し、同時実行数をmax_in_flightで制限する
+      （上限に達すると取得・チャンク作成側が待機する）
+    - 差分同期（delta=True）では内容ハッシュが変わったチャンクのみupsertし、
+      無効になったオペレータや消えた業務・工程のチャンクを削除する
+    - 一定間隔でチェックポイントを保存し、中断された同期は続きから再開する
+    - 字句インデックス（ハイブリッド検索用）はupsert/deleteと同時に差分更新し、
+      チェックポイント・完了時に保存する
+    - チェックポイント・完了時に変更があればデータバージョンを更新し、
+      APIプロセスの検索結果キャッシュを無効化する
+    - 管理者ルール文書（ingest_manager_rules）はセマンティックチャンキングで分割してから投入する
+    """
+
+    def __init__(
+        self,
+        chroma_service: ChromaService,
+        batch_size: Optional[int] = None,
+        max_in_flight: Optional[int] = None,
+        workers: Optional[int] = None,
+        operators_per_task: Optional[int] = None,
+        progress_interval: float = 5.0,
+        checkpoint_path: Optional[str] = None,
+        checkpoint_interval: Optional[int] = None
+    ):
+        """
+        Args:
+            chroma_service: 投入先のChromaService
+            batch_size: 1回のupsert件数
+            max_in_flight: 同時実行するupsert数
+            workers: チャンク作成のプロセス数（0の場合はイベントループ内で作成）
+            operators_per_task: ワーカー1タスクあたりのオペレータ数
+            progress_interval: 進捗ログの出力間隔（秒）
+            checkpoint_path: チェックポイントファイルのパス
+            checkpoint_interval: チェックポイントを保存するワーカータスク間隔
+        """
+        self.chroma_service = chroma_service
+        self.batch_size = batch_size or settings.CHROMA_INGEST_BATCH_SIZE
+        self.max_in_flight = max_in_flight or settings.CHROMA_INGEST_MAX_IN_FLIGHT
+        self.workers = settings.CHROMA_INGEST_WORKERS if workers is None else workers
+        self.operators_per_task = operators_per_task or settings.CHROMA_INGEST_OPERATORS_PER_TASK
+        self.progress_interval = progress_interval
+        self.checkpoint = SyncCheckpoint(
+            checkpoint_path or settings.CHROMA_SYNC_CHECKPOINT_PATH,
+            chroma_service.collection_name
+        )
+        self.checkpoint_interval = checkpoint_interval or settings.CHROMA_SYNC_CHECKPOINT_INTERVAL
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._delete_buffer: List[str] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._writes: Set[asyncio.Task] = set()
+        self._error: Optional[BaseException] = None
+        # 差分同期時の既存チャンク {operator_id: {chunk_id: content_hash}} / {chunk_id: content_hash}
+        self._existing_operators: Optional[Dict[str, Dict[str, str]]] = None
+        self._existing_processes: Optional[Dict[str, str]] = None
+        self._lexical_index = None
+        self._published_writes = 0
+        self.progress = IngestionProgress(progress_interval)
+
+    async def run(self, session: AsyncSession, delta: bool = False, restart: bool = False) -> Dict[str, Any]:
+        """
+        全オペレータ・工程のチャンクを作成してupsert
+
+        Args:
+            session: データベースセッション
+            delta: 内容が変わったチャンクのみupsertし、不要になったチャンクを削除する
+            restart: チェックポイントを無視して最初から同期する
+
+        Returns:
+            投入結果の統計情報
+        """
+        await self._begin()
+
+        checkpoint = None if restart else self.checkpoint.load()
+        if checkpoint and checkpoint.get("delta") != delta:
+            # 全件投入と差分同期は処理内容が異なるため、別モードのチェックポイントからは再開しない
+            checkpoint = None
+        resume_after = checkpoint.get("last_operator_id") if checkpoint else None
+        if resume_after:
+            app_logger.info(f"チェックポイントから再開: オペレータID {resume_after} 以降")
+
+        app_logger.info(
+            f"ChromaDB{'差分同期' if delta else '投入'}開始: バッチ {self.batch_size}件, "
+            f"同時upsert {self.max_in_flight}, ワーカー {self.workers}プロセス"
+        )
+
+        if delta:
+            self._existing_operators, self._existing_processes = await asyncio.to_thread(self._load_existing_chunks)
+        else:
+            self._existing_operators = self._existing_processes = None
+
+        executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 0 else None
+        try:
+            operator_chunks = await self._ingest_operators(session, executor, resume_after, delta)
+            process_chunks = await self._ingest_processes(session)
+            if delta:
+                await self._delete_invalid_operators(session)
+            await self._flush(drain=True)
+        finally:
+            if self._writes:
+                await asyncio.gather(*self._writes, return_exceptions=True)
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+
+        # 全件完了したのでチェックポイントは不要
+        self._publish_changes()
+        self.checkpoint.clear()
+
+        self.progress.report(force=True)
+        stats = self.progress.to_dict()
+        stats.update({
+            "operator_chunks": operator_chunks,
+            "process_chunks": process_chunks,
+            "delta": delta,
+            "resumed_after": resume_after,
+        })
+        app_logger.info(
+            f"✅ ChromaDB{'差分同期' if delta else '投入'}完了: upsert {stats['chunks_upserted']}件, "
+            f"削除 {stats['chunks_deleted']}件, 変更なし {stats['chunks_unchanged']}件 "
+            f"({stats['elapsed_seconds']}秒, {stats['chunks_per_second']}件/秒)"
+        )
+        return stats
+
+    async def ingest_manager_rules(self, rules: List[Dict[str, Any]], delta: bool = False) -> Dict[str, Any]:
+        """
+        管理者ルール文書をセマンティックチャンキングで分割してupsert
+
+        文の埋め込みには管理者ルールを格納するコレクションの埋め込み関数を使う
+        （検索時のクエリ埋め込みと同じ空間で切れ目を判定する）
+
+        Args:
+            rules: 管理者ルール（rule_id, category, title, content）のリスト
+            delta: 内容が変わったチャンクのみupsertし、不要になったチャンクを削除する
+
+        Returns:
+            投入結果の統計情報（分割の所要時間・文書/秒を含む）
+        """
+        await self._begin()
+        embedding_function = self.chroma_service.embedding_function(MANAGER_RULE_CHUNK_TYPES)
+        if embedding_function is None:
+            raise ValueError("埋め込み関数のないコレクションにはセマンティックチャンキングで投入できません")
+
+        started = time.perf_counter()
+        texts = await asyncio.to_thread(
+            chunk_documents_parallel,
+            SemanticChunker(embedding_function),
+            [str(rule.get("content") or "") for rule in rules]
+        )
+        chunking_seconds = time.perf_counter() - started
+        chunks = with_content_hash([
+            chunk
+            for rule, rule_texts in zip(rules, texts)
+            for chunk in build_manager_rule_chunks(rule, rule_texts)
+        ])
+        self.progress.chunks_built += len(chunks)
+        app_logger.info(
+            f"管理者ルール分割完了: {len(rules)}件 → {len(chunks)}チャンク "
+            f"({chunking_seconds:.2f}秒, {len(rules) / max(chunking_seconds, 1e-9):.1f}件/秒)"
+        )
+
+        if delta:
+            existing = await asyncio.to_thread(self._load_existing_rule_chunks)
+            changed = [chunk for chunk in chunks if existing.get(chunk["id"]) != chunk["metadata"]["content_hash"]]
+            self.progress.chunks_unchanged += len(chunks) - len(changed)
+            produced = {chunk["id"] for chunk in chunks}
+            await self._submit(changed, [chunk_id for chunk_id in existing if chunk_id not in produced])
+        else:
+            await self._submit(chunks)
+        await self._flush(drain=True)
+        self._publish_changes()
+
+        self.progress.report(force=True)
+        stats = self.progress.to_dict()
+        stats.update({
+            "manager_rules": len(rules),
+            "manager_rule_chunks": len(chunks),
+            "chunking_seconds": round(chunking_seconds, 3),
+            "rules_per_second": round(len(rules) / chunking_seconds, 1) if chunking_seconds else 0.0,
+            "delta": delta,
+        })
+        return stats
+
+    async def _begin(self):
+        """1回の投入の状態を初期化し、字句インデックスを読み込む（以降のupsert/deleteで差分更新させる）"""
+        self.progress = IngestionProgress(self.progress_interval)
+        self._buffer = []
+        self._delete_buffer = []
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._writes = set()
+        self._error = None
+        self._published_writes = 0
+        self._lexical_index = await asyncio.to_thread(self.chroma_service.lexical_index)
+
+    def _load_existing_rule_chunks(self, page_size: int = 5000) -> Dict[str, str]:
+        """セマンティックチャンキングで投入した管理者ルールチャンクのIDと内容ハッシュ（手動投入のルールは対象外）"""
+        existing: Dict[str, str] = {}
+        offset = 0
+        while True:
+            page = self.chroma_service.get_metadata_page(doc_types=MANAGER_RULE_CHUNK_TYPES, limit=page_size, offset=offset)
+            for chunk_id, metadata in zip(page["ids"], page["metadatas"]):
+                if metadata.get("chunk_method") == "semantic":
+                    existing[chunk_id] = metadata.get("content_hash", "")
+            if len(page["ids"]) < page_size:
+                break
+            offset += page_size
+        return existing
+
+    def _load_existing_chunks(self, page_size: int = 5000) -> Tuple[Dict[str, Dict[str, str]], Dict[str, str]]:
+        """管理対象チャンクのIDと内容ハッシュをChromaDBから取得"""
+        operators: Dict[str, Dict[str, str]] = {}
+        processes: Dict[str, str] = {}
+        # パーティション分割時は種別ごとに別コレクションのため、オペレータ・工程を別々にページング
+        for doc_types in (OPERATOR_CHUNK_TYPES, PROCESS_CHUNK_TYPES):
+            offset = 0
+            while True:
+                page = self.chroma_service.get_metadata_page(doc_types=doc_types, limit=page_size, offset=offset)
+                ids = page["ids"]
+                for chunk_id, metadata in zip(ids, page["metadatas"]):
+                    # content_hashのない旧形式のチャンクは空文字として扱い、必ず更新される
+                    content_hash = metadata.get("content_hash", "")
+                    if doc_types is OPERATOR_CHUNK_TYPES:
+                        operators.setdefault(metadata.get("operator_id"), {})[chunk_id] = content_hash
+                    else:
+                        processes[chunk_id] = content_hash
+                if len(ids) < page_size:
+                    break
+                offset += page_size
+
+        app_logger.info(
+            f"既存チャンク: オペレータ {sum(len(c) for c in operators.values())}件 ({len(operators)}名), "
+            f"工程 {len(processes)}件"
+        )
+        return operators, processes
+
+    async def _stream_operator_groups(
+        self,
+        session: AsyncSession,
+        resume_after: Optional[str]
+    ) -> AsyncIterator[List[OperatorGroup]]:
+        """オペレータ単位にまとめた行をoperators_per_task件ずつ返す"""
+        query = text(OPERATOR_CAPABILITIES_QUERY.format(
+            resume_condition="AND o.operator_id > :resume_after" if resume_after else ""
+        ))
+        params = {"resume_after": resume_after} if resume_after else {}
+        result = await session.stream(query, params)
+        groups: List[OperatorGroup] = []
+        current_id = None
+        capabilities: List[Dict[str, Any]] = []
+
+        async for partition in result.mappings().partitions(settings.DATABASE_STREAM_PARTITION_SIZE):
+            for row in partition:
+                if row["operator_id"] != current_id:
+                    if len(groups) >= self.operators_per_task:
+                        yield groups
+                        groups = []
+                    current_id = row["operator_id"]
+                    capabilities = []
+                    groups.append(({field: row[field] for field in OPERATOR_FIELDS}, capabilities))
+                # LEFT JOINのため処理可能工程がないオペレータはbusiness_idがNULL
+                if row["business_id"] is not None:
+                    capabilities.append({field: row[field] for field in CAPABILITY_FIELDS})
+
+        if groups:
+            yield groups
+
+    async def _ingest_operators(
+        self,
+        session: AsyncSession,
+        executor: Optional[ProcessPoolExecutor],
+        resume_after: Optional[str],
+        delta: bool
+    ) -> int:
+        """オペレータチャンクを作成しながら順次upsertに回す"""
+        loop = asyncio.get_running_loop()
+        # 作成待ちのタスクはワーカー数の2倍まで（メモリ使用量を抑える）
+        max_pending = max(self.workers * 2, 1)
+        pending: deque = deque()
+        total = 0
+        tasks_since_checkpoint = 0
+
+        async def submit(operator_ids: List[str], chunks: List[Dict[str, Any]]):
+            nonlocal total, tasks_since_checkpoint
+            total += len(chunks)
+            self.progress.chunks_built += len(chunks)
+            await self._submit_operator_chunks(operator_ids, chunks)
+
+            tasks_since_checkpoint += 1
+            if tasks_since_checkpoint >= self.checkpoint_interval:
+                # 書き込み中のバッチを全て完了させてから、完了済みの最後のオペレータIDを保存
+                await self._flush(drain=True)
+                self._publish_changes()
+                self.checkpoint.save(operator_ids[-1], delta)
+                tasks_since_checkpoint = 0
+
+        async for groups in self._stream_operator_groups(session, resume_after):
+            self.progress.operators += len(groups)
+            operator_ids = [operator["operator_id"] for operator, _ in groups]
+            if executor is None:
+                await submit(operator_ids, _build_operator_chunks_worker(groups))
+                continue
+            pending.append((operator_ids, loop.run_in_executor(executor, _build_operator_chunks_worker, groups)))
+            while len(pending) >= max_pending:
+                operator_ids, future = pending.popleft()
+                await submit(operator_ids, await future)
+
+        while pending:
+            operator_ids, future = pending.popleft()
+            await submit(operator_ids, await future)
+
+        app_logger.info(f"オペレータチャンク作成完了: {self.progress.operators}名, {total}件")
+        return total
+
+    async def _submit_operator_chunks(self, operator_ids: List[str], chunks: List[Dict[str, Any]]):
+        """オペレータ群のチャンクを既存と比較し、変更分のupsertと不要分の削除を登録"""
+        if self._existing_operators is None:
+            await self._submit(chunks)
+            return
+
+        changed = []
+        for chunk in chunks:
+            existing = self._existing_operators.get(chunk["metadata"]["operator_id"], {})
+            if existing.get(chunk["id"]) == chunk["metadata"]["content_hash"]:
+                self.progress.chunks_unchanged += 1
+            else:
+                changed.append(chunk)
+
+        # 処理可能業務が減った場合など、今回作成されなかった既存チャンクは削除
+        produced = {chunk["id"] for chunk in chunks}
+        stale = []
+        for operator_id in operator_ids:
+            existing = self._existing_operators.pop(operator_id, None)
+            if existing:
+                stale.extend(chunk_id for chunk_id in existing if chunk_id not in produced)
+
+        await self._submit(changed, stale)
+
+    async def _ingest_processes(self, session: AsyncSession) -> int:
+        """工程チャンクを作成してupsertに回す（件数が少ないためイベントループ内で作成）"""
+        result = await session.execute(PROCESSES_QUERY)
+        processes = [dict(row._mapping) for row in result]
+        chunks = with_content_hash(build_process_chunks(processes))
+        self.progress.chunks_built += len(chunks)
+
+        if self._existing_processes is None:
+            await self._submit(chunks)
+        else:
+            changed = [
+                chunk for chunk in chunks
+                if self._existing_processes.get(chunk["id"]) != chunk["metadata"]["content_hash"]
+            ]
+            self.progress.chunks_unchanged += len(chunks) - len(changed)
+            produced = {chunk["id"] for chunk in chunks}
+            await self._submit(changed, [chunk_id for chunk_id in self._existing_processes if chunk_id not in produced])
+
+        app_logger.info(f"工程チャンク作成完了: {len(processes)}工程, {len(chunks)}件")
+        return len(chunks)
+
+    async def _delete_invalid_operators(self, session: AsyncSession):
+        """今回処理されなかったオペレータのうち、有効でなくなったもののチャンクを削除"""
+        # 再開時はチェックポイント以前のオペレータも未処理として残るため、有効なIDは削除対象から除く
+        result = await session.execute(VALID_OPERATOR_IDS_QUERY)
+        valid_ids = {row[0] for row in result}
+        stale = [
+            chunk_id
+            for operator_id, chunk_ids in self._existing_operators.items()
+            if operator_id not in valid_ids
+            for chunk_id in chunk_ids
+        ]
+        if stale:
+            app_logger.info(f"無効オペレータのチャンクを削除: {len(stale)}件")
+        await self._submit([], stale)
+
+    async def _submit(self, chunks: List[Dict[str, Any]], delete_ids: Iterable[str] = ()):
+        """チャンク・削除IDをバッファに追加し、バッチサイズに達した分を書き込む"""
+        self._buffer.extend(chunks)
+        self._delete_buffer.extend(delete_ids)
+        await self._flush()
+
+    async def _flush(self, drain: bool = False):
+        """
+        バッファをバッチ単位で書き込みタスクに渡す
+
+        Args:
+            drain: 端数も含めて全て書き込み、実行中の書き込みの完了を待つ
+        """
+        for kind, buffer in (("upsert", self._buffer), ("delete", self._delete_buffer)):
+            while len(buffer) >= self.batch_size or (drain and buffer):
+                self._raise_if_failed()
+                batch = buffer[:self.batch_size]
+                del buffer[:self.batch_size]
+
+                # 同時実行数の上限に達している場合は空きが出るまで待機（バックプレッシャー）
+                await self._slots.acquire()
+                task = asyncio.create_task(self._write(kind, batch))
+                self._writes.add(task)
+                task.add_done_callback(self._writes.discard)
+
+        if drain:
+            if self._writes:
+                await asyncio.gather(*self._writes, return_exceptions=True)
+            self._raise_if_failed()
+
+    async def _write(self, kind: str, batch: List[Any]):
+        """1バッチを書き込み（HTTPクライアント・埋め込み計算はブロッキングのためスレッドで実行）"""
+        try:
+            if kind == "upsert":
+                await asyncio.to_thread(self.chroma_service.upsert_batch, batch)
+                self.progress.chunks_upserted += len(batch)
+            else:
+                await asyncio.to_thread(self.chroma_service.delete_batch, batch)
+                self.progress.chunks_deleted += len(batch)
+            self.progress.batches += 1
+            self.progress.report()
+        except Exception as e:
+            app_logger.error(f"ChromaDB {kind}エラー ({len(batch)}件): {e}")
+            if self._error is None:
+                self._error = e
+        finally:
+            self._slots.release()
+
+    def _publish_changes(self):
+        """書き込み済みのチャンクまで字句インデックスを保存し、変更があればデータバージョンを更新"""
+        if self._lexical_index is not None:
+            self._lexical_index.save()
+        writes = self.progress.chunks_upserted + self.progress.chunks_deleted
+        if writes > self._published_writes:
+            self.chroma_service.bump_data_version()
+            self._published_writes = writes
+
+    def _raise_if_failed(self):
+        if self._error is not None:
+            raise self._error
@@ -4,11 +4,216 @@ ChromaDB RAGサービス
 """
 import chromadb
 from typing import List, Dict, Any, Optional
+import copy
+import json
 import os
+import threading
+import time
 from datetime import datetime
 
 from app.core.logging import app_logger
 from app.core.config import settings
+from app.services.chroma_connection import chroma_connection
+from app.services.lexical_index import LexicalIndex, reciprocal_rank_fusion
+from app.services.local_vector_index import LocalVectorIndex
+from app.services.operator_capability_index import operator_capability_index
+from app.services.rag_cache import TTLCache, normalize_query
+from app.services.rag_reranker import RuleReranker
+
+
+# ドキュメント種別（metadata.type）ごとのコレクション（パーティション）
+# typeを持たないドキュメント（管理者ルール等）はDEFAULT_PARTITIONに格納する
+COLLECTION_PARTITIONS: Dict[str, List[str]] = {
+    "operators": ["operator_basic", "operator_capability"],
+    "processes": ["process_business", "process_detail"],
+    "manager_rules": ["manager_rule"],
+}
+DEFAULT_PARTITION = "manager_rules"
+
+_PARTITION_BY_TYPE = {
+    doc_type: partition
+    for partition, doc_types in COLLECTION_PARTITIONS.items()
+    for doc_type in doc_types
+}
+
+# 管理者ルール以外のチャンク種別（単一コレクション運用時の除外フィルタに使用）
+NON_RULE_TYPES = COLLECTION_PARTITIONS["operators"] + COLLECTION_PARTITIONS["processes"]
+
+RESULT_FIELDS = ("documents", "metadatas", "distances", "ids")
+
+
+def split_query_results(results: Dict[str, Any]) -> List[Dict[str, List[Any]]]:
+    """ChromaDBのquery()結果（クエリごとの二重リスト）をクエリごとの結果に分割"""
+    return [{key: results[key][i] for key in RESULT_FIELDS} for i in range(len(results["ids"]))]
+
+
+def partition_for_type(doc_type: Optional[str]) -> str:
+    """ドキュメント種別の格納先パーティション"""
+    return _PARTITION_BY_TYPE.get(doc_type, DEFAULT_PARTITION)
+
+
+def partition_collection_name(base_name: str, partition: str) -> str:
+    """パーティションのコレクション名（例: aimee_knowledge_operators）"""
+    return f"{base_name}_{partition}"
+
+
+def merge_where(*filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """メタデータフィルタを$andで結合（Noneは無視）"""
+    conditions = []
+    for where in filters:
+        if not where:
+            continue
+        conditions.extend(where["$and"] if list(where) == ["$and"] else [where])
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def build_operator_chunks(operator: Dict[str, Any], capabilities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    オペレータ情報をセマンティックチャンクに分割
+
+    ChromaServiceに依存しない関数（投入パイプラインのワーカープロセスから呼び出す）
+
+    Args:
+        operator: オペレータ基本情報
+        capabilities: オペレータの処理可能工程リスト
+
+    Returns:
+        チャンクのリスト（各チャンクはdocument, metadata, idを含む）
+    """
+    chunks = []
+    operator_id = operator.get("operator_id")
+    operator_name = operator.get("operator_name", "不明")
+    location_id = operator.get("location_id", "不明")
+
+    # チャンク1: オペレータ基本情報
+    basic_doc = f"""オペレータID: {operator_id}
+名前: {operator_name}
+所属拠点: {location_id}
+有効: {"はい" if operator.get("is_valid") else "いいえ"}
+所属コード: {operator.get("belong_code", "なし")}"""
+
+    chunks.append({
+        "id": f"operator_basic_{operator_id}",
+        "document": basic_doc,
+        "metadata": {
+            "type": "operator_basic",
+            "operator_id": operator_id,
+            "operator_name": operator_name,
+            "location_id": location_id
+        }
+    })
+
+    # チャンク2〜N: 業務別の処理可能工程
+    # 業務ごとにグループ化
+    business_groups = {}
+    for cap in capabilities:
+        business_id = cap.get("business_id")
+        if business_id not in business_groups:
+            business_groups[business_id] = []
+        business_groups[business_id].append(cap)
+
+    for business_id, caps in business_groups.items():
+        process_list = []
+        for cap in caps:
+            process_id = cap.get("process_id")
+            work_level = cap.get("work_level", 0)
+            process_list.append(f"工程{process_id}(レベル{work_level})")
+
+        capability_doc = f"""オペレータ {operator_name} ({operator_id}) の処理能力:
+業務ID: {business_id}
+処理可能工程: {", ".join(process_list)}
+拠点: {location_id}"""
+
+        chunks.append({
+            "id": f"operator_capability_{operator_id}_{business_id}",
+            "document": capability_doc,
+            "metadata": {
+                "type": "operator_capability",
+                "operator_id": operator_id,
+                "operator_name": operator_name,
+                "business_id": business_id,
+                "location_id": location_id,
+                "process_count": len(caps)
+            }
+        })
+
+    return chunks
+
+def build_process_chunks(processes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    工程情報をセマンティックチャンクに分割
+
+    Args:
+        processes: 工程情報のリスト
+
+    Returns:
+        チャンクのリスト
+    """
+    chunks = []
+
+    # 業務ごとにグループ化
+    business_groups = {}
+    for process in processes:
+        business_id = process.get("business_id")
+        if business_id not in business_groups:
+            business_groups[business_id] = []
+        business_groups[business_id].append(process)
+
+    for business_id, procs in business_groups.items():
+        # 業務全体のチャンク
+        process_list = []
+        for proc in procs:
+            process_id = proc.get("process_id")
+            process_name = proc.get("process_name", "")
+            category = proc.get("process_category", "")
+            process_list.append(f"{process_name}({process_id}, {category})")
+
+        business_doc = f"""業務ID {business_id} の工程一覧:
+工程数: {len(procs)}
+工程詳細: {", ".join(process_list[:10])}{"..." if len(process_list) > 10 else ""}"""
+
+        chunks.append({
+            "id": f"process_business_{business_id}",
+            "document": business_doc,
+            "metadata": {
+                "type": "process_business",
+                "business_id": business_id,
+                "process_count": len(procs)
+            }
+        })
+
+        # 個別工程のチャンク（詳細情報が必要な場合）
+        for proc in procs:
+            process_id = proc.get("process_id")
+            level_id = proc.get("level_id")
+            process_name = proc.get("process_name", "")
+            process_detail = proc.get("process_name_detail", "")
+            category = proc.get("process_category", "")
+
+            proc_doc = f"""工程詳細:
+業務ID: {business_id}
+工程ID: {process_id}
+レベル: {level_id}
+工程名: {process_name}
+詳細: {process_detail}
+カテゴリ: {category}"""
+
+            chunks.append({
+                "id": f"process_detail_{business_id}_{process_id}_{level_id}",
+                "document": proc_doc,
+                "metadata": {
+                    "type": "process_detail",
+                    "business_id": business_id,
+                    "process_id": process_id,
+                    "level_id": level_id,
+                    "process_name": process_name,
+                    "process_category": category
+                }
+            })
+
+    return chunks
 
 
 class ChromaService:
@@ -17,6 +222,15 @@ class ChromaService:
     _instance = None
     _client = None
     _collection = None
+    _partitions: Dict[str, Any] = {}
+    _local_indexes: Dict[str, LocalVectorIndex] = {}
+    _lexical_index: Optional[LexicalIndex] = None
+    _lexical_lock = threading.Lock()
+    # クエリ埋め込みキャッシュ（データ更新の影響を受けない）と検索結果キャッシュ（データバージョンごと）
+    _embedding_cache = TTLCache(settings.RAG_CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS)
+    _result_cache = TTLCache(settings.RAG_CACHE_MAX_ENTRIES, settings.CACHE_TTL_SECONDS)
+    _data_version = ""
+    _version_checked_at: Optional[float] = None
 
     def __new__(cls):
         """シングルトンパターン実装"""
@@ -61,6 +275,18 @@ class ChromaService:
             app_logger.error(f"ChromaDB初期化エラー: {e}")
             raise
 
+    @classmethod
+    def reset_connection(cls):
+        """
+        接続を破棄（次回のChromaService()で接続し直す）
+
+        コレクションを参照するローカルインデックスも破棄する（埋め込み行列はファイルから再読込される）
+        """
+        cls._client = None
+        cls._collection = None
+        cls._partitions = {}
+        cls._local_indexes = {}
+
     @property
     def client(self):
         """クライアントのプロパティアクセス"""
@@ -68,160 +294,340 @@ class ChromaService:
 
     @property
     def collection(self):
-        """コレクションのプロパティアクセス"""
+        """コレクションのプロパティアクセス（単一コレクション運用時の格納先・パーティション分割の移行元）"""
         return ChromaService._collection
 
-    def create_operator_chunks(self, operator: Dict[str, Any], capabilities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    @property
+    def collection_name(self) -> str:
+        """ナレッジベースのコレクション名（パーティションはこの名前を接頭辞にする）"""
+        return ChromaService._collection.name
+
+    @property
+    def partitioned(self) -> bool:
+        """ドキュメント種別ごとのコレクションに分割して運用しているか"""
+        return settings.CHROMADB_PARTITIONED
+
+    def partition_collection(self, partition: str):
+        """パーティションのコレクションを取得（なければ作成）"""
+        collection = ChromaService._partitions.get(partition)
+        if collection is None:
+            # 移行元と同じ埋め込み関数を使用（コピーしたベクトルとクエリの埋め込みを一致させる）
+            options = {}
+            embedding_function = getattr(self.collection, "_embedding_function", None)
+            if embedding_function is not None:
+                options["embedding_function"] = embedding_function
+            collection = self.client.get_or_create_collection(
+                name=partition_collection_name(self.collection_name, partition),
+                metadata={"description": f"AIMEEナレッジベース ({partition})", "partition": partition},
+                **options
+            )
+            ChromaService._partitions[partition] = collection
+        return collection
+
+    def _collections_for_chunks(self, chunks: List[Dict[str, Any]]) -> List[tuple]:
+        """チャンクを格納先コレクションごとに振り分け（単一コレクション運用時のパーティションはNone）"""
+        if not self.partitioned:
+            return [(None, self.collection, chunks)]
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for chunk in chunks:
+            groups.setdefault(partition_for_type(chunk["metadata"].get("type")), []).append(chunk)
+        return [(partition, self.partition_collection(partition), group) for partition, group in groups.items()]
+
+    def local_index(self, partition: Optional[str]) -> Optional[LocalVectorIndex]:
+        """LOCAL_VECTOR_INDEX_PARTITIONSで指定されたパーティションのローカルインデックス"""
+        if not self.partitioned or partition not in settings.LOCAL_VECTOR_INDEX_PARTITIONS:
+            return None
+        index = ChromaService._local_indexes.get(partition)
+        if index is None:
+            index = LocalVectorIndex(self.partition_collection(partition))
+            ChromaService._local_indexes[partition] = index
+        return index
+
+    def _query_collection(
+        self,
+        partition: Optional[str],
+        collection,
+        query_texts: List[str],
+        n_results: int,
+        where: Optional[Dict[str, Any]] = None,
+        query_embeddings: Optional[List[Any]] = None
+    ) -> List[Dict[str, List[Any]]]:
         """
-        オペレータ情報をセマンティックチャンクに分割
+        複数クエリをまとめて検索
+
+        ローカルインデックスがあればプロセス内で検索し、使えない場合は全クエリを
+        ChromaDBサーバーへ1回のquery()で送る（往復はクエリ数によらず1回）
 
         Args:
-            operator: オペレータ基本情報
-            capabilities: オペレータの処理可能工程リスト
+            query_texts: 検索クエリのリスト
+            n_results: クエリごとの取得件数
+            where: 全クエリに適用するメタデータフィルタ
+            query_embeddings: 計算済みのクエリ埋め込み（省略時はここで計算）
 
         Returns:
-            チャンクのリスト（各チャンクはdocument, metadata, idを含む）
+            クエリごとの結果（documents/metadatas/distances/idsのリスト、query_textsと同じ順）
         """
-        chunks = []
-        operator_id = operator.get("operator_id")
-        operator_name = operator.get("operator_name", "不明")
-        location_id = operator.get("location_id", "不明")
+        if not query_texts:
+            return []
+        if query_embeddings is None:
+            query_embeddings = self._query_embeddings(collection, query_texts)
+        if query_embeddings is None:
+            return split_query_results(collection.query(query_texts=list(query_texts), n_results=n_results, where=where))
 
-        # チャンク1: オペレータ基本情報
-        basic_doc = f"""オペレータID: {operator_id}
-名前: {operator_name}
-所属拠点: {location_id}
-有効: {"はい" if operator.get("is_valid") else "いいえ"}
-所属コード: {operator.get("belong_code", "なし")}"""
+        index = self.local_index(partition)
+        if index is not None:
+            try:
+                index.ensure_ready()
+                return [split_query_results(index.query(embedding, n_results, where))[0] for embedding in query_embeddings]
+            except ValueError as e:
+                # 件数上限超過・未対応のフィルタ
+                app_logger.debug(f"ローカルインデックス対象外、ChromaDBサーバーで検索 ({partition}): {e}")
+            except Exception as e:
+                app_logger.warning(f"ローカルインデックス検索失敗、ChromaDBサーバーで検索 ({partition}): {e}")
+        return split_query_results(collection.query(query_embeddings=list(query_embeddings), n_results=n_results, where=where))
 
-        chunks.append({
-            "id": f"operator_basic_{operator_id}",
-            "document": basic_doc,
-            "metadata": {
-                "type": "operator_basic",
-                "operator_id": operator_id,
-                "operator_name": operator_name,
-                "location_id": location_id,
-                "timestamp": datetime.now().isoformat()
-            }
-        })
+    def _query_embeddings(self, collection, query_texts: List[str]) -> Optional[List[Any]]:
+        """
+        クエリの埋め込みをコレクションの埋め込み関数でクライアント側で計算
 
-        # チャンク2〜N: 業務別の処理可能工程
-        # 業務ごとにグループ化
-        business_groups = {}
-        for cap in capabilities:
-            business_id = cap.get("business_id")
-            if business_id not in business_groups:
-                business_groups[business_id] = []
-            business_groups[business_id].append(cap)
-
-        for business_id, caps in business_groups.items():
-            process_list = []
-            for cap in caps:
-                process_id = cap.get("process_id")
-                work_level = cap.get("work_level", 0)
-                process_list.append(f"工程{process_id}(レベル{work_level})")
-
-            capability_doc = f"""オペレータ {operator_name} ({operator_id}) の処理能力:
-業務ID: {business_id}
-処理可能工程: {", ".join(process_list)}
-拠点: {location_id}"""
+        正規化したクエリを埋め込み、ENABLE_VECTOR_CACHE時はキャッシュする（未計算分は1回の呼び出しで計算）。
+        埋め込み関数がない場合はNone（サーバー側でquery_textsから計算）
+        """
+        embedding_function = getattr(collection, "_embedding_function", None)
+        if embedding_function is None:
+            return None
+        normalized = [normalize_query(query_text) for query_text in query_texts]
+        if not settings.ENABLE_VECTOR_CACHE:
+            return list(embedding_function(normalized))
 
-            chunks.append({
-                "id": f"operator_capability_{operator_id}_{business_id}",
-                "document": capability_doc,
-                "metadata": {
-                    "type": "operator_capability",
-                    "operator_id": operator_id,
-                    "operator_name": operator_name,
-                    "business_id": business_id,
-                    "location_id": location_id,
-                    "process_count": len(caps),
-                    "timestamp": datetime.now().isoformat()
-                }
-            })
+        cache_name = type(embedding_function).__name__
+        embeddings = [ChromaService._embedding_cache.get((cache_name, text)) for text in normalized]
+        missing = list(dict.fromkeys(text for text, embedding in zip(normalized, embeddings) if embedding is None))
+        if missing:
+            computed = dict(zip(missing, embedding_function(missing)))
+            for text, embedding in computed.items():
+                ChromaService._embedding_cache.set((cache_name, text), embedding)
+            embeddings = [computed[text] if embedding is None else embedding for text, embedding in zip(normalized, embeddings)]
+        return embeddings
 
-        return chunks
+    def data_version(self) -> str:
+        """
+        ナレッジベースのデータバージョン（投入パイプラインが更新する）
 
-    def create_process_chunks(self, processes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        別プロセスの投入を検知するため、ベースコレクションのメタデータを
+        RAG_CACHE_VERSION_CHECK_SECONDSごとに確認する
         """
-        工程情報をセマンティックチャンクに分割
+        now = time.monotonic()
+        checked_at = ChromaService._version_checked_at
+        if checked_at is None or now - checked_at >= settings.RAG_CACHE_VERSION_CHECK_SECONDS:
+            try:
+                metadata = self.client.get_collection(name=self.collection_name).metadata or {}
+                ChromaService._data_version = str(metadata.get("data_version", ""))
+            except Exception as e:
+                app_logger.warning(f"データバージョン取得エラー: {e}")
+            ChromaService._version_checked_at = now
+        return ChromaService._data_version
+
+    def bump_data_version(self) -> str:
+        """データバージョンを更新し、全プロセスの検索結果キャッシュを無効化"""
+        version = datetime.now().isoformat()
+        # hnsw:*は作成後に変更できないため除外（距離空間はコレクション設定に保持される）
+        metadata = {key: value for key, value in (self.collection.metadata or {}).items() if not key.startswith("hnsw:")}
+        metadata["data_version"] = version
+        self.collection.modify(metadata=metadata)
+        ChromaService._data_version = version
+        ChromaService._version_checked_at = time.monotonic()
+        ChromaService._result_cache.clear()
+        return version
+
+    def _cache_key(self, kind: str, params: Dict[str, Any]) -> Optional[tuple]:
+        """
+        検索結果キャッシュのキー（ENABLE_VECTOR_CACHEが無効ならNone）
 
         Args:
-            processes: 工程情報のリスト
+            kind: 検索の種類
+            params: 検索パラメータ（クエリは正規化済み）
+        """
+        if not settings.ENABLE_VECTOR_CACHE:
+            return None
+        return (
+            kind,
+            self.collection_name,
+            self.partitioned,
+            self.data_version(),
+            json.dumps(params, ensure_ascii=False, sort_keys=True, default=str)
+        )
+
+    def _cache_get(self, key: Optional[tuple]) -> Any:
+        """キャッシュ済みの検索結果（呼び出し側が変更してもキャッシュに影響しないよう複製を返す）"""
+        if key is None:
+            return None
+        cached = ChromaService._result_cache.get(key)
+        return copy.deepcopy(cached) if cached is not None else None
+
+    def _cache_set(self, key: Optional[tuple], results: Any):
+        if key is not None:
+            ChromaService._result_cache.set(key, copy.deepcopy(results))
+
+    def lexical_index(self) -> Optional[LexicalIndex]:
+        """
+        字句インデックス（LEXICAL_INDEX_ENABLED時のみ）
+
+        保存済みファイルがなければChromaDBの既存チャンクから構築する（初回のみ）
+        """
+        if not settings.LEXICAL_INDEX_ENABLED:
+            return None
+        with ChromaService._lexical_lock:
+            if ChromaService._lexical_index is None:
+                index = LexicalIndex()
+                if not index.load():
+                    self.rebuild_lexical_index(index)
+                ChromaService._lexical_index = index
+        index = ChromaService._lexical_index
+        index.reload_if_changed()
+        return index
+
+    def rebuild_lexical_index(self, index: Optional[LexicalIndex] = None, page_size: int = 5000) -> LexicalIndex:
+        """
+        ChromaDBの全チャンクから字句インデックスを作り直して保存
+
+        Args:
+            index: 作り直すインデックス（省略時は現在のインデックス）
+            page_size: 1回に読み込む件数
 
         Returns:
-            チャンクのリスト
+            作り直したインデックス
         """
-        chunks = []
-
-        # 業務ごとにグループ化
-        business_groups = {}
-        for process in processes:
-            business_id = process.get("business_id")
-            if business_id not in business_groups:
-                business_groups[business_id] = []
-            business_groups[business_id].append(process)
-
-        for business_id, procs in business_groups.items():
-            # 業務全体のチャンク
-            process_list = []
-            for proc in procs:
-                process_id = proc.get("process_id")
-                process_name = proc.get("process_name", "")
-                category = proc.get("process_category", "")
-                process_list.append(f"{process_name}({process_id}, {category})")
-
-            business_doc = f"""業務ID {business_id} の工程一覧:
-工程数: {len(procs)}
-工程詳細: {", ".join(process_list[:10])}{"..." if len(process_list) > 10 else ""}"""
+        index = index or ChromaService._lexical_index or LexicalIndex()
+        index.clear()
+        if self.partitioned:
+            collections = [self.partition_collection(partition) for partition in COLLECTION_PARTITIONS]
+        else:
+            collections = [self.collection]
+        for collection in collections:
+            offset = 0
+            while True:
+                page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+                index.upsert([
+                    {"id": chunk_id, "document": document, "metadata": metadata}
+                    for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"])
+                ])
+                if len(page["ids"]) < page_size:
+                    break
+                offset += page_size
+        index.save()
+        ChromaService._lexical_index = index
+        app_logger.info(f"字句インデックスをChromaDBから構築しました: {len(index)}件")
+        return index
 
-            chunks.append({
-                "id": f"process_business_{business_id}",
-                "document": business_doc,
-                "metadata": {
-                    "type": "process_business",
-                    "business_id": business_id,
-                    "process_count": len(procs),
-                    "timestamp": datetime.now().isoformat()
-                }
-            })
+    def _fuse_with_lexical(
+        self,
+        query_text: str,
+        vector_results: Dict[str, List[Any]],
+        n_results: int,
+        where: Optional[Dict[str, Any]] = None,
+        lexical_top: Optional[int] = None
+    ) -> Dict[str, List[Any]]:
+        """
+        ベクトル検索結果と字句検索（BM25）結果をReciprocal Rank Fusionで統合
 
-            # 個別工程のチャンク（詳細情報が必要な場合）
-            for proc in procs:
-                process_id = proc.get("process_id")
-                level_id = proc.get("level_id")
-                process_name = proc.get("process_name", "")
-                process_detail = proc.get("process_name_detail", "")
-                category = proc.get("process_category", "")
+        Args:
+            query_text: 検索クエリ
+            vector_results: ベクトル検索結果（documents/metadatas/distances/idsのリスト）
+            n_results: 取得する結果数
+            where: 字句検索に適用するメタデータフィルタ
+            lexical_top: 字句検索の上位何件をlexical_matchとするか（デフォルトはn_results）
 
-                proc_doc = f"""工程詳細:
-業務ID: {business_id}
-工程ID: {process_id}
-レベル: {level_id}
-工程名: {process_name}
-詳細: {process_detail}
-カテゴリ: {category}"""
+        Returns:
+            統合結果（vector_resultsと同じ形式 + RRFスコアのscores・字句検索上位かどうかのlexical_match）
+        """
+        try:
+            index = self.lexical_index()
+            lexical_hits = index.search(query_text, n_results * settings.RRF_CANDIDATE_MULTIPLIER, where) if index else []
+        except Exception as e:
+            app_logger.warning(f"字句検索エラー、ベクトル検索結果のみ使用: {e}")
+            lexical_hits = []
+        if not lexical_hits:
+            return {key: values[:n_results] for key, values in vector_results.items()}
 
-                chunks.append({
-                    "id": f"process_detail_{business_id}_{process_id}_{level_id}",
-                    "document": proc_doc,
-                    "metadata": {
-                        "type": "process_detail",
-                        "business_id": business_id,
-                        "process_id": process_id,
-                        "level_id": level_id,
-                        "process_name": process_name,
-                        "process_category": category,
-                        "timestamp": datetime.now().isoformat()
-                    }
-                })
+        rows = {chunk_id: i for i, chunk_id in enumerate(vector_results["ids"])}
+        # 字句検索のみでヒットしたチャンクはベクトル候補外のため、距離は候補の最大距離とする（実際の距離はそれ以上）
+        distance_floor = max(vector_results["distances"], default=1.0)
+        fused = {"documents": [], "metadatas": [], "distances": [], "ids": [], "scores": [], "lexical_match": []}
+        top_lexical_ids = {chunk_id for chunk_id, _ in lexical_hits[:lexical_top or n_results]}
+        rankings = [vector_results["ids"], [chunk_id for chunk_id, _ in lexical_hits]]
+        for chunk_id, score in reciprocal_rank_fusion(rankings, settings.RRF_K)[:n_results]:
+            if chunk_id in rows:
+                i = rows[chunk_id]
+                document, metadata = vector_results["documents"][i], vector_results["metadatas"][i]
+                distance = vector_results["distances"][i]
+            else:
+                document, metadata = index.get(chunk_id)
+                distance = distance_floor
+            fused["documents"].append(document)
+            fused["metadatas"].append(metadata)
+            fused["distances"].append(distance)
+            fused["ids"].append(chunk_id)
+            fused["scores"].append(score)
+            fused["lexical_match"].append(chunk_id in top_lexical_ids)
+        return fused
+
+    def _collection_for_types(self, doc_types: Optional[List[str]]) -> tuple:
+        """
+        検索対象のコレクションとtypeフィルタを決定
+
+        Args:
+            doc_types: 対象のドキュメント種別（Noneの場合は全種別）
 
-        return chunks
+        Returns:
+            (パーティション or None, コレクション, typeフィルタ or None)
+        """
+        type_filter = {"type": {"$in": list(doc_types)}} if doc_types else None
+        if not self.partitioned or not doc_types:
+            return None, self.collection, type_filter
+
+        partitions = {partition_for_type(doc_type) for doc_type in doc_types}
+        if len(partitions) > 1:
+            raise ValueError(f"複数のパーティションにまたがる種別は検索できません: {doc_types}")
+        partition = partitions.pop()
+        # パーティション内の全種別が対象ならtypeフィルタは不要
+        if set(doc_types) >= set(COLLECTION_PARTITIONS[partition]):
+            type_filter = None
+        return partition, self.partition_collection(partition), type_filter
+
+    def embedding_function(self, doc_types: Optional[List[str]] = None) -> Optional[Any]:
+        """種別の格納先コレクションの埋め込み関数（ない場合はNone）"""
+        _, collection, _ = self._collection_for_types(doc_types)
+        return getattr(collection, "_embedding_function", None)
+
+    def create_operator_chunks(self, operator: Dict[str, Any], capabilities: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        オペレータ情報をセマンティックチャンクに分割
+
+        Args:
+            operator: オペレータ基本情報
+            capabilities: オペレータの処理可能工程リスト
+
+        Returns:
+            チャンクのリスト（各チャンクはdocument, metadata, idを含む）
+        """
+        return build_operator_chunks(operator, capabilities)
+
+    def create_process_chunks(self, processes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        工程情報をセマンティックチャンクに分割
+
+        Args:
+            processes: 工程情報のリスト
+
+        Returns:
+            チャンクのリスト
+        """
+        return build_process_chunks(processes)
 
     def add_documents(self, chunks: List[Dict[str, Any]], batch_size: int = 5000):
         """
-        チャンクをChromaDBに追加（バッチ処理対応）
+        チャンクをChromaDBにupsert（バッチ処理対応、同じIDは置き換え）
 
         Args:
             chunks: ドキュメントチャンクのリスト
@@ -241,15 +647,7 @@ class ChromaService:
                 batch_num = (i // batch_size) + 1
                 total_batches = (total_chunks + batch_size - 1) // batch_size
 
-                ids = [chunk["id"] for chunk in batch]
-                documents = [chunk["document"] for chunk in batch]
-                metadatas = [chunk["metadata"] for chunk in batch]
-
-                self.collection.add(
-                    ids=ids,
-                    documents=documents,
-                    metadatas=metadatas
-                )
+                self.upsert_batch(batch)
 
                 app_logger.info(f"バッチ {batch_num}/{total_batches} 完了: {len(batch)}件投入 (累計: {min(i + batch_size, total_chunks)}/{total_chunks})")
 
@@ -259,11 +657,72 @@ class ChromaService:
             app_logger.error(f"ChromaDBへのドキュメント追加エラー: {e}")
             raise
 
+    def upsert_batch(self, chunks: List[Dict[str, Any]]):
+        """
+        1バッチ分のチャンクをupsert（同じIDのチャンクは置き換え）
+
+        Args:
+            chunks: ドキュメントチャンクのリスト（ChromaDBの上限5461件以下）
+        """
+        for partition, collection, group in self._collections_for_chunks(chunks):
+            collection.upsert(
+                ids=[chunk["id"] for chunk in group],
+                documents=[chunk["document"] for chunk in group],
+                metadatas=[chunk["metadata"] for chunk in group]
+            )
+            index = ChromaService._local_indexes.get(partition)
+            if index is not None:
+                index.invalidate()
+        if ChromaService._lexical_index is not None:
+            ChromaService._lexical_index.upsert(chunks)
+        ChromaService._result_cache.clear()
+
+    def delete_batch(self, ids: List[str]):
+        """
+        指定IDのチャンクを削除
+
+        Args:
+            ids: 削除するチャンクIDのリスト
+        """
+        if not self.partitioned:
+            self.collection.delete(ids=ids)
+        else:
+            # IDからは格納先を判別できないため全パーティションから削除（存在しないIDは無視される）
+            for partition in COLLECTION_PARTITIONS:
+                self.partition_collection(partition).delete(ids=ids)
+            for index in ChromaService._local_indexes.values():
+                index.invalidate()
+        if ChromaService._lexical_index is not None:
+            ChromaService._lexical_index.delete(ids)
+        ChromaService._result_cache.clear()
+
+    def get_metadata_page(
+        self,
+        doc_types: Optional[List[str]] = None,
+        limit: int = 5000,
+        offset: int = 0
+    ) -> Dict[str, Any]:
+        """
+        チャンクのIDとメタデータを1ページ分取得（ドキュメント本文・埋め込みは取得しない）
+
+        Args:
+            doc_types: 対象のドキュメント種別（同一パーティション内の種別のみ）
+            limit: 取得件数
+            offset: 開始位置
+
+        Returns:
+            idsとmetadatasを含む辞書
+        """
+        _, collection, where = self._collection_for_types(doc_types)
+        return collection.get(where=where, include=["metadatas"], limit=limit, offset=offset)
+
     def query_similar(
         self,
         query_text: str,
         n_results: int = 5,
-        filter_metadata: Optional[Dict[str, Any]] = None
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        doc_types: Optional[List[str]] = None,
+        hybrid: bool = True
     ) -> Dict[str, Any]:
         """
         類似ドキュメントを検索
@@ -272,30 +731,138 @@ class ChromaService:
             query_text: クエリテキスト
             n_results: 取得する結果数
             filter_metadata: メタデータフィルタ
+            doc_types: 対象のドキュメント種別（パーティション分割時は該当コレクションのみ検索）
+            hybrid: 字句検索（BM25）の結果とRRFで統合する（LEXICAL_INDEX_ENABLED時のみ）
 
         Returns:
             検索結果
         """
-        try:
-            results = self.collection.query(
-                query_texts=[query_text],
-                n_results=n_results,
-                where=filter_metadata
-            )
+        results = self.query_similar_batch(
+            [{"query_text": query_text, "filter_metadata": filter_metadata, "doc_types": doc_types}],
+            n_results=n_results,
+            hybrid=hybrid
+        )[0]
+        app_logger.info(f"クエリ '{query_text[:50]}...' で {len(results['ids'])} 件の結果を取得")
+        return results
 
-            app_logger.info(f"クエリ '{query_text[:50]}...' で {len(results['ids'][0])} 件の結果を取得")
+    def query_similar_batch(
+        self,
+        queries: List[Dict[str, Any]],
+        n_results: int = 5,
+        hybrid: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        複数の類似検索をまとめて実行
 
-            return {
-                "documents": results["documents"][0],
-                "metadatas": results["metadatas"][0],
-                "distances": results["distances"][0],
-                "ids": results["ids"][0]
-            }
+        フィルタと種別が同じクエリは1回のquery()にまとめてChromaDBへ送り、結果をクエリごとに振り分ける
+
+        Args:
+            queries: 検索条件のリスト（query_text、任意でfilter_metadata・doc_typesを含む辞書）
+            n_results: クエリごとの取得件数
+            hybrid: 字句検索（BM25）の結果とRRFで統合する（LEXICAL_INDEX_ENABLED時のみ）
+
+        Returns:
+            検索結果のリスト（queriesと同じ順、各要素はquery_similarと同じ形式）
+        """
+        hybrid = hybrid and settings.LEXICAL_INDEX_ENABLED
+        results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        keys: List[Optional[tuple]] = []
+        groups: Dict[str, List[int]] = {}
+        for i, query in enumerate(queries):
+            filter_metadata, doc_types = query.get("filter_metadata"), query.get("doc_types")
+            keys.append(self._cache_key(
+                "query_similar",
+                {
+                    "query": normalize_query(query["query_text"]),
+                    "n_results": n_results,
+                    "filter": filter_metadata,
+                    "doc_types": doc_types,
+                    "hybrid": hybrid,
+                }
+            ))
+            results[i] = self._cache_get(keys[i])
+            if results[i] is None:
+                group = json.dumps([filter_metadata, doc_types], ensure_ascii=False, sort_keys=True, default=str)
+                groups.setdefault(group, []).append(i)
+
+        try:
+            for rows in groups.values():
+                filter_metadata, doc_types = queries[rows[0]].get("filter_metadata"), queries[rows[0]].get("doc_types")
+                query_texts = [queries[i]["query_text"] for i in rows]
+                vector_results = self._vector_search(
+                    query_texts,
+                    n_results * settings.RRF_CANDIDATE_MULTIPLIER if hybrid else n_results,
+                    filter_metadata,
+                    doc_types
+                )
+                type_filter = {"type": {"$in": list(doc_types)}} if doc_types else None
+                for i, query_text, vector_result in zip(rows, query_texts, vector_results):
+                    if hybrid:
+                        vector_result = self._fuse_with_lexical(
+                            query_text, vector_result, n_results, merge_where(type_filter, filter_metadata)
+                        )
+                    # エラー時はキャッシュしない
+                    self._cache_set(keys[i], vector_result)
+                    results[i] = vector_result
 
         except Exception as e:
             app_logger.error(f"ChromaDB検索エラー: {e}")
+            chroma_connection.report_failure(e)
             raise
 
+        if len(queries) > 1:
+            app_logger.info(f"類似検索（一括）: {len(queries)}クエリ, ChromaDB検索 {len(groups)}回")
+        return results
+
+    def _vector_search(
+        self,
+        query_texts: List[str],
+        n_results: int,
+        filter_metadata: Optional[Dict[str, Any]] = None,
+        doc_types: Optional[List[str]] = None
+    ) -> List[Dict[str, List[Any]]]:
+        """
+        ベクトル検索（パーティション分割時に種別指定がなければ全パーティションを検索し、距離順にマージ）
+
+        Returns:
+            クエリごとの結果（query_textsと同じ順）
+        """
+        if self.partitioned and not doc_types:
+            hits: List[List[tuple]] = [[] for _ in query_texts]
+            for partition in COLLECTION_PARTITIONS:
+                partition_results = self._query_collection(
+                    partition,
+                    self.partition_collection(partition),
+                    query_texts,
+                    n_results,
+                    filter_metadata
+                )
+                for query_hits, results in zip(hits, partition_results):
+                    query_hits.extend(zip(
+                        results["distances"], results["ids"],
+                        results["documents"], results["metadatas"]
+                    ))
+            merged = []
+            for query_hits in hits:
+                query_hits.sort(key=lambda hit: hit[0])
+                query_hits = query_hits[:n_results]
+                merged.append({
+                    "documents": [hit[2] for hit in query_hits],
+                    "metadatas": [hit[3] for hit in query_hits],
+                    "distances": [hit[0] for hit in query_hits],
+                    "ids": [hit[1] for hit in query_hits]
+                })
+            return merged
+
+        partition, collection, type_filter = self._collection_for_types(doc_types)
+        return self._query_collection(
+            partition,
+            collection,
+            query_texts,
+            n_results,
+            merge_where(type_filter, filter_metadata)
+        )
+
     def find_best_operators_for_process(
         self,
         business_id: str,
@@ -306,6 +873,10 @@ class ChromaService:
         """
         特定工程に最適なオペレータを検索
 
+        業務・工程は完全一致の条件のため、オペレータ能力インデックスが読み込み済みなら
+        そこからスキルレベル順に返す（呼び出し側で operator_capability_index.ensure_loaded(db) を行う）。
+        未読込の場合のみベクトル検索で代替する。
+
         Args:
             business_id: 業務ID
             process_id: 工程ID
@@ -315,29 +886,28 @@ class ChromaService:
         Returns:
             最適なオペレータのリスト
         """
+        if operator_capability_index.loaded:
+            return operator_capability_index.lookup(business_id, process_id, location_id, n_results)
+        app_logger.warning("オペレータ能力インデックス未読込のため、ベクトル検索でオペレータを検索します")
+
         query_text = f"業務{business_id}の工程{process_id}を処理できるオペレータ"
 
-        # ChromaDB v1.1+ では$and演算子を使用
+        # ChromaDB v1.1+ では$and演算子を使用（typeフィルタはquery_similarで付与）
         if location_id:
             filter_dict = {
                 "$and": [
-                    {"type": {"$eq": "operator_capability"}},
                     {"business_id": {"$eq": business_id}},
                     {"location_id": {"$eq": location_id}}
                 ]
             }
         else:
-            filter_dict = {
-                "$and": [
-                    {"type": {"$eq": "operator_capability"}},
-                    {"business_id": {"$eq": business_id}}
-                ]
-            }
+            filter_dict = {"business_id": {"$eq": business_id}}
 
         results = self.query_similar(
             query_text=query_text,
             n_results=n_results,
-            filter_metadata=filter_dict
+            filter_metadata=filter_dict,
+            doc_types=["operator_capability"]
         )
 
         operators = []
@@ -355,48 +925,228 @@ class ChromaService:
     def search_manager_rules(
         self,
         query_text: str,
-        n_results: int = 5
+        n_results: Optional[int] = None,
+        rerank: bool = True
     ) -> List[Dict[str, Any]]:
         """
         管理者ノウハウ・判断基準を検索
 
         Args:
             query_text: 検索クエリ
-            n_results: 取得する結果数
+            n_results: 取得する最大件数（デフォルトはTOP_K_RESULTS）
+            rerank: 候補を多めに取得し、類似度閾値・重複除去・トークン予算で絞り込む
 
         Returns:
             関連する管理者ルールのリスト
         """
+        return self.search_manager_rules_batch([query_text], n_results=n_results, rerank=rerank)[0]
+
+    def search_manager_rules_batch(
+        self,
+        query_texts: List[str],
+        n_results: Optional[int] = None,
+        rerank: bool = True
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        複数クエリの管理者ルールをまとめて検索
+
+        キャッシュにないクエリについて、埋め込み計算・ベクトル検索（1回のquery()）・
+        再ランキング用の埋め込み取得（1回のget()）をまとめて行い、結果をクエリごとに振り分ける
+
+        Args:
+            query_texts: 検索クエリのリスト
+            n_results: クエリごとの最大件数（デフォルトはTOP_K_RESULTS）
+            rerank: 候補を多めに取得し、類似度閾値・重複除去・トークン予算で絞り込む
+
+        Returns:
+            クエリごとの管理者ルールのリスト（query_textsと同じ順、エラー時は空リスト）
+        """
+        n_results = n_results or settings.TOP_K_RESULTS
+        normalized = [normalize_query(query_text) for query_text in query_texts]
+        # 同じ質問の繰り返しは埋め込み計算・ベクトル検索を行わずキャッシュから返す（エラー時はキャッシュしない）
+        keys = [
+            self._cache_key(
+                "manager_rules",
+                {
+                    "query": query,
+                    "n_results": n_results,
+                    "hybrid": settings.LEXICAL_INDEX_ENABLED,
+                    "rerank": rerank,
+                }
+            )
+            for query in normalized
+        ]
+        rule_lists = [self._cache_get(key) for key in keys]
+        # 正規化後に同じになるクエリは1回だけ検索
+        pending = {
+            query: query_text
+            for query, query_text, rules in zip(normalized, query_texts, rule_lists)
+            if rules is None
+        }
+        if not pending:
+            return rule_lists
+        cached_count = len(query_texts) - sum(1 for rules in rule_lists if rules is None)
+
         try:
-            results = self.collection.query(
-                query_texts=[query_text],
-                n_results=n_results
+            searched = self._search_manager_rules(list(pending.values()), n_results, rerank)
+        except Exception as e:
+            app_logger.error(f"管理者ルール検索エラー: {e}")
+            chroma_connection.report_failure(e)
+            searched = {}
+
+        for i, (query, key) in enumerate(zip(normalized, keys)):
+            if rule_lists[i] is not None:
+                continue
+            rules = searched.get(query)
+            if rules is None:
+                rule_lists[i] = []
+                continue
+            self._cache_set(key, rules)
+            rule_lists[i] = copy.deepcopy(rules)
+        if len(query_texts) > 1:
+            app_logger.info(
+                f"管理者ルール一括検索: {len(query_texts)}クエリ "
+                f"(キャッシュ {cached_count}件, 検索 {len(pending)}件)"
             )
+        return rule_lists
 
+    def _search_manager_rules(
+        self,
+        query_texts: List[str],
+        n_results: int,
+        rerank: bool
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        管理者ルールを検索（キャッシュなし）
+
+        Returns:
+            正規化したクエリ → 管理者ルールのリスト
+        """
+        if self.partitioned:
+            partition, collection, where = "manager_rules", self.partition_collection("manager_rules"), None
+        else:
+            # 単一コレクションではオペレータ・工程チャンクを除外（typeのない管理者ルールは$ninに一致する）
+            partition, collection, where = None, self.collection, {"type": {"$nin": NON_RULE_TYPES}}
+        # 埋め込み関数がない（クエリ埋め込みを計算できない）場合は再ランキングしない
+        query_embeddings = self._query_embeddings(collection, query_texts)
+        rerank_enabled = rerank and query_embeddings is not None
+        candidates = n_results * settings.RRF_CANDIDATE_MULTIPLIER
+        results_list = self._query_collection(
+            partition,
+            collection,
+            query_texts,
+            candidates if rerank_enabled or settings.LEXICAL_INDEX_ENABLED else n_results,
+            where,
+            query_embeddings
+        )
+        if settings.LEXICAL_INDEX_ENABLED:
+            # 「札幌」「SV補正」のような完全一致の語を含むルールを字句検索で補う
+            results_list = [
+                self._fuse_with_lexical(
+                    query_text,
+                    results,
+                    candidates if rerank_enabled else n_results,
+                    {"type": {"$nin": NON_RULE_TYPES}},
+                    lexical_top=n_results
+                )
+                for query_text, results in zip(query_texts, results_list)
+            ]
+
+        embeddings: Dict[str, Any] = {}
+        if rerank_enabled:
+            # 全クエリの候補の埋め込みを1回で取得
+            candidate_ids = list(dict.fromkeys(chunk_id for results in results_list for chunk_id in results["ids"]))
+            embeddings = self._chunk_embeddings(partition, collection, candidate_ids)
+
+        searched = {}
+        for i, (query_text, results) in enumerate(zip(query_texts, results_list)):
             rules = []
-            for i, (doc, metadata) in enumerate(zip(results["documents"][0], results["metadatas"][0])):
+            for doc, metadata, distance in zip(results["documents"], results["metadatas"], results["distances"]):
                 rules.append({
                     "rule_text": doc,
                     "category": metadata.get("category", "general"),
                     "title": metadata.get("title", ""),
-                    "relevance_score": 1 - results["distances"][0][i] if "distances" in results else 0.5
+                    "relevance_score": 1 - distance
                 })
+            if rerank_enabled:
+                rules = self._rerank_rules(query_embeddings[i], rules, results, embeddings, n_results)
 
             app_logger.info(f"管理者ルール検索: '{query_text[:30]}...' で {len(rules)}件取得")
-            return rules
+            searched[normalize_query(query_text)] = rules[:n_results]
+        return searched
 
-        except Exception as e:
-            app_logger.error(f"管理者ルール検索エラー: {e}")
-            return []
+    def _rerank_rules(
+        self,
+        query_embedding: Any,
+        rules: List[Dict[str, Any]],
+        results: Dict[str, List[Any]],
+        embeddings: Dict[str, Any],
+        n_results: int
+    ) -> List[Dict[str, Any]]:
+        """検索候補のルールをRuleRerankerで再ランキング・絞り込み"""
+        lexical_matches = results.get("lexical_match") or [False] * len(rules)
+        # 埋め込みを取得できないルール（字句インデックスにのみ残っている等）は除外
+        rows = [i for i, chunk_id in enumerate(results["ids"]) if chunk_id in embeddings]
+        reranked, dropped = RuleReranker(top_k=n_results).rerank(
+            query_embedding,
+            [rules[i] for i in rows],
+            [embeddings[results["ids"][i]] for i in rows],
+            [lexical_matches[i] for i in rows]
+        )
+        app_logger.info(
+            f"管理者ルール再ランキング: 候補{len(rules)}件 → {len(reranked)}件 "
+            f"(閾値未満 {dropped['below_threshold']}, 重複 {dropped['duplicate']}, "
+            f"トークン上限 {dropped['over_budget']}, 埋め込みなし {len(rules) - len(rows)})"
+        )
+        return reranked
+
+    def _chunk_embeddings(self, partition: Optional[str], collection, ids: List[str]) -> Dict[str, Any]:
+        """チャンクの埋め込み（ローカルインデックスにあればネットワーク不要）"""
+        embeddings: Dict[str, Any] = {}
+        index = ChromaService._local_indexes.get(partition)
+        if index is not None and index.ready:
+            embeddings = index.embeddings(ids)
+        missing = [chunk_id for chunk_id in ids if chunk_id not in embeddings]
+        if missing:
+            data = collection.get(ids=missing, include=["embeddings"])
+            embeddings.update(zip(data["ids"], data["embeddings"]))
+        return embeddings
+
+    def _cache_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.ENABLE_VECTOR_CACHE,
+            "data_version": ChromaService._data_version,
+            "embeddings": ChromaService._embedding_cache.stats(),
+            "results": ChromaService._result_cache.stats(),
+        }
 
     def get_collection_stats(self) -> Dict[str, Any]:
         """コレクションの統計情報を取得"""
         try:
+            if self.partitioned:
+                partitions = {
+                    partition: self.partition_collection(partition).count()
+                    for partition in COLLECTION_PARTITIONS
+                }
+                return {
+                    "total_documents": sum(partitions.values()),
+                    "collection_name": self.collection_name,
+                    "partitions": partitions,
+                    "local_indexes": {
+                        partition: index.stats()
+                        for partition, index in ChromaService._local_indexes.items()
+                    },
+                    "lexical_index": ChromaService._lexical_index.stats() if ChromaService._lexical_index else None,
+                    "cache": self._cache_stats()
+                }
             count = self.collection.count()
             return {
                 "total_documents": count,
-                "collection_name": self.collection.name
+                "collection_name": self.collection.name,
+                "lexical_index": ChromaService._lexical_index.stats() if ChromaService._lexical_index else None,
+                "cache": self._cache_stats()
             }
         except Exception as e:
             app_logger.error(f"統計情報取得エラー: {e}")
+            chroma_connection.report_failure(e)
             return {"error": str(e)}
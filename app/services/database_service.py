@@ -2,23 +2,171 @@
 データベース照会サービス
 意図解析結果に基づいて適切なデータを取得
 """
-from typing import Dict, Any, List, Optional
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import text
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, List, Optional, Sequence, Tuple, Type, Union
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import Row, text
 from datetime import datetime, timedelta
 
+from app.core.config import settings
 from app.core.logging import app_logger
+from app.db.records import OperatorCapability, ProcessAllocation, RecordList, RecordMixin, SkillMatch
+from app.services.lazy_db_data import LazyDbData
+
+
+# リクエスト単位の並行クエリ枠（Noneの場合は渡されたセッションで順次実行）
+_query_slots: ContextVar[Optional[asyncio.Semaphore]] = ContextVar("query_slots", default=None)
+
+# 共有スナップショット内のクエリ結果（SQL・パラメータ→取得タスク、Noneの場合は共有しない）
+_shared_results: ContextVar[Optional[Dict[Tuple[str, ...], asyncio.Future]]] = ContextVar("shared_results", default=None)
 
 
 class DatabaseService:
     """データベースから業務データを取得するサービス"""
+
+    # 遅延解決系の取得元ごとのカテゴリ
+    ALLOCATION_CATEGORIES = ["available_resources", "shortage_list"]
+    OPERATOR_CATEGORIES = ["operators_by_location_process", "operators_by_hierarchy"]
+    SKILL_CATEGORIES = ["operators_by_target_skill"]
+
+    # 配置提案データを遅延取得する意図タイプ
+    # （True: progress_snapshotsも全カテゴリ取得の対象、False: 影響算出でのみ取得）
+    DELAY_RESOLUTION_INTENTS = {
+        "delay_resolution": False,
+        "deadline_optimization": True,
+        "cross_business_transfer": True,
+        "process_optimization": True,
+    }
+
+    @contextmanager
+    def _query_scope(self, parallel: bool):
+        """
+        1リクエスト分のクエリ並行実行スコープ
+
+        並行実行時は独立したクエリを別々のプール接続で実行し、
+        同時実行数をDATABASE_QUERY_CONCURRENCYで制限する。
+        """
+        slots = asyncio.Semaphore(settings.DATABASE_QUERY_CONCURRENCY) if parallel else None
+        token = _query_slots.set(slots)
+        try:
+            yield
+        finally:
+            _query_slots.reset(token)
+
+    @contextmanager
+    def shared_snapshot(self):
+        """
+        複数の処理で1回分のデータ取得を共有するスコープ
+
+        スコープ内（スコープ内で作成したタスクを含む）で同じSQL・パラメータのクエリは1回だけ実行し、
+        同時に要求した処理も含めて結果を共有する。アラートの一括解消などで、
+        同じ時点のデータを処理ごとに取得し直さないために使う。
+        """
+        token = _shared_results.set({})
+        try:
+            yield
+        finally:
+            _shared_results.reset(token)
+
+    async def _shared(self, key: Tuple[str, ...], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """共有スナップショット内であれば同じキーの取得を1回にまとめる"""
+        shared = _shared_results.get()
+        if shared is None:
+            return await fetch()
+        future = shared.get(key)
+        if future is None:
+            future = shared[key] = asyncio.ensure_future(fetch())
+        return await future
+
+    @staticmethod
+    def _query_key(kind: str, query, params: Optional[Dict[str, Any]]) -> Tuple[str, ...]:
+        return kind, str(query), repr(sorted((params or {}).items()))
+
+    @asynccontextmanager
+    async def _session(self, db: AsyncSession):
+        """クエリ実行用のセッションを取得（並行実行時は専用セッション）"""
+        slots = _query_slots.get()
+        if slots is None:
+            yield db
+            return
+
+        # AsyncSessionは並行利用できないため、同じエンジンから専用セッションを取得
+        async with slots:
+            async with async_sessionmaker(db.bind, class_=AsyncSession)() as session:
+                yield session
+
+    async def _execute(
+        self,
+        db: AsyncSession,
+        query,
+        params: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """クエリを実行して行を辞書のリストで返す（共有スナップショット内では同じクエリの結果を共有）"""
+        async def fetch() -> List[Dict[str, Any]]:
+            async with self._session(db) as session:
+                result = await session.execute(query, params)
+                return [dict(row._mapping) for row in result]
+
+        rows = await self._shared(self._query_key("rows", query, params), fetch)
+        # 呼び出し側が行を書き換えても他の処理に影響しないよう、共有時は行をコピーして返す
+        return rows if _shared_results.get() is None else [dict(row) for row in rows]
+
+    async def _stream_partitions(
+        self,
+        db: AsyncSession,
+        query,
+        params: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Tuple[List[str], Sequence[Row]]]:
+        """
+        サーバーサイドカーソルで結果を分割取得
+
+        全行を一度にクライアントへ展開せず、DATABASE_STREAM_PARTITION_SIZE件ずつ返す。
+
+        Yields:
+            (列名リスト, 行のパーティション)
+        """
+        async with self._session(db) as session:
+            result = await session.stream(query, params)
+            keys = list(result.keys())
+            async for partition in result.partitions(settings.DATABASE_STREAM_PARTITION_SIZE):
+                yield keys, partition
+
+    async def _stream_records(
+        self,
+        db: AsyncSession,
+        query,
+        record_type: Type[RecordMixin],
+        params: Optional[Dict[str, Any]] = None
+    ) -> RecordList:
+        """大きな結果をストリーミングで取得し、コンパクトなレコードのリストで返す（共有時はリストのみコピー）"""
+        async def fetch() -> RecordList:
+            records = RecordList(record_type)
+            build = None
+            async for keys, partition in self._stream_partitions(db, query, params):
+                if build is None:
+                    build = record_type.partition_builder(keys)
+                records.extend(build(partition))
+            return records
+
+        records = await self._shared(self._query_key(record_type.__name__, query, params), fetch)
+        return records if _shared_results.get() is None else records.copy()
+
+    async def _gather(self, *coros) -> List[Any]:
+        """独立した取得処理を並行実行（並行実行が無効な場合は順次実行）"""
+        if _query_slots.get() is None:
+            return [await coro for coro in coros]
+        return list(await asyncio.gather(*coros))
     
     async def fetch_data_by_intent(
         self, 
         intent: Dict[str, Any], 
         context: Dict[str, Any],
-        db: AsyncSession
-    ) -> Dict[str, Any]:
+        db: AsyncSession,
+        parallel: bool = True,
+        lazy: bool = False
+    ) -> Union[Dict[str, Any], LazyDbData]:
         """
         意図解析結果に基づいてデータを取得
         
@@ -26,10 +174,28 @@ class DatabaseService:
             intent: 意図解析結果
             context: 追加コンテキスト
             db: データベースセッション
+            parallel: 独立したクエリを別接続で並行実行するか
+            lazy: Trueの場合、カテゴリを初回アクセス時に取得するLazyDbDataを返す
             
         Returns:
             取得したデータ
         """
+        with self._query_scope(parallel):
+            result = await self._fetch_by_intent_type(intent, context, db)
+            if not isinstance(result, LazyDbData):
+                return LazyDbData(result) if lazy else result
+            if not lazy:
+                await result.load_all()
+                return result.to_dict()
+            return result
+
+    async def _fetch_by_intent_type(
+        self,
+        intent: Dict[str, Any],
+        context: Dict[str, Any],
+        db: AsyncSession
+    ) -> Union[Dict[str, Any], LazyDbData]:
+        """意図タイプに応じた取得処理を振り分け（配置提案系は取得元の登録のみ）"""
         intent_type = intent.get("intent_type")
         entities = intent.get("entities", {})
 
@@ -54,20 +220,20 @@ class DatabaseService:
             "process_name": process_name
         }
 
-        if intent_type == "delay_resolution":
-            data = await self._fetch_delay_resolution_data(location, process_name, db)
-            result.update(data)
-        elif intent_type == "deadline_optimization":
-            data = await self._fetch_deadline_optimization_data(location, process_name, db)
-            result.update(data)
+        if intent_type in self.DELAY_RESOLUTION_INTENTS:
+            # 配置提案系: 応答生成で実際に参照されたカテゴリだけを取得する
+            # Q3（業務間移動）・Q5（工程別最適化）は従来どおり4階層情報を含めない
+            initial = result if intent_type in ("delay_resolution", "deadline_optimization") else {}
+            data = LazyDbData(initial, concurrent=_query_slots.get() is not None)
+            self._add_delay_resolution_sources(data, location, db)
+            self._add_progress_source(
+                data, location, process_name, db, on_demand=not self.DELAY_RESOLUTION_INTENTS[intent_type]
+            )
+            return data
         elif intent_type == "completion_time_prediction":
             result = await self._fetch_completion_prediction_data(location, process_name, db)
         elif intent_type == "delay_risk_detection":
             result = await self._fetch_delay_risk_data(location, process_name, db)
-        elif intent_type == "cross_business_transfer":
-            result = await self._fetch_cross_business_transfer_data(location, process_name, db)
-        elif intent_type == "process_optimization":
-            result = await self._fetch_process_optimization_data(location, process_name, db)
         elif intent_type == "resource_allocation":
             result = await self._fetch_resource_allocation_data(location, process_name, db)
         elif intent_type == "status_check":
@@ -77,16 +243,188 @@ class DatabaseService:
 
         return result
     
-    async def _fetch_delay_resolution_data(
+    async def fetch_simulation_inputs(
+        self,
+        db: AsyncSession,
+        parallel: bool = True
+    ) -> Dict[str, Any]:
+        """
+        容量シミュレーション用のデータを取得
+
+        Args:
+            db: データベースセッション
+            parallel: 独立したクエリを別接続で並行実行するか
+
+        Returns:
+            現在の配置状況と進捗スナップショット
+        """
+        with self._query_scope(parallel):
+            current_assignments, progress_data = await self._gather(
+                self._fetch_current_assignments(db),
+                self._fetch_completion_prediction_data(None, None, db)
+            )
+        return {"current_assignments": current_assignments, **progress_data}
+
+    def _in_scope(self, loader: Callable[[], Awaitable[Dict[str, Any]]]) -> Callable[[], Awaitable[Dict[str, Any]]]:
+        """
+        現在のクエリ並行スコープを保持したローダーを返す
+
+        遅延取得はfetch_data_by_intentのスコープを抜けた後に実行されるため、
+        作成時の並行実行枠（セマフォ）を引き継いで実行する。
+        """
+        slots = _query_slots.get()
+
+        async def run() -> Dict[str, Any]:
+            token = _query_slots.set(slots)
+            try:
+                return await loader()
+            finally:
+                _query_slots.reset(token)
+
+        return run
+
+    def _add_delay_resolution_sources(self, data: LazyDbData, location: Optional[str], db: AsyncSession):
+        """遅延解決用カテゴリの取得元を登録 (login_records_by_locationから実データ取得)"""
+
+        async def load_assignments() -> Dict[str, Any]:
+            # 1. 最新のログイン状況から配置状況を取得
+            current_assignments = await self._fetch_current_assignments(db)
+            app_logger.info(f"配置状況取得: {len(current_assignments)}件 (最新スナップショット)")
+            return {"current_assignments": current_assignments}
+
+        data.add_source("assignments", ["current_assignments"], self._in_scope(load_assignments))
+
+        if settings.DATABASE_CONSOLIDATED_QUERIES:
+            # オペレータ×スキルの結合を1回のスキャンで集計・一覧・スキルマッチングに展開
+            async def load_capability_sets() -> Dict[str, Any]:
+                actual_data, operators_data, skill_matching_data = await self._fetch_operator_capability_sets(db)
+                return {
+                    **self._build_allocation_categories(actual_data),
+                    **self._build_operator_categories(operators_data),
+                    **self._build_skill_categories(skill_matching_data),
+                }
+
+            data.add_source(
+                "capability_sets",
+                self.ALLOCATION_CATEGORIES + self.OPERATOR_CATEGORIES + self.SKILL_CATEGORIES,
+                self._in_scope(load_capability_sets)
+            )
+        else:
+            async def load_allocation() -> Dict[str, Any]:
+                return self._build_allocation_categories(await self._fetch_actual_allocation(db))
+
+            async def load_operators() -> Dict[str, Any]:
+                return self._build_operator_categories(await self._fetch_available_operators(db))
+
+            async def load_skill_matching() -> Dict[str, Any]:
+                return self._build_skill_categories(await self._fetch_skill_matching(db))
+
+            data.add_source("allocation", self.ALLOCATION_CATEGORIES, self._in_scope(load_allocation))
+            data.add_source("operators", self.OPERATOR_CATEGORIES, self._in_scope(load_operators))
+            data.add_source("skill_matching", self.SKILL_CATEGORIES, self._in_scope(load_skill_matching))
+
+        # 4. 進捗スナップショット（活動状況の確認）
+        if location:
+            async def load_recent_snapshots() -> Dict[str, Any]:
+                return {"recent_alerts": await self._fetch_recent_snapshots(db)}
+
+            data.add_source("recent_snapshots", ["recent_alerts"], self._in_scope(load_recent_snapshots))
+
+    def _add_progress_source(
         self,
+        data: LazyDbData,
         location: Optional[str],
         process_name: Optional[str],
-        db: AsyncSession
-    ) -> Dict[str, Any]:
-        """遅延解決のためのデータ取得 (login_records_by_locationから実データ取得)"""
-        data = {}
+        db: AsyncSession,
+        on_demand: bool = False
+    ):
+        """進捗スナップショット（progress_snapshots）の取得元を登録（on_demand: load_all()の対象外）"""
+
+        async def load_progress() -> Dict[str, Any]:
+            return await self._fetch_completion_prediction_data(location, process_name, db)
+
+        data.add_source("progress", ["progress_snapshots"], self._in_scope(load_progress), on_demand=on_demand)
 
-        # 1. 最新のログイン状況から配置状況を取得
+    def _build_allocation_categories(self, actual_data: RecordList) -> Dict[str, Any]:
+        """拠点×業務×工程別の人数から余剰・不足候補を作成"""
+        # 実オペレータデータから余剰・不足を分析
+        surplus_locations = []
+        shortage_locations = []
+
+        for row in actual_data:
+            loc_name = row["location_name"]
+            process_name = row["process_name"]
+            business_name = row["business_name"]
+            count = row["operator_count"]
+            category = row["business_category"]
+            ocr_type = row["process_category"]
+
+            # 3名以上なら余剰候補
+            if count >= 3:
+                surplus_locations.append({
+                    "location_name": loc_name,
+                    "process_name": process_name,
+                    "business_name": business_name,
+                    "business_category": category,
+                    "process_category": ocr_type,
+                    "current_count": count,
+                    "surplus": count - 2
+                })
+            # 1名なら不足候補
+            elif count == 1:
+                shortage_locations.append({
+                    "location_name": loc_name,
+                    "process_name": process_name,
+                    "business_name": business_name,
+                    "business_category": category,
+                    "process_category": ocr_type,
+                    "current_count": count,
+                    "shortage": 1
+                })
+
+        app_logger.info(f"余剰候補: {len(surplus_locations)}件, 不足候補: {len(shortage_locations)}件")
+
+        # 余剰・不足の詳細ログ
+        app_logger.info(f"余剰TOP5: {[(s.get('location_name'), s.get('process_name'), s.get('surplus')) for s in surplus_locations[:5]]}")
+        app_logger.info(f"不足TOP5: {[(s.get('location_name'), s.get('process_name'), s.get('shortage')) for s in shortage_locations[:5]]}")
+
+        return {
+            "available_resources": surplus_locations,
+            "shortage_list": shortage_locations
+        }
+
+    def _build_operator_categories(self, operators_data: RecordList) -> Dict[str, Any]:
+        """主要工程のオペレータ一覧を拠点・工程別にグルーピング"""
+        # 各拠点・工程で利用可能なオペレータ (4階層情報を含む)
+        # 拠点×業務×OCR区分×工程別にオペレータをグルーピング (4階層対応)
+        # 4階層をキーに含める（各グループは元の行を共有するRecordList）
+        operators_by_location_process = operators_data.group_by(
+            "location_name", "business_category", "business_name", "process_category", "process_name"
+        )
+
+        # 後方互換性のため、(location, process)のキーも作成
+        operators_by_simple_key = operators_data.group_by("location_name", "process_name")
+
+        app_logger.info(f"オペレータデータ取得: {len(operators_data)}件")
+
+        return {
+            "operators_by_location_process": operators_by_simple_key,  # シンプルキー版
+            "operators_by_hierarchy": operators_by_location_process  # 4階層キー版
+        }
+
+    def _build_skill_categories(self, skill_matching_data: RecordList) -> Dict[str, Any]:
+        """スキル保有者を移動先候補工程別にグルーピング"""
+        # スキルベースマッチング用: 不足工程のスキルを持つオペレータの現在配置を取得
+        # 「エントリ1が不足」→「エントリ1のスキルを持つ人が、今どの工程に配置されているか」
+        # target_process (移動先候補工程) をキーにグルーピング
+        operators_by_target_skill = skill_matching_data.group_by("target_process_name")
+
+        app_logger.info(f"スキルベースマッチング: {len(skill_matching_data)}件のスキル保有データ")
+
+        return {"operators_by_target_skill": operators_by_target_skill}
+
+    async def _fetch_current_assignments(self, db: AsyncSession) -> List[Dict[str, Any]]:
+        """最新のログイン状況から配置状況を取得 (login_records_by_location)"""
         # 最新の1レコードのみを使用 (工程別にGROUP BY)
         assignment_query = text("""
             SELECT
@@ -108,13 +446,11 @@ class DatabaseService:
             ORDER BY process_name
         """)
 
-        result = await db.execute(assignment_query)
-        rows = result.fetchall()
+        rows = await self._execute(db, assignment_query)
 
         # データ整形
         current_assignments = []
-        for row in rows:
-            row_dict = dict(row._mapping)
+        for row_dict in rows:
             current_assignments.append({
                 "business_name": row_dict["business_name"],
                 "process_name": row_dict["process_name"],
@@ -127,10 +463,10 @@ class DatabaseService:
                 "total_today": row_dict["login_today"]
             })
 
-        data["current_assignments"] = current_assignments
-        app_logger.info(f"配置状況取得: {len(current_assignments)}件 (最新スナップショット)")
+        return current_assignments
 
-        # 2. 実オペレータデータから余剰・不足を分析
+    async def _fetch_actual_allocation(self, db: AsyncSession) -> RecordList:
+        """拠点×業務×工程別の有効オペレータ数を集計"""
         # operator_process_capabilitiesから拠点×業務×工程別の人数を集計
         actual_allocation_query = text("""
             SELECT
@@ -155,53 +491,10 @@ class DatabaseService:
                 b.business_category, p.process_name, l.location_name
         """)
 
-        result = await db.execute(actual_allocation_query)
-        actual_data = [dict(row._mapping) for row in result]
-
-        surplus_locations = []
-        shortage_locations = []
-
-        for row in actual_data:
-            loc_name = row["location_name"]
-            process_name = row["process_name"]
-            business_name = row["business_name"]
-            count = row["operator_count"]
-            category = row["business_category"]
-            ocr_type = row["process_category"]
-
-            # 3名以上なら余剰候補
-            if count >= 3:
-                surplus_locations.append({
-                    "location_name": loc_name,
-                    "process_name": process_name,
-                    "business_name": business_name,
-                    "business_category": category,
-                    "process_category": ocr_type,
-                    "current_count": count,
-                    "surplus": count - 2
-                })
-            # 1名なら不足候補
-            elif count == 1:
-                shortage_locations.append({
-                    "location_name": loc_name,
-                    "process_name": process_name,
-                    "business_name": business_name,
-                    "business_category": category,
-                    "process_category": ocr_type,
-                    "current_count": count,
-                    "shortage": 1
-                })
-
-        data["available_resources"] = surplus_locations
-        data["shortage_list"] = shortage_locations
-
-        app_logger.info(f"余剰候補: {len(surplus_locations)}件, 不足候補: {len(shortage_locations)}件")
-
-        # 余剰・不足の詳細ログ
-        app_logger.info(f"余剰TOP5: {[(s.get('location_name'), s.get('process_name'), s.get('surplus')) for s in surplus_locations[:5]]}")
-        app_logger.info(f"不足TOP5: {[(s.get('location_name'), s.get('process_name'), s.get('shortage')) for s in shortage_locations[:5]]}")
+        return await self._stream_records(db, actual_allocation_query, ProcessAllocation)
 
-        # 3. 各拠点・工程で利用可能なオペレータを取得 (4階層情報を含む)
+    async def _fetch_available_operators(self, db: AsyncSession) -> RecordList:
+        """主要工程を処理できる有効オペレータ一覧を取得 (4階層情報を含む)"""
         operators_query = text("""
             SELECT
                 o.operator_id,
@@ -222,39 +515,10 @@ class DatabaseService:
             ORDER BY l.location_name, b.business_category, b.business_name, p.process_category, p.process_name, o.operator_name
         """)
 
-        result = await db.execute(operators_query)
-        operators_data = [dict(row._mapping) for row in result]
-
-        # 拠点×業務×OCR区分×工程別にオペレータをグルーピング (4階層対応)
-        operators_by_location_process = {}
-        for op in operators_data:
-            # 4階層をキーに含める
-            key = (
-                op.get("location_name"),
-                op.get("business_category"),
-                op.get("business_name"),
-                op.get("process_category"),
-                op.get("process_name")
-            )
-            if key not in operators_by_location_process:
-                operators_by_location_process[key] = []
-            operators_by_location_process[key].append(op)
-
-        # 後方互換性のため、(location, process)のキーも作成
-        operators_by_simple_key = {}
-        for op in operators_data:
-            simple_key = (op.get("location_name"), op.get("process_name"))
-            if simple_key not in operators_by_simple_key:
-                operators_by_simple_key[simple_key] = []
-            operators_by_simple_key[simple_key].append(op)
+        return await self._stream_records(db, operators_query, OperatorCapability)
 
-        data["operators_by_location_process"] = operators_by_simple_key  # シンプルキー版
-        data["operators_by_hierarchy"] = operators_by_location_process  # 4階層キー版
-
-        app_logger.info(f"オペレータデータ取得: {len(operators_data)}件")
-
-        # 3-2. スキルベースマッチング用: 不足工程のスキルを持つオペレータの現在配置を取得
-        # 「エントリ1が不足」→「エントリ1のスキルを持つ人が、今どの工程に配置されているか」
+    async def _fetch_skill_matching(self, db: AsyncSession) -> RecordList:
+        """主要工程のスキル保有者と、その現在の担当工程を取得"""
         skill_matching_query = text("""
             SELECT
                 o.operator_id,
@@ -285,40 +549,166 @@ class DatabaseService:
             ORDER BY o.operator_id, p_target.process_name
         """)
 
-        result = await db.execute(skill_matching_query)
-        skill_matching_data = [dict(row._mapping) for row in result]
+        return await self._stream_records(db, skill_matching_query, SkillMatch)
 
-        # target_process (移動先候補工程) をキーにグルーピング
-        operators_by_target_skill = {}
-        for op in skill_matching_data:
-            target_process = op.get("target_process_name")
-            if target_process not in operators_by_target_skill:
-                operators_by_target_skill[target_process] = []
-            operators_by_target_skill[target_process].append(op)
-
-        data["operators_by_target_skill"] = operators_by_target_skill
-        app_logger.info(f"スキルベースマッチング: {len(skill_matching_data)}件のスキル保有データ")
+    async def _fetch_operator_capability_sets(
+        self,
+        db: AsyncSession
+    ) -> Tuple[RecordList, RecordList, RecordList]:
+        """
+        集計・オペレータ一覧・スキルマッチングを1回のクエリで取得
 
-        # 4. 進捗スナップショット（活動状況の確認）
-        if location:
-            snapshot_query = text("""
+        有効オペレータ×スキルの結合をCTEで1度だけ評価し、拠点×業務×工程別の集計行と
+        主要工程スキル保有者の全スキル行をUNION ALLで返す。一覧とスキルマッチング
+        （主要工程スキル×現在のスキルの組み合わせ）はPython側で展開する。
+
+        業務・工程マスタはLEFT JOINし、置き換え元の個別クエリと同じ行を返す:
+        集計はマスタのあるスキルのみ（INNER JOIN相当）、一覧は工程マスタのある主要工程スキル、
+        スキルマッチングは対象側のみ業務・工程マスタを必須とし、現在のスキル側はマスタがなくても残す。
+
+        Returns:
+            (_fetch_actual_allocation, _fetch_available_operators,
+             _fetch_skill_matching と同じ形式の結果)
+        """
+        consolidated_query = text("""
+            WITH cap AS (
                 SELECT
-                    snapshot_time,
-                    total_waiting,
-                    processing,
-                    entry_count,
-                    correction_waiting
-                FROM progress_snapshots
-                WHERE total_waiting > 0
-                ORDER BY snapshot_time DESC
-                LIMIT 10
-            """)
+                    o.operator_id,
+                    o.operator_name,
+                    l.location_name,
+                    b.business_category,
+                    b.business_name,
+                    p.process_category,
+                    p.process_name,
+                    opc.work_level,
+                    b.business_id IS NOT NULL AND p.process_id IS NOT NULL as has_master
+                FROM operators o
+                JOIN locations l ON o.location_id = l.location_id
+                JOIN operator_process_capabilities opc ON opc.operator_id = o.operator_id
+                LEFT JOIN businesses b ON b.business_id = opc.business_id
+                LEFT JOIN processes p ON p.business_id = opc.business_id AND p.process_id = opc.process_id
+                WHERE o.is_valid = 1
+            ),
+            allocation AS (
+                SELECT
+                    location_name,
+                    business_category,
+                    business_name,
+                    process_category,
+                    process_name,
+                    COUNT(DISTINCT operator_id) as operator_count
+                FROM cap
+                WHERE has_master
+                GROUP BY location_name, business_category, business_name, process_category, process_name
+            )
+            SELECT
+                'allocation' as dataset,
+                ROW_NUMBER() OVER (
+                    ORDER BY business_category, process_name, location_name
+                ) as sort_key,
+                NULL as operator_id,
+                NULL as operator_name,
+                location_name,
+                business_category,
+                business_name,
+                process_category,
+                process_name,
+                NULL as work_level,
+                operator_count
+            FROM allocation
+            UNION ALL
+            SELECT
+                'capability' as dataset,
+                ROW_NUMBER() OVER (
+                    ORDER BY location_name, business_category, business_name,
+                             process_category, process_name, operator_name
+                ) as sort_key,
+                operator_id,
+                operator_name,
+                location_name,
+                business_category,
+                business_name,
+                process_category,
+                process_name,
+                work_level,
+                NULL as operator_count
+            FROM cap
+            WHERE operator_id IN (
+                SELECT operator_id FROM cap
+                WHERE process_name IN ('エントリ1', 'エントリ2', '補正', 'SV補正', '目検')
+            )
+            ORDER BY dataset, sort_key
+        """)
+
+        actual_data = RecordList(ProcessAllocation)
+        capabilities = RecordList(OperatorCapability)
+        build_allocation = build_capability = None
+        async for keys, partition in self._stream_partitions(db, consolidated_query):
+            if build_allocation is None:
+                dataset_index = keys.index("dataset")
+                build_allocation = ProcessAllocation.partition_builder(keys)
+                build_capability = OperatorCapability.partition_builder(keys)
+            # 結果はdataset順に並ぶため、パーティション内の切り替わりは高々1回
+            allocation_rows = [row for row in partition if row[dataset_index] == "allocation"]
+            actual_data.extend(build_allocation(allocation_rows))
+            capabilities.extend(build_capability(partition[len(allocation_rows):]))
+
+        main_processes = {"エントリ1", "エントリ2", "補正", "SV補正", "目検"}
+
+        # 主要工程を処理できるオペレータ一覧（拠点・4階層・氏名順）
+        operators_data = capabilities.filter("process_name", main_processes)
+
+        # スキルマッチング: 主要工程スキル（レベル1以上、業務マスタあり）×そのオペレータの全スキル
+        # （現在のスキル側は_fetch_skill_matchingのLEFT JOINと同じくマスタのないスキルも含む）
+        capabilities_by_operator = capabilities.group_by("operator_id")
+
+        skill_matching_data = RecordList(SkillMatch)
+        for operator_id in sorted(capabilities_by_operator):
+            operator_caps = list(capabilities_by_operator[operator_id])
+            targets = sorted(
+                (cap for cap in operator_caps
+                 if cap.process_name in main_processes and cap.business_name is not None
+                and (cap.work_level or 0) >= 1),
+                key=lambda cap: cap.process_name
+            )
+            skill_matching_data.extend(
+                (
+                    operator_id,
+                    target.operator_name,
+                    target.location_name,
+                    target.business_category,
+                    target.business_name,
+                    target.process_category,
+                    target.process_name,
+                    current.business_category,
+                    current.business_name,
+                    current.process_category,
+                    current.process_name,
+                    target.work_level,
+                )
+                for target in targets
+                for current in operator_caps
+            )
+
+        return actual_data, operators_data, skill_matching_data
+
+    async def _fetch_recent_snapshots(self, db: AsyncSession) -> List[Dict[str, Any]]:
+        """滞留のある直近の進捗スナップショットを取得"""
+        snapshot_query = text("""
+            SELECT
+                snapshot_time,
+                total_waiting,
+                processing,
+                entry_count,
+                correction_waiting
+            FROM progress_snapshots
+            WHERE total_waiting > 0
+            ORDER BY snapshot_time DESC
+            LIMIT 10
+        """)
+
+        return await self._execute(db, snapshot_query)
 
-            result = await db.execute(snapshot_query)
-            data["recent_alerts"] = [dict(row._mapping) for row in result]
-        
-        return data
-    
     async def _fetch_resource_allocation_data(
         self,
         location: Optional[str],
@@ -349,15 +739,6 @@ class DatabaseService:
             LIMIT 20
         """)
         
-        result = await db.execute(
-            resource_overview_query,
-            {
-                "location": f"%{location}%" if location else None,
-                "process": f"%{process}%" if process else None
-            }
-        )
-        data["resource_overview"] = [dict(row._mapping) for row in result]
-        
         # 2. オペレータのスキル分布
         skill_distribution_query = text("""
             SELECT 
@@ -379,14 +760,14 @@ class DatabaseService:
             ORDER BY l.location_name, p.process_name, opc.work_level DESC
         """)
         
-        result = await db.execute(
-            skill_distribution_query,
-            {
-                "location": f"%{location}%" if location else None,
-                "process": f"%{process}%" if process else None
-            }
+        params = {
+            "location": f"%{location}%" if location else None,
+            "process": f"%{process_name}%" if process_name else None
+        }
+        data["resource_overview"], data["skill_distribution"] = await self._gather(
+            self._execute(db, resource_overview_query, params),
+            self._execute(db, skill_distribution_query, params)
         )
-        data["skill_distribution"] = [dict(row._mapping) for row in result]
         
         return data
     
@@ -417,11 +798,11 @@ class DatabaseService:
             ORDER BY l.location_name
         """)
         
-        result = await db.execute(
+        data["status_summary"] = await self._execute(
+            db,
             status_query,
             {"location": f"%{location}%" if location else None}
         )
-        data["status_summary"] = [dict(row._mapping) for row in result]
         
         return data
     
@@ -443,9 +824,6 @@ class DatabaseService:
             ORDER BY location_name
         """)
         
-        result = await db.execute(locations_query)
-        data["locations"] = [dict(row._mapping) for row in result]
-        
         # プロセス一覧
         processes_query = text("""
             SELECT DISTINCT
@@ -458,8 +836,10 @@ class DatabaseService:
             ORDER BY p.priority DESC, p.process_name
         """)
         
-        result = await db.execute(processes_query)
-        data["processes"] = [dict(row._mapping) for row in result]
+        data["locations"], data["processes"] = await self._gather(
+            self._execute(db, locations_query),
+            self._execute(db, processes_query)
+        )
         
         return data
     async def _fetch_completion_prediction_data(
@@ -489,8 +869,7 @@ class DatabaseService:
             LIMIT 10
         """)
 
-        result = await db.execute(query)
-        data["progress_snapshots"] = [dict(row._mapping) for row in result]
+        data["progress_snapshots"] = await self._execute(db, query)
 
         return data
 
@@ -503,55 +882,6 @@ class DatabaseService:
         """遅延リスク検出用のデータを取得"""
         return await self._fetch_completion_prediction_data(location, process_name, db)
 
-    async def _fetch_deadline_optimization_data(
-        self,
-        location: Optional[str],
-        process_name: Optional[str],
-        db: AsyncSession
-    ) -> Dict[str, Any]:
-        """納期最適化用のデータを取得"""
-        data = await self._fetch_delay_resolution_data(location, process_name, db)
-
-        # progress_snapshotsも追加
-        progress_data = await self._fetch_completion_prediction_data(location, process_name, db)
-        data.update(progress_data)
-
-        return data
-
-    async def _fetch_cross_business_transfer_data(
-        self,
-        location: Optional[str],
-        process_name: Optional[str],
-        db: AsyncSession
-    ) -> Dict[str, Any]:
-        """業務間移動（Q3）用のデータを取得"""
-
-        # Q3では配置提案が必要なので、delay_resolution_dataを取得
-        data = await self._fetch_delay_resolution_data(location, process_name, db)
-
-        # 進捗スナップショットも追加
-        progress_data = await self._fetch_completion_prediction_data(location, process_name, db)
-        data.update(progress_data)
-
-        return data
-
-    async def _fetch_process_optimization_data(
-        self,
-        location: Optional[str],
-        process_name: Optional[str],
-        db: AsyncSession
-    ) -> Dict[str, Any]:
-        """工程別最適化（Q5）用のデータを取得"""
-
-        # Q5でも配置提案が必要なので、delay_resolution_dataを取得
-        data = await self._fetch_delay_resolution_data(location, process_name, db)
-
-        # 進捗スナップショットも追加
-        progress_data = await self._fetch_completion_prediction_data(location, process_name, db)
-        data.update(progress_data)
-
-        return data
-
     async def _fetch_process_optimization_data_old(
         self,
         location: Optional[str],
@@ -3,14 +3,24 @@
 意図解析、データベース照会、レスポンス生成を統合
 """
 import json
-from typing import Dict, Any, Optional, List
+from contextlib import nullcontext
+from typing import Dict, Any, Optional, List, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 
+from app.core.config import settings
 from app.core.logging import app_logger
 from app.services.ollama_service import OllamaService
 from app.services.database_service import DatabaseService
+from app.services.lazy_db_data import LazyDbData
+from app.services.chroma_connection import chroma_connection
 from app.services.chroma_service import ChromaService
+from app.services.capacity_simulator import CapacitySimulator
+from app.db.query_log import capture_queries
+
+
+# 管理者ルール検索でメッセージ本文とは別にクエリとするエンティティ
+RAG_ENTITY_KEYS = ("location", "business_name", "process_name")
 
 
 class IntegratedLLMService:
@@ -19,16 +29,69 @@ class IntegratedLLMService:
     def __init__(self):
         self.ollama_service = OllamaService()
         self.db_service = DatabaseService()
-        # ChromaServiceは遅延初期化（最初の使用時に初期化）
-        self._chroma_service = None
-        self._chroma_initialized = False
-    
+        self.capacity_simulator = CapacitySimulator()
+
+    def _get_chroma_service(self) -> Optional[ChromaService]:
+        """
+        接続中のChromaService（接続断中は待たずにNone、再接続はバックグラウンドで行う）
+        非同期処理から呼ばれるため初回接続も待たない（待つ場合は先にchroma_connection.wait_first_attempt()を呼ぶ）
+        """
+        return chroma_connection.get_service(wait=False)
+
+    @staticmethod
+    def build_rag_queries(message: str, entities: Optional[Dict[str, Any]] = None) -> List[str]:
+        """
+        管理者ルール検索のクエリ一覧
+
+        メッセージ本文に加え、拠点・業務・工程ごとのクエリを作る
+        （複数の拠点・工程を含む依頼で、本文の埋め込みだけでは拾えないルールを補うため）
+        """
+        queries = [message]
+        for key in RAG_ENTITY_KEYS:
+            values = (entities or {}).get(key)
+            for value in values if isinstance(values, list) else [values]:
+                if value and value != "不明":
+                    queries.append(str(value))
+        return list(dict.fromkeys(queries))
+
+    def search_manager_rules(
+        self,
+        requests: List[Tuple[str, Optional[Dict[str, Any]]]]
+    ) -> Optional[List[List[Dict[str, Any]]]]:
+        """
+        複数の依頼の管理者ルールを1回の一括検索で取得
+
+        Args:
+            requests: (メッセージ, エンティティ)のリスト
+
+        Returns:
+            依頼ごとの管理者ルール（本文の結果を優先し、エンティティの結果で補ってTOP_K_RESULTS件まで）。
+            ChromaDB未接続の場合はNone
+        """
+        chroma_service = self._get_chroma_service()
+        if chroma_service is None:
+            return None
+
+        query_lists = [self.build_rag_queries(message, entities) for message, entities in requests]
+        results = iter(chroma_service.search_manager_rules_batch(
+            [query for queries in query_lists for query in queries]
+        ))
+        merged = []
+        for queries in query_lists:
+            rules: Dict[str, Dict[str, Any]] = {}
+            for query_rules in [next(results) for _ in queries]:
+                for rule in query_rules:
+                    rules.setdefault(rule.get("rule_text"), rule)
+            merged.append(list(rules.values())[:settings.TOP_K_RESULTS])
+        return merged
+
     async def process_message(
         self,
         message: str,
         context: Optional[Dict[str, Any]] = None,
         db: Optional[AsyncSession] = None,
-        detail: bool = False
+        detail: bool = False,
+        manager_rules: Optional[List[Dict[str, Any]]] = None
     ) -> Dict[str, Any]:
         """
         メッセージを処理して適切な応答を生成
@@ -38,6 +101,7 @@ class IntegratedLLMService:
             context: 追加コンテキスト情報
             db: データベースセッション
             detail: デバッグ情報を含めるかどうか
+            manager_rules: 一括検索済みの管理者ルール（指定時はRAG検索を行わない）
             
         Returns:
             処理結果（応答、提案、メタデータ、デバッグ情報を含む）
@@ -64,39 +128,28 @@ class IntegratedLLMService:
         # ステップ2: RAG検索（関連情報の取得）
         rag_results = {}
         try:
-            # ChromaServiceを遅延初期化
-            if not self._chroma_initialized:
-                try:
-                    self._chroma_service = ChromaService()
-                    self._chroma_initialized = True
-                    app_logger.info("ChromaDB初期化成功")
-                except Exception as e:
-                    app_logger.warning(f"ChromaDB初期化失敗: {e}")
-                    self._chroma_service = None
-                    self._chroma_initialized = True  # 再試行しない
-
-            if self._chroma_service:
-                entities = intent.get("entities", {})
-                business_id = entities.get("business_id", "523201")
-                process_id = entities.get("process_id")
-                location_id = entities.get("location")
-
-                # 管理者ノウハウ・判断基準を検索
-                manager_rules = self._chroma_service.search_manager_rules(
-                    query_text=message,
-                    n_results=5
-                )
+            prefetched = manager_rules is not None
+            if not prefetched:
+                # 本文と拠点・業務・工程ごとのクエリを1回の一括検索で取得
+                # （類似度閾値・重複除去・トークン予算で絞り込み、最大TOP_K_RESULTS件）
+                await chroma_connection.wait_first_attempt()
+                searched = self.search_manager_rules([(message, intent.get("entities"))])
+                manager_rules = searched[0] if searched is not None else None
+
+            if manager_rules is not None:
                 rag_results["manager_rules"] = manager_rules
                 app_logger.info(f"管理者ルール検索完了: {len(manager_rules)}件")
 
                 if detail:
                     debug_info["step2_rag_search"] = {
                         "query_text": message,
+                        "prefetched": prefetched,
                         "manager_rules_count": len(manager_rules),
-                        "manager_rules": [r.get("title") for r in manager_rules]
+                        "manager_rules": [r.get("title") for r in manager_rules],
+                        "manager_rules_similarity": [r.get("similarity") for r in manager_rules]
                     }
             else:
-                app_logger.info("ChromaDB未初期化のためRAG検索スキップ")
+                app_logger.info(f"ChromaDB未接続のためRAG検索スキップ（{chroma_connection.state}）")
 
         except Exception as e:
             app_logger.error(f"RAG search error: {str(e)}")
@@ -104,32 +157,27 @@ class IntegratedLLMService:
                 debug_info["step2_rag_search"] = {"error": str(e)}
 
         # ステップ3: データベース照会（dbが提供されている場合）
-        db_data = {}
+        db_data = LazyDbData()
         executed_queries = []
 
         if db and intent.get("intent_type") != "error":
             try:
-                if detail:
-                    # クエリ実行を監視
-                    original_execute = db.execute
-                    
-                    async def monitored_execute(query, params=None):
-                        query_str = str(query)
-                        executed_queries.append({
-                            "sql": query_str,
-                            "params": params,
-                            "intent_type": intent.get("intent_type")
-                        })
-                        return await original_execute(query, params)
-                    
-                    db.execute = monitored_execute
-                
-                db_data = await self.db_service.fetch_data_by_intent(
-                    intent, 
-                    context or {}, 
-                    db
+                # デバッグ時は実行クエリをエンジンのイベントで記録（並行サブクエリも含む）
+                with (capture_queries() if detail else nullcontext(executed_queries)) as executed_queries:
+                    # カテゴリは提案・応答生成で参照された時点で取得する
+                    db_data = await self.db_service.fetch_data_by_intent(
+                        intent, 
+                        context or {}, 
+                        db,
+                        lazy=True
+                    )
+                    if detail:
+                        # デバッグ出力では全カテゴリと実行クエリを表示するため即時取得
+                        await db_data.load_all()
+                app_logger.info(
+                    f"Database query returned {len(db_data)} data categories "
+                    f"({len(db_data.deferred_categories)} deferred)"
                 )
-                app_logger.info(f"Database query returned {len(db_data)} data categories")
                 
                 if detail:
                     debug_info["step2_database_queries"] = {
@@ -146,7 +194,7 @@ class IntegratedLLMService:
                     
             except Exception as e:
                 app_logger.error(f"Database query error: {str(e)}")
-                db_data = {"error": str(e)}
+                db_data = LazyDbData({"error": str(e)})
                 if detail:
                     debug_info["step3_database_queries"] = {
                         "error": str(e),
@@ -181,7 +229,8 @@ class IntegratedLLMService:
                 }
 
         # ステップ5: 最終レスポンス生成（RAG結果も含める）
-        response_context = self._prepare_response_context(intent, db_data, context, rag_results)
+        # レスポンスコンテキストはLLM応答とデバッグ出力でのみ使用する
+        response_context = None
 
         # intent_typeに応じて応答を生成
         intent_type = intent.get("intent_type")
@@ -195,6 +244,9 @@ class IntegratedLLMService:
             response_text = self._generate_simple_response(suggestion)
             app_logger.info(f"シンプル応答生成（LLMスキップ）: {len(suggestion.get('changes', []))}件")
         else:
+            # LLMプロンプトは全カテゴリを要約するため、未取得分をここで取得
+            await db_data.load_all()
+            response_context = self._prepare_response_context(intent, db_data, context, rag_results)
             response_text = await self.ollama_service.generate_response(
                 message,
                 intent,
@@ -208,6 +260,8 @@ class IntegratedLLMService:
         response_type = self._classify_response_type(response_text)
         
         if detail:
+            if response_context is None:
+                response_context = self._prepare_response_context(intent, db_data, context, rag_results)
             debug_info["step5_response_generation"] = {
                 "response_context": response_context,
                 "response_length": len(response_text),
@@ -231,6 +285,7 @@ class IntegratedLLMService:
                 "timestamp": datetime.now().isoformat(),
                 "data_sources": list(db_data.keys()) + ["rag_search", "manager_rules"],
                 "has_db_data": bool(db_data and not db_data.get("error")),
+                "db_categories": db_data.metadata(),
                 "has_rag_data": bool(rag_results),
                 "has_manager_rules": bool(rag_results.get("manager_rules")),
                 "response_type": response_type
@@ -252,7 +307,7 @@ class IntegratedLLMService:
     async def _generate_suggestion(
         self,
         intent: Dict[str, Any],
-        db_data: Dict[str, Any],
+        db_data: LazyDbData,
         context: Optional[Dict[str, Any]] = None,
         rag_results: Optional[Dict[str, Any]] = None
     ) -> Optional[Dict[str, Any]]:
@@ -277,12 +332,13 @@ class IntegratedLLMService:
     async def _generate_delay_resolution_suggestion(
         self,
         intent: Dict[str, Any],
-        db_data: Dict[str, Any],
+        db_data: LazyDbData,
         context: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """遅延解決の提案を生成 (実データベース)"""
 
         # 余剰リソースと不足リソースを取得
+        await db_data.load("available_resources", "shortage_list", "operators_by_location_process")
         available_resources = db_data.get("available_resources", [])
         shortage_list = db_data.get("shortage_list", [])
         operators_by_location_process = db_data.get("operators_by_location_process", {})
@@ -344,7 +400,7 @@ class IntegratedLLMService:
                 process_name = resource.get("process_name")
 
                 # 該当工程のスキル保有者を取得
-                operators_by_target_skill = db_data.get("operators_by_target_skill", {})
+                operators_by_target_skill = await db_data.aget("operators_by_target_skill", {})
                 skill_holders = operators_by_target_skill.get(process_name, [])
 
                 # オペレータを選定（ランダムに2人）
@@ -445,7 +501,7 @@ class IntegratedLLMService:
 
                             # この拠点・工程のオペレータを取得 (4階層対応)
                             # まず4階層キーで取得を試みる
-                            operators_by_hierarchy = db_data.get("operators_by_hierarchy", {})
+                            operators_by_hierarchy = await db_data.aget("operators_by_hierarchy", {})
 
                             # 4階層キーで検索
                             key_4layer = (from_loc, resource_category, resource_business, resource_ocr, shortage_process)
@@ -497,17 +553,26 @@ class IntegratedLLMService:
 
         app_logger.info(f"提案生成完了: {len(changes)}件の配置転換")
 
+        # 容量シミュレーションで影響を算出（滞留データがない場合は不明）
+        simulation = None
+        if changes:
+            await db_data.load("current_assignments")
+            if not await db_data.aget("progress_snapshots"):
+                await db_data.load("recent_alerts")
+            simulation = await self.capacity_simulator.score_plan(changes, db_data)
+
         # 提案をまとめる
         suggestion = {
             "id": f"SGT{datetime.now().strftime('%Y%m%d-%H%M%S')}",
             "changes": changes,
-            "impact": {
-                "productivity": f"+{len(changes) * 10}%" if changes else "+0%",
-                "delay": f"-{len(changes) * 15}分" if changes else "-0分",
+            "impact": self.capacity_simulator.format_impact(simulation) if changes else {
+                "productivity": "+0%",
+                "delay": "-0分",
                 "quality": "維持"
             },
             "reason": self._generate_suggestion_reason(changes, 85.0),
-            "confidence_score": 0.85 if changes else 0.5
+            "confidence_score": 0.85 if changes else 0.5,
+            "simulation": simulation
         }
 
         return suggestion
@@ -515,7 +580,7 @@ class IntegratedLLMService:
     async def _generate_resource_allocation_suggestion(
         self,
         intent: Dict[str, Any],
-        db_data: Dict[str, Any],
+        db_data: LazyDbData,
         context: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """リソース配分の提案を生成"""
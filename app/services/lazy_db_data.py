@@ -0,0 +1,147 @@
+"""
+遅延取得db_dataコンテナ
+カテゴリ単位で初回アクセス時にデータを取得し、結果をメモ化する
+"""
+import asyncio
+from collections.abc import Mapping
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from app.core.logging import app_logger
+
+
+Loader = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+class LazyDbData(Mapping):
+    """
+    カテゴリを遅延取得するdb_data
+
+    1つのソース（クエリ群）が複数カテゴリを返すため、取得はソース単位で行う。
+    同じソースへの同時アクセスは1つのタスクを共有し、取得は1回だけ実行される。
+    同期アクセス（get / [] / items）は取得済みカテゴリのみを返すため、
+    利用側は await load() / aget() で必要なカテゴリを先に取得する。
+    """
+
+    def __init__(self, data: Optional[Dict[str, Any]] = None, concurrent: bool = True):
+        """
+        Args:
+            data: 取得済みのカテゴリ（即時値）
+            concurrent: ソースを並行取得するか（同一セッションを共有する場合はFalse）
+        """
+        self._data: Dict[str, Any] = dict(data or {})
+        self._sources: Dict[str, Tuple[Tuple[str, ...], Loader]] = {}
+        self._on_demand: List[str] = []
+        self._category_source: Dict[str, str] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._loaded_sources: List[str] = []
+        self._errors: Dict[str, str] = {}
+        self._lock = None if concurrent else asyncio.Lock()
+
+    def add_source(self, name: str, categories: Sequence[str], loader: Loader, on_demand: bool = False):
+        """
+        カテゴリの取得元を登録
+
+        Args:
+            name: ソース名
+            categories: ソースが返すカテゴリ
+            loader: カテゴリ名→値の辞書を返す非同期関数
+            on_demand: Trueの場合、load_all()では取得せずload()/aget()で指定されたときのみ取得する
+        """
+        self._sources[name] = (tuple(categories), loader)
+        if on_demand:
+            self._on_demand.append(name)
+        for category in categories:
+            self._category_source[category] = name
+
+    # ---- Mapping（取得済みカテゴリのみ） ----
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._data:
+            return self._data[key]
+        if key in self._category_source:
+            app_logger.warning(f"未取得のカテゴリへの同期アクセス: {key}（await load()が必要）")
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __bool__(self) -> bool:
+        return bool(self._data) or bool(self._category_source)
+
+    # ---- 非同期取得 ----
+
+    async def load(self, *categories: str):
+        """指定カテゴリを取得（取得済み・取得中のソースは再実行しない）"""
+        sources = []
+        for category in categories:
+            source = self._category_source.get(category)
+            if source and source not in sources:
+                sources.append(source)
+        await self._load_sources(sources)
+
+    async def load_all(self):
+        """全カテゴリを取得（on_demandのソースを除く）"""
+        await self._load_sources([source for source in self._sources if source not in self._on_demand])
+
+    async def aget(self, category: str, default: Any = None) -> Any:
+        """カテゴリを取得して返す"""
+        await self.load(category)
+        return self._data.get(category, default)
+
+    async def _load_sources(self, sources: List[str]):
+        tasks = []
+        for source in sources:
+            task = self._tasks.get(source)
+            if task is None:
+                task = self._tasks[source] = asyncio.ensure_future(self._run(source))
+            tasks.append(task)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def _run(self, source: str):
+        categories, loader = self._sources[source]
+        try:
+            if self._lock is None:
+                values = await loader()
+            else:
+                async with self._lock:
+                    values = await loader()
+        except Exception as e:
+            # 取得失敗は従来どおりerrorカテゴリとして扱い、応答生成は継続する
+            app_logger.error(f"Database query error ({source}): {str(e)}")
+            self._errors[source] = str(e)
+            self._data.setdefault("error", str(e))
+            return
+
+        for category in categories:
+            if category in values:
+                self._data[category] = values[category]
+        self._loaded_sources.append(source)
+
+    # ---- メタデータ ----
+
+    @property
+    def loaded_categories(self) -> List[str]:
+        """取得済みのカテゴリ"""
+        return [category for category in self._data if category != "error"]
+
+    @property
+    def deferred_categories(self) -> List[str]:
+        """利用可能だが取得されなかったカテゴリ"""
+        return [category for category in self._category_source if category not in self._data]
+
+    def metadata(self) -> Dict[str, Any]:
+        """どのカテゴリ・ソースが実際に取得されたか"""
+        return {
+            "loaded_categories": self.loaded_categories,
+            "deferred_categories": self.deferred_categories,
+            "loaded_sources": list(self._loaded_sources),
+            "failed_sources": dict(self._errors),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """取得済みカテゴリを通常の辞書で返す"""
+        return dict(self._data)
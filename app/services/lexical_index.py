@@ -0,0 +1,244 @@
+"""
+字句インデックス
+日本語の文字bigram/trigram転置インデックスによるBM25検索（ネットワーク不要）
+"""
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.logging import app_logger
+from app.services.local_vector_index import metadata_matches
+
+
+NGRAM_SIZES = (2, 3)
+
+# 句読点・括弧類で区切る（「新SS(W)」の半角括弧は語の一部として残す）
+_SEGMENT_SEPARATORS = re.compile(r"[\s、。，,．・「」『』【】:：/]+")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """
+    テキストを文字bigram/trigramに分割
+
+    NFKC正規化（全角英数・括弧を半角に統一）と小文字化を行い、区切り文字で分けた
+    セグメントごとにn-gramを作成する。1文字のセグメントはそのまま1語とする。
+    """
+    normalized = unicodedata.normalize("NFKC", text or "").lower()
+    terms = []
+    for segment in _SEGMENT_SEPARATORS.split(normalized):
+        if not segment:
+            continue
+        if len(segment) == 1:
+            terms.append(segment)
+            continue
+        for n in NGRAM_SIZES:
+            terms.extend(segment[i:i + n] for i in range(len(segment) - n + 1))
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    複数のランキングをReciprocal Rank Fusionで統合
+
+    Args:
+        rankings: ID順位リストのリスト（先頭が最上位）
+        k: 順位の平滑化定数
+
+    Returns:
+        (ID, スコア)のリスト（スコア降順、同点は最初に現れたランキング順）
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalIndex:
+    """
+    チャンクのBM25転置インデックス
+
+    - ChromaDBと同じチャンク（ID・ドキュメント・メタデータ）を保持し、upsert/deleteで差分更新する
+    - 転置インデックスは読み込み時に再構築し、ファイルにはチャンクのみ保存する
+    - 別プロセス（投入スクリプト）がファイルを更新した場合は次回検索時に再読込する
+    """
+
+    def __init__(self, path: Optional[str] = None, k1: float = 1.2, b: float = 0.75):
+        """
+        Args:
+            path: インデックスファイルのパス
+            k1: BM25の語頻度飽和パラメータ
+            b: BM25の文書長正規化パラメータ
+        """
+        self.path = Path(path or settings.LEXICAL_INDEX_PATH)
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.RLock()
+        self._documents: Dict[str, str] = {}
+        self._metadatas: Dict[str, Dict[str, Any]] = {}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._dirty = False
+        self._loaded_mtime: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @property
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    # ---- 更新 ----
+
+    def upsert(self, chunks: List[Dict[str, Any]]):
+        """チャンクを追加・置き換え（ChromaService.upsert_batchと同じ形式）"""
+        with self._lock:
+            for chunk in chunks:
+                self._remove(chunk["id"])
+                terms = Counter(tokenize(chunk["document"]))
+                self._documents[chunk["id"]] = chunk["document"]
+                self._metadatas[chunk["id"]] = chunk.get("metadata") or {}
+                self._doc_terms[chunk["id"]] = terms
+                self._doc_lengths[chunk["id"]] = sum(terms.values())
+                self._total_length += self._doc_lengths[chunk["id"]]
+                for term, count in terms.items():
+                    self._postings.setdefault(term, {})[chunk["id"]] = count
+            self._dirty = True
+
+    def delete(self, ids: List[str]):
+        """チャンクを削除（存在しないIDは無視）"""
+        with self._lock:
+            for chunk_id in ids:
+                self._remove(chunk_id)
+            self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._documents, self._metadatas, self._doc_terms, self._doc_lengths, self._postings = {}, {}, {}, {}, {}
+            self._total_length = 0
+            self._dirty = True
+
+    def _remove(self, chunk_id: str):
+        terms = self._doc_terms.pop(chunk_id, None)
+        if terms is None:
+            return
+        self._documents.pop(chunk_id, None)
+        self._metadatas.pop(chunk_id, None)
+        self._total_length -= self._doc_lengths.pop(chunk_id)
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    # ---- 永続化 ----
+
+    def save(self):
+        """チャンクをファイルに保存（一時ファイルに書いてから置き換え）"""
+        with self._lock:
+            payload = {
+                chunk_id: [self._documents[chunk_id], self._metadatas[chunk_id]]
+                for chunk_id in self._documents
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            temp_path.write_text(json.dumps({"chunks": payload}, ensure_ascii=False), encoding="utf-8")
+            os.replace(temp_path, self.path)
+            self._loaded_mtime = self.path.stat().st_mtime_ns
+            self._dirty = False
+        app_logger.info(f"字句インデックス保存: {len(payload)}件 ({self.path})")
+
+    def load(self) -> bool:
+        """ファイルから読み込み、転置インデックスを再構築"""
+        if not self.exists:
+            return False
+        mtime = self.path.stat().st_mtime_ns
+        payload = json.loads(self.path.read_text(encoding="utf-8"))
+        with self._lock:
+            self.clear()
+            self.upsert([
+                {"id": chunk_id, "document": document, "metadata": metadata}
+                for chunk_id, (document, metadata) in payload["chunks"].items()
+            ])
+            self._loaded_mtime = mtime
+            self._dirty = False
+        app_logger.info(f"字句インデックス読込: {len(self)}件, {len(self._postings)}語")
+        return True
+
+    def reload_if_changed(self):
+        """別プロセスがファイルを更新していれば再読込（未保存の変更がある場合は再読込しない）"""
+        if self._dirty or not self.exists:
+            return
+        try:
+            if self.path.stat().st_mtime_ns != self._loaded_mtime:
+                self.load()
+        except Exception as e:
+            app_logger.warning(f"字句インデックス再読込エラー: {e}")
+
+    # ---- 検索 ----
+
+    def get(self, chunk_id: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        """チャンクのドキュメントとメタデータ"""
+        return self._documents.get(chunk_id), self._metadatas.get(chunk_id, {})
+
+    def search(
+        self,
+        query_text: str,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        BM25で検索
+
+        Args:
+            query_text: 検索クエリ
+            n_results: 取得する結果数
+            where: メタデータフィルタ（ChromaDBと同じ形式）
+
+        Returns:
+            (チャンクID, BM25スコア)のリスト（スコア降順）
+        """
+        query_terms = Counter(tokenize(query_text))
+        with self._lock:
+            total_documents = len(self._documents)
+            if not total_documents or not query_terms:
+                return []
+            average_length = self._total_length / total_documents
+
+            scores: Dict[str, float] = {}
+            for term, query_count in query_terms.items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total_documents - len(postings) + 0.5) / (len(postings) + 0.5))
+                weight = query_count * idf * (self.k1 + 1)
+                for chunk_id, count in postings.items():
+                    length_norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[chunk_id] / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + weight * count / (count + length_norm)
+
+            if where:
+                scores = {
+                    chunk_id: score for chunk_id, score in scores.items()
+                    if metadata_matches(self._metadatas[chunk_id], where)
+                }
+        return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "documents": len(self._documents),
+            "terms": len(self._postings),
+            "unsaved_changes": self._dirty,
+        }
@@ -0,0 +1,315 @@
+"""
+ローカルベクトルインデックス
+小規模で頻繁に検索されるコレクションをプロセス内で全件探索する
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.logging import app_logger
+
+
+def metadata_matches(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """
+    ChromaDBのwhere句（$and/$or/$eq/$ne/$in/$nin/$gt/$gte/$lt/$lte）をメタデータに適用
+
+    キーが存在しない場合、$ne・$ninは一致、それ以外は不一致として扱う（ChromaDBと同じ挙動）
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(metadata_matches(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(metadata_matches(metadata, sub) for sub in condition):
+                return False
+            continue
+
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        present = key in metadata
+        value = metadata.get(key)
+        for operator, operand in condition.items():
+            if operator == "$ne":
+                matched = not present or value != operand
+            elif operator == "$nin":
+                matched = not present or value not in operand
+            elif not present:
+                matched = False
+            elif operator == "$eq":
+                matched = value == operand
+            elif operator == "$in":
+                matched = value in operand
+            elif operator == "$gt":
+                matched = value > operand
+            elif operator == "$gte":
+                matched = value >= operand
+            elif operator == "$lt":
+                matched = value < operand
+            elif operator == "$lte":
+                matched = value <= operand
+            else:
+                raise ValueError(f"ローカルインデックスで未対応の演算子: {operator}")
+            if not matched:
+                return False
+    return True
+
+
+class LocalVectorIndex:
+    """
+    1コレクション分の埋め込みをメモリマップしたNumPy行列で保持するインデックス
+
+    - 埋め込み行列は {LOCAL_VECTOR_INDEX_DIR}/{コレクション名}.npy に保存し、mmapで読み込む
+      （ID・ドキュメント・メタデータは同名の.jsonに保存）
+    - 検索は全件の内積による総当たり（数十〜数千件では近似索引より高速）
+    - 距離はコレクションの距離空間（l2 / cosine / ip）でChromaDBと同じ値を返す
+    - 一定間隔でコレクションのフィンガープリントを確認し、変わっていればバックグラウンドで再構築する
+    """
+
+    def __init__(
+        self,
+        collection,
+        index_dir: Optional[str] = None,
+        refresh_seconds: Optional[int] = None,
+        max_documents: Optional[int] = None
+    ):
+        """
+        Args:
+            collection: 元データのChromaDBコレクション
+            index_dir: インデックスファイルの保存先
+            refresh_seconds: 更新確認の間隔（秒）
+            max_documents: ローカルで保持する最大件数（超える場合はリモート検索にフォールバック）
+        """
+        self.collection = collection
+        self.name = collection.name
+        self.index_dir = Path(index_dir or settings.LOCAL_VECTOR_INDEX_DIR)
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else settings.LOCAL_VECTOR_INDEX_REFRESH_SECONDS
+        self.max_documents = max_documents or settings.LOCAL_VECTOR_INDEX_MAX_DOCUMENTS
+
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._refreshing = False
+        self._stale = False
+        self._checked_at = 0.0
+        self._oversized_at: Optional[float] = None
+        self._masks: Dict[str, np.ndarray] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._sq_norms: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self.fingerprint: Optional[str] = None
+        self.space = "l2"
+
+        self._load_from_disk()
+
+    @property
+    def ready(self) -> bool:
+        return self._matrix is not None
+
+    @property
+    def _matrix_path(self) -> Path:
+        return self.index_dir / f"{self.name}.npy"
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.index_dir / f"{self.name}.json"
+
+    def _load_from_disk(self):
+        """保存済みのインデックスを読み込む（ネットワーク不要）"""
+        if not (self._matrix_path.exists() and self._meta_path.exists()):
+            return
+        try:
+            meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+            matrix = np.load(self._matrix_path, mmap_mode="r")
+            self._install(matrix, meta)
+            app_logger.info(f"ローカルベクトルインデックス読込: {self.name} ({len(self._ids)}件)")
+        except Exception as e:
+            app_logger.warning(f"ローカルベクトルインデックスを読み込めません ({self.name}): {e}")
+
+    def _install(self, matrix: np.ndarray, meta: Dict[str, Any]):
+        """読み込んだ行列とメタデータを検索用に差し替え"""
+        sq_norms = np.einsum("ij,ij->i", matrix, matrix) if len(matrix) else np.zeros(0, dtype=np.float32)
+        with self._lock:
+            self._matrix = matrix
+            self._sq_norms = sq_norms
+            self._ids = meta["ids"]
+            self._positions = {chunk_id: i for i, chunk_id in enumerate(meta["ids"])}
+            self._documents = meta["documents"]
+            self._metadatas = meta["metadatas"]
+            self.fingerprint = meta["fingerprint"]
+            self.space = meta.get("space", "l2")
+            self._masks = {}
+            self._stale = False
+
+    def _space(self) -> str:
+        """コレクションの距離空間（l2 / cosine / ip）"""
+        configuration = getattr(self.collection, "configuration_json", None) or {}
+        hnsw = configuration.get("hnsw") or {}
+        return hnsw.get("space") or (self.collection.metadata or {}).get("hnsw:space", "l2")
+
+    def _remote_fingerprint(self) -> str:
+        """コレクションのID・メタデータから変更検知用のフィンガープリントを作成"""
+        page = self.collection.get(include=["metadatas"])
+        digest = hashlib.sha256()
+        for chunk_id, metadata in sorted(zip(page["ids"], page["metadatas"]), key=lambda item: item[0]):
+            digest.update(chunk_id.encode("utf-8"))
+            digest.update(json.dumps(metadata, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+        return f"{len(page['ids'])}:{digest.hexdigest()}"
+
+    def rebuild(self):
+        """ChromaDBから全件を取得してインデックスを再構築"""
+        with self._rebuild_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        count = self.collection.count()
+        if count > self.max_documents:
+            self._oversized_at = time.monotonic()
+            raise ValueError(f"{self.name}: {count}件はローカルインデックスの上限({self.max_documents}件)を超えています")
+
+        self._oversized_at = None
+        fingerprint = self._remote_fingerprint()
+        data = self.collection.get(include=["documents", "metadatas", "embeddings"])
+        embeddings = data["embeddings"]
+        matrix = np.asarray(embeddings if len(embeddings) else np.zeros((0, 0)), dtype=np.float32)
+
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        # 一時ファイルに書いてから置き換え（読み込み中のmmapを壊さない）
+        temp_matrix = self._matrix_path.with_name(f"{self.name}.{os.getpid()}.tmp.npy")
+        np.save(temp_matrix, matrix)
+        os.replace(temp_matrix, self._matrix_path)
+        meta = {
+            "ids": data["ids"],
+            "documents": data["documents"],
+            "metadatas": [metadata or {} for metadata in data["metadatas"]],
+            "fingerprint": fingerprint,
+            "space": self._space(),
+        }
+        temp_meta = self._meta_path.with_name(f"{self.name}.{os.getpid()}.tmp.json")
+        temp_meta.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(temp_meta, self._meta_path)
+
+        self._install(np.load(self._matrix_path, mmap_mode="r"), meta)
+        self._checked_at = time.monotonic()
+        app_logger.info(f"ローカルベクトルインデックス構築: {self.name} ({len(self._ids)}件, {self.space})")
+
+    def invalidate(self):
+        """同一プロセスからの書き込み後に呼び出し、次回検索前に再構築させる"""
+        self._stale = True
+
+    def refresh_if_changed(self):
+        """フィンガープリントが変わっていれば再構築"""
+        try:
+            if self._stale or self._remote_fingerprint() != self.fingerprint:
+                self.rebuild()
+            self._checked_at = time.monotonic()
+        except Exception as e:
+            app_logger.warning(f"ローカルベクトルインデックス更新エラー ({self.name}): {e}")
+        finally:
+            self._refreshing = False
+
+    def _schedule_refresh(self):
+        """更新確認の間隔を過ぎていればバックグラウンドスレッドで確認（検索は現在のインデックスで継続）"""
+        if self._refreshing or time.monotonic() - self._checked_at < self.refresh_seconds:
+            return
+        self._refreshing = True
+        threading.Thread(target=self.refresh_if_changed, name=f"vector-index-{self.name}", daemon=True).start()
+
+    def ensure_ready(self):
+        """未構築・無効化済みの場合は同期的に構築し、それ以外は定期更新を予約"""
+        if self._oversized_at is not None and time.monotonic() - self._oversized_at < self.refresh_seconds:
+            # 上限超過が確認済みの間は件数を再確認しない
+            raise ValueError(f"{self.name}: ローカルインデックスの上限({self.max_documents}件)を超えています")
+        if not self.ready or self._stale:
+            self.rebuild()
+        else:
+            self._schedule_refresh()
+
+    def query(
+        self,
+        query_embedding: np.ndarray,
+        n_results: int = 5,
+        where: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, List[List[Any]]]:
+        """
+        類似ドキュメントを検索
+
+        Args:
+            query_embedding: クエリの埋め込みベクトル
+            n_results: 取得する結果数
+            where: メタデータフィルタ（ChromaDBと同じ形式）
+
+        Returns:
+            ChromaDBのquery()と同じ形式（ids/documents/metadatas/distancesの二重リスト）
+        """
+        with self._lock:
+            matrix, sq_norms, masks = self._matrix, self._sq_norms, self._masks
+            ids, documents, metadatas, space = self._ids, self._documents, self._metadatas, self.space
+
+        if matrix is None or not len(ids):
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        dots = matrix @ query
+        if space == "cosine":
+            norms = np.sqrt(sq_norms) * float(np.linalg.norm(query))
+            distances = 1.0 - dots / np.maximum(norms, 1e-12)
+        elif space == "ip":
+            distances = 1.0 - dots
+        else:
+            # ChromaDBのl2は二乗距離
+            distances = sq_norms + float(query @ query) - 2.0 * dots
+
+        if where:
+            # 同じフィルタは繰り返し使われるため、インデックス単位で候補をキャッシュ
+            key = json.dumps(where, sort_keys=True, default=str)
+            candidates = masks.get(key)
+            if candidates is None:
+                mask = np.fromiter((metadata_matches(metadata, where) for metadata in metadatas), dtype=bool, count=len(ids))
+                candidates = masks[key] = np.flatnonzero(mask)
+        else:
+            candidates = np.arange(len(ids))
+
+        k = min(n_results, len(candidates))
+        if k == 0:
+            return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+        candidate_distances = distances[candidates]
+        top = np.argpartition(candidate_distances, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+        top = top[np.argsort(candidate_distances[top], kind="stable")]
+        order = candidates[top]
+
+        return {
+            "ids": [[ids[i] for i in order]],
+            "documents": [[documents[i] for i in order]],
+            "metadatas": [[metadatas[i] for i in order]],
+            "distances": [[float(distances[i]) for i in order]],
+        }
+
+    def embeddings(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """指定IDの埋め込み（インデックスにないIDは含まない）"""
+        with self._lock:
+            matrix, positions = self._matrix, self._positions
+        if matrix is None:
+            return {}
+        return {chunk_id: matrix[positions[chunk_id]] for chunk_id in ids if chunk_id in positions}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "collection": self.name,
+            "documents": len(self._ids),
+            "space": self.space,
+            "fingerprint": self.fingerprint,
+            "stale": self._stale,
+            "seconds_since_check": round(time.monotonic() - self._checked_at, 1) if self._checked_at else None,
+        }
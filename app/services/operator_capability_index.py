@@ -0,0 +1,154 @@
+"""
+オペレータ能力インデックス
+業務・工程・拠点からオペレータをスキルレベル順に引くメモリ内インデックス
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.logging import app_logger
+
+
+# 有効オペレータの処理可能工程（idx_opc_business_process_operator / idx_operators_valid_location を使用）
+OPERATOR_CAPABILITY_INDEX_QUERY = text("""
+    SELECT
+        o.operator_id,
+        o.operator_name,
+        o.location_id,
+        l.location_name,
+        opc.business_id,
+        opc.process_id,
+        p.process_name,
+        opc.work_level
+    FROM operator_process_capabilities opc
+    JOIN operators o ON o.operator_id = opc.operator_id
+    LEFT JOIN locations l ON l.location_id = o.location_id
+    LEFT JOIN processes p ON p.business_id = opc.business_id AND p.process_id = opc.process_id
+    WHERE o.is_valid = 1
+""")
+
+CapabilityRow = Tuple[str, str, str, Optional[str], str, str, Optional[str], int]
+
+
+class OperatorCapabilityIndex:
+    """
+    (業務ID, 工程ID) → スキルレベル降順のオペレータ一覧
+
+    セマンティック検索は使わず、完全一致で引いてwork_level（同値はoperator_id）順に返すため
+    結果は決定的。1クエリで全件を読み込み、OPERATOR_INDEX_TTL_SECONDSごとに再読込する。
+    """
+
+    def __init__(self, ttl_seconds: Optional[int] = None):
+        """
+        Args:
+            ttl_seconds: 再読込までの秒数
+        """
+        self.ttl_seconds = settings.OPERATOR_INDEX_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._by_process: Dict[Tuple[str, str], List[CapabilityRow]] = {}
+        self._location_ids: Dict[str, str] = {}
+        self._max_level = 1
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded_at is not None
+
+    @property
+    def stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl_seconds
+
+    async def ensure_loaded(self, db: AsyncSession):
+        """未読込・期限切れの場合に読み込む（同時呼び出しでも読み込みは1回）"""
+        if not self.stale:
+            return
+        async with self._lock:
+            if self.stale:
+                await self.refresh(db)
+
+    async def refresh(self, db: AsyncSession):
+        """データベースから全件を読み込んで差し替え"""
+        started = time.perf_counter()
+        result = await db.execute(OPERATOR_CAPABILITY_INDEX_QUERY)
+
+        by_process: Dict[Tuple[str, str], List[CapabilityRow]] = {}
+        location_ids: Dict[str, str] = {}
+        max_level = 1
+        for row in result:
+            work_level = int(row.work_level or 0)
+            entry = (
+                row.operator_id, row.operator_name, row.location_id, row.location_name,
+                str(row.business_id), str(row.process_id), row.process_name, work_level
+            )
+            by_process.setdefault((entry[4], entry[5]), []).append(entry)
+            if row.location_name:
+                location_ids[row.location_name] = row.location_id
+            max_level = max(max_level, work_level)
+
+        for entries in by_process.values():
+            entries.sort(key=lambda entry: (-entry[7], entry[0]))
+
+        self._by_process, self._location_ids, self._max_level = by_process, location_ids, max_level
+        self._loaded_at = time.monotonic()
+        app_logger.info(
+            f"オペレータ能力インデックス読込: {sum(len(e) for e in by_process.values())}件, "
+            f"{len(by_process)}工程 ({(time.perf_counter() - started) * 1000:.0f}ms)"
+        )
+
+    def lookup(
+        self,
+        business_id: str,
+        process_id: str,
+        location: Optional[str] = None,
+        limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """
+        工程を処理できるオペレータをスキルレベル順に取得
+
+        Args:
+            business_id: 業務ID
+            process_id: 工程ID
+            location: 拠点IDまたは拠点名（オプション）
+            limit: 取得件数
+
+        Returns:
+            オペレータのリスト（relevance_scoreはスキルレベルを最大レベルで割った値）
+        """
+        entries = self._by_process.get((str(business_id), str(process_id)), [])
+        if location:
+            location_id = self._location_ids.get(location, location)
+            entries = [entry for entry in entries if entry[2] == location_id]
+
+        return [
+            {
+                "operator_id": operator_id,
+                "operator_name": operator_name,
+                "location_id": location_id,
+                "location_name": location_name,
+                "business_id": entry_business_id,
+                "process_id": entry_process_id,
+                "process_name": process_name,
+                "work_level": work_level,
+                "relevance_score": round(work_level / self._max_level, 4),
+            }
+            for (
+                operator_id, operator_name, location_id, location_name,
+                entry_business_id, entry_process_id, process_name, work_level
+            ) in entries[:limit]
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "loaded": self.loaded,
+            "processes": len(self._by_process),
+            "capabilities": sum(len(entries) for entries in self._by_process.values()),
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None,
+        }
+
+
+# アプリケーション全体で共有するインデックス
+operator_capability_index = OperatorCapabilityIndex()
@@ -0,0 +1,77 @@
+"""
+RAGキャッシュ
+クエリ埋め込みと検索結果をLRU・TTLで保持する
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(text: Optional[str]) -> str:
+    """キャッシュキー用にクエリを正規化（NFKC・前後空白除去・連続空白を1つに）"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+class TTLCache:
+    """
+    件数上限（LRU）と有効期限（TTL）付きのスレッドセーフなキャッシュ
+
+    投入パイプラインはupsertを別スレッドで実行するため、操作はロックで保護する
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        """
+        Args:
+            max_entries: 保持する最大件数（超えた場合は最も古く使われたものから削除）
+            ttl_seconds: 有効期限（秒）
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Any:
+        """値を取得（存在しない・期限切れの場合はNone）"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
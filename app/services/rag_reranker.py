@@ -0,0 +1,111 @@
+"""
+RAG再ランキング
+検索後の管理者ルールを類似度で並べ替え、閾値・重複・トークン予算で絞り込む
+"""
+import unicodedata
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    プロンプトのトークン数を概算
+
+    日本語（全角文字）は1文字≒1トークン、それ以外は4文字≒1トークンとして数える
+    """
+    wide = sum(1 for char in text or "" if unicodedata.east_asian_width(char) in ("W", "F"))
+    narrow = len(text or "") - wide
+    return wide + (narrow + 3) // 4
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class RuleReranker:
+    """
+    管理者ルールの後処理
+
+    1. クエリとのコサイン類似度で並べ替え
+    2. SIMILARITY_THRESHOLD未満を除外（字句検索で完全一致したルールは除外しない）
+    3. 採用済みルールとほぼ同じ内容（埋め込みの類似度がduplicate_similarity以上）を除外
+    4. ルール本文の合計がトークン予算を超えるものを除外し、top_k件まで採用
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: Optional[float] = None,
+        top_k: Optional[int] = None,
+        duplicate_similarity: Optional[float] = None,
+        token_budget: Optional[int] = None
+    ):
+        """
+        Args:
+            similarity_threshold: 採用する最小のコサイン類似度
+            top_k: 採用する最大件数
+            duplicate_similarity: 重複とみなすルール間のコサイン類似度
+            token_budget: 採用するルール本文の合計トークン数
+        """
+        self.similarity_threshold = settings.SIMILARITY_THRESHOLD if similarity_threshold is None else similarity_threshold
+        self.top_k = top_k or settings.TOP_K_RESULTS
+        self.duplicate_similarity = settings.RAG_DUPLICATE_SIMILARITY if duplicate_similarity is None else duplicate_similarity
+        self.token_budget = token_budget or settings.RAG_RULE_TOKEN_BUDGET
+
+    def rerank(
+        self,
+        query_embedding: Sequence[float],
+        rules: List[Dict[str, Any]],
+        rule_embeddings: Sequence[Sequence[float]],
+        lexical_matches: Optional[Sequence[bool]] = None
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        ルールを再ランキングして絞り込む
+
+        Args:
+            query_embedding: クエリの埋め込み
+            rules: 検索結果のルール（rule_textを含む辞書）
+            rule_embeddings: 各ルールの埋め込み（rulesと同じ順）
+            lexical_matches: 各ルールが字句検索で一致したか
+
+        Returns:
+            (採用したルール（similarityを付与）, 除外理由ごとの件数)
+        """
+        dropped = {"below_threshold": 0, "duplicate": 0, "over_budget": 0}
+        if not rules:
+            return [], dropped
+
+        vectors = _normalize_rows(np.asarray(rule_embeddings, dtype=np.float32))
+        query = _normalize_rows(np.asarray(query_embedding, dtype=np.float32))
+        similarities = vectors @ query
+        lexical_matches = lexical_matches or [False] * len(rules)
+
+        # 類似度の降順（同点は検索結果の順）
+        order = sorted(range(len(rules)), key=lambda i: -similarities[i])
+        selected: List[int] = []
+        used_tokens = 0
+        for i in order:
+            if len(selected) >= self.top_k:
+                break
+            if similarities[i] < self.similarity_threshold and not lexical_matches[i]:
+                dropped["below_threshold"] += 1
+                continue
+            if selected and float(np.max(vectors[selected] @ vectors[i])) >= self.duplicate_similarity:
+                dropped["duplicate"] += 1
+                continue
+            tokens = estimate_tokens(rules[i].get("rule_text"))
+            if used_tokens + tokens > self.token_budget:
+                dropped["over_budget"] += 1
+                continue
+            used_tokens += tokens
+            selected.append(i)
+
+        reranked = []
+        for i in selected:
+            rule = dict(rules[i])
+            rule["similarity"] = round(float(similarities[i]), 4)
+            reranked.append(rule)
+        return reranked, dropped
@@ -0,0 +1,234 @@
+"""
+セマンティックチャンキング
+管理者ルール文書を意味の切れ目で分割する（文埋め込みはバッチで計算し、隣接文の類似度のみを使う）
+"""
+import hashlib
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.logging import app_logger
+
+
+# 日本語の文末記号の後、英文のピリオド＋空白、改行で分割（「1.5」のような小数では分割しない）
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[。！？!?])|(?<=\.)\s+|\n+")
+
+EmbeddingFunction = Callable[[List[str]], Sequence[Sequence[float]]]
+
+
+def split_sentences(text: Optional[str]) -> List[str]:
+    """テキストを文に分割（文末記号は文に残す）"""
+    return [sentence.strip() for sentence in _SENTENCE_BOUNDARY.split(text or "") if sentence and sentence.strip()]
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class SemanticChunker:
+    """
+    文書を意味的にまとまったチャンクに分割
+
+    1. 全文書の文をまとめて（重複を除き）embed_batch_size件ずつ埋め込む
+    2. 各文と直前window文の平均埋め込みとのコサイン類似度を求め（文数に対して線形）、
+       threshold未満の位置を話題の切れ目とする
+    3. 切れ目またはmax_chars超過でチャンクを区切り、min_chars未満のチャンクは隣に結合する
+       （短いルールも検索対象に残すため、チャンクは捨てない）
+    """
+
+    def __init__(
+        self,
+        embedding_function: EmbeddingFunction,
+        threshold: Optional[float] = None,
+        window: Optional[int] = None,
+        max_chars: Optional[int] = None,
+        min_chars: Optional[int] = None,
+        embed_batch_size: Optional[int] = None
+    ):
+        """
+        Args:
+            embedding_function: 文のリストを受け取り埋め込みのリストを返す関数（コレクションの埋め込み関数）
+            threshold: これ未満の類似度で分割する
+            window: 比較する直前の文数
+            max_chars: チャンクの最大文字数（1文がこれを超える場合はその文だけのチャンクにする）
+            min_chars: これ未満のチャンクは隣のチャンクに結合する
+            embed_batch_size: 1回の埋め込み計算に渡す文数
+        """
+        self.embedding_function = embedding_function
+        self.threshold = settings.SEMANTIC_CHUNK_THRESHOLD if threshold is None else threshold
+        self.window = window or settings.SEMANTIC_CHUNK_WINDOW
+        self.max_chars = max_chars or settings.CHUNK_SIZE
+        self.min_chars = settings.SEMANTIC_CHUNK_MIN_CHARS if min_chars is None else min_chars
+        self.embed_batch_size = embed_batch_size or settings.SEMANTIC_CHUNK_EMBED_BATCH_SIZE
+
+    def chunk_documents(self, documents: List[str]) -> List[List[str]]:
+        """
+        複数の文書をチャンクに分割
+
+        Returns:
+            文書ごとのチャンクのリスト（documentsと同じ順）
+        """
+        sentences_per_document = [split_sentences(document) for document in documents]
+        unique_sentences = list(dict.fromkeys(
+            sentence for sentences in sentences_per_document for sentence in sentences
+        ))
+        embeddings = self._embed(unique_sentences)
+        rows = {sentence: i for i, sentence in enumerate(unique_sentences)}
+
+        return [
+            self._chunk_sentences(sentences, embeddings[[rows[sentence] for sentence in sentences]])
+            if sentences else []
+            for sentences in sentences_per_document
+        ]
+
+    def _embed(self, sentences: List[str]) -> np.ndarray:
+        """文をembed_batch_size件ずつ埋め込み、正規化した行列を返す"""
+        if not sentences:
+            return np.zeros((0, 0), dtype=np.float32)
+        batches = [
+            np.asarray(self.embedding_function(sentences[start:start + self.embed_batch_size]), dtype=np.float32)
+            for start in range(0, len(sentences), self.embed_batch_size)
+        ]
+        return _normalize_rows(np.vstack(batches))
+
+    def adjacent_similarities(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        各文と直前window文の平均埋め込みとのコサイン類似度（先頭の文は1.0）
+
+        累積和で直前window文の合計を求めるため、計算量は文数×次元数
+        """
+        count = len(embeddings)
+        similarities = np.ones(count, dtype=np.float32)
+        if count < 2:
+            return similarities
+        cumulative = np.vstack([np.zeros((1, embeddings.shape[1]), dtype=np.float32), np.cumsum(embeddings, axis=0)])
+        positions = np.arange(1, count)
+        starts = np.maximum(positions - self.window, 0)
+        context = _normalize_rows(cumulative[positions] - cumulative[starts])
+        similarities[1:] = np.einsum("ij,ij->i", context, embeddings[1:])
+        return similarities
+
+    def _chunk_sentences(self, sentences: List[str], embeddings: np.ndarray) -> List[str]:
+        """1文書の文をチャンクにまとめる"""
+        similarities = self.adjacent_similarities(embeddings)
+        chunks: List[List[str]] = []
+        size = 0
+        for sentence, similarity in zip(sentences, similarities):
+            if not chunks or similarity < self.threshold or size + len(sentence) > self.max_chars:
+                chunks.append([])
+                size = 0
+            chunks[-1].append(sentence)
+            size += len(sentence)
+
+        texts = ["".join(chunk) for chunk in chunks]
+        merged: List[str] = []
+        for text in texts:
+            if merged and (len(merged[-1]) < self.min_chars or len(text) < self.min_chars) \
+                    and len(merged[-1]) + len(text) <= self.max_chars:
+                merged[-1] += text
+            else:
+                merged.append(text)
+        return merged
+
+
+# ---- プロセスプール ----
+
+_worker_chunker: Optional[SemanticChunker] = None
+
+
+def _init_worker(embedding_class: type, embedding_config: Dict[str, Any], options: Dict[str, Any]):
+    """ワーカープロセス: 埋め込み関数を設定から作り直してチャンカーを用意（プロセスごとに1回）"""
+    global _worker_chunker
+    _worker_chunker = SemanticChunker(embedding_class.build_from_config(embedding_config), **options)
+
+
+def _chunk_documents_worker(documents: List[str]) -> List[List[str]]:
+    """ワーカープロセス: 文書群をチャンクに分割"""
+    return _worker_chunker.chunk_documents(documents)
+
+
+def chunk_documents_parallel(
+    chunker: SemanticChunker,
+    documents: List[str],
+    workers: Optional[int] = None,
+    documents_per_task: int = 200
+) -> List[List[str]]:
+    """
+    文書数が多い場合はプロセスプールで分割
+
+    ワーカーは埋め込み関数をget_config()/build_from_config()で作り直すため、
+    それに対応しない埋め込み関数や少数の文書（SEMANTIC_CHUNK_PARALLEL_MIN_DOCUMENTS未満）は
+    このプロセス内で分割する
+
+    Args:
+        chunker: 分割の設定と埋め込み関数
+        documents: 文書のリスト
+        workers: プロセス数（デフォルトはSEMANTIC_CHUNK_WORKERS、0の場合はこのプロセス内）
+        documents_per_task: ワーカー1タスクあたりの文書数
+
+    Returns:
+        文書ごとのチャンクのリスト（documentsと同じ順）
+    """
+    workers = settings.SEMANTIC_CHUNK_WORKERS if workers is None else workers
+    embedding_function = chunker.embedding_function
+    if workers <= 0 or len(documents) < settings.SEMANTIC_CHUNK_PARALLEL_MIN_DOCUMENTS:
+        return chunker.chunk_documents(documents)
+    try:
+        embedding_config = embedding_function.get_config()
+    except Exception as e:
+        embedding_config = None
+        app_logger.debug(f"埋め込み関数の設定を取得できません: {e}")
+    if embedding_config is None or not hasattr(embedding_function, "build_from_config"):
+        app_logger.warning("埋め込み関数を複製できないため単一プロセスで分割します")
+        return chunker.chunk_documents(documents)
+
+    options = {
+        "threshold": chunker.threshold,
+        "window": chunker.window,
+        "max_chars": chunker.max_chars,
+        "min_chars": chunker.min_chars,
+        "embed_batch_size": chunker.embed_batch_size,
+    }
+    tasks = [documents[start:start + documents_per_task] for start in range(0, len(documents), documents_per_task)]
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(type(embedding_function), embedding_config, options)
+    ) as executor:
+        return [chunks for task_chunks in executor.map(_chunk_documents_worker, tasks) for chunks in task_chunks]
+
+
+def build_manager_rule_chunks(rule: Dict[str, Any], texts: List[str]) -> List[Dict[str, Any]]:
+    """
+    管理者ルール1件のチャンク
+
+    Args:
+        rule: 管理者ルール（rule_id, category, title, content）
+        texts: contentを分割したチャンク本文
+
+    Returns:
+        チャンクのリスト（IDは manager_rule_{rule_id}_{番号}）
+    """
+    rule_id = str(rule.get("rule_id") or hashlib.sha1(str(rule.get("content", "")).encode("utf-8")).hexdigest()[:12])
+    title = rule.get("title") or ""
+    return [
+        {
+            "id": f"manager_rule_{rule_id}_{index}",
+            # タイトルを本文の先頭に付け、チャンク単体でも何のルールか分かるようにする
+            "document": f"{title}: {text}" if title else text,
+            "metadata": {
+                "type": "manager_rule",
+                "rule_id": rule_id,
+                "category": rule.get("category") or "general",
+                "title": title,
+                "chunk_index": index,
+                "total_chunks": len(texts),
+                "chunk_method": "semantic",
+            }
+        }
+        for index, text in enumerate(texts)
+    ]
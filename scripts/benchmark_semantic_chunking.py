@@ -0,0 +1,226 @@
+"""
+セマンティックチャンキングのベンチマークスクリプト
+
+experiments/llama_rag_test/semantic_chunking.py と同じ方式（文書ごとに埋め込み、
+全文間のコサイン類似度行列でグループ化）と、app.services.semantic_chunker
+（文埋め込みのバッチ計算、隣接window類似度、プロセスプール）のスループットを比較する。
+
+合成の管理者ルール文書を使用する。--embedding hash（既定）はオフラインで動く
+文字bigramのハッシュ埋め込み、default はChromaDBの既定埋め込み（all-MiniLM-L6-v2）。
+
+使い方:
+    python scripts/benchmark_semantic_chunking.py --documents 2000
+    python scripts/benchmark_semantic_chunking.py --documents 5000 --workers 4 --embedding default
+"""
+import sys
+import argparse
+import hashlib
+import random
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import numpy as np
+from dotenv import load_dotenv
+
+# 環境変数をロード
+load_dotenv()
+
+from app.services.semantic_chunker import SemanticChunker, chunk_documents_parallel, split_sentences
+
+
+LOCATIONS = ["札幌", "東京", "大阪", "沖縄", "佐世保"]
+PROCESSES = ["エントリ1", "エントリ2", "補正", "SV補正", "目検", "OCR確認", "仕分け", "検証"]
+TOPICS = {
+    "移動": [
+        "{location}の{process}が遅延している場合は、同じ業務の経験者を優先して移動させる。",
+        "移動元の拠点で処理待ちが増える場合は、移動人数を半分に抑える。",
+        "{process}への移動はスキルレベル3以上のオペレータに限る。",
+        "移動後30分は元の工程に戻さない。",
+    ],
+    "締め切り": [
+        "締め切りの2時間前に残件が多い場合は、{location}の応援を要請する。",
+        "当日締め切りの案件は{process}より優先して処理する。",
+        "締め切りに間に合わない見込みの場合は管理者に報告する。",
+    ],
+    "品質": [
+        "{process}の誤り率が上がった場合は、SV補正で全件を確認する。",
+        "新人オペレータの処理結果は目検で抜き取り確認する。",
+        "OCR確認で読み取り不能が続く場合は、原本を再スキャンする。",
+    ],
+    "勤務": [
+        "{location}の夜間帯は最低2名を配置する。",
+        "休憩は工程ごとに時間をずらして取得させる。",
+        "残業が続くオペレータは翌日の配置を減らす。",
+    ],
+}
+
+
+class HashEmbedding:
+    """
+    文字bigramを特徴ハッシングした埋め込み（モデル不要の計測用）
+
+    プロセスプールのワーカーで作り直せるよう、get_config()/build_from_config()を持つ
+    """
+
+    def __init__(self, dimensions: int = 256):
+        self.dimensions = dimensions
+
+    def __call__(self, input: List[str]) -> List[np.ndarray]:
+        vectors = np.zeros((len(input), self.dimensions), dtype=np.float32)
+        for row, sentence in enumerate(input):
+            for i in range(len(sentence) - 1):
+                digest = hashlib.blake2b(sentence[i:i + 2].encode("utf-8"), digest_size=4).digest()
+                vectors[row, int.from_bytes(digest, "little") % self.dimensions] += 1.0
+        return list(vectors)
+
+    @staticmethod
+    def name() -> str:
+        return "benchmark_hash"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {"dimensions": self.dimensions}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "HashEmbedding":
+        return HashEmbedding(**config)
+
+
+class CountingEmbedding:
+    """埋め込み関数の呼び出し回数と文数を数えるラッパー"""
+
+    def __init__(self, embedding_function):
+        self.embedding_function = embedding_function
+        self.calls = 0
+        self.sentences = 0
+
+    def __call__(self, input: List[str]):
+        self.calls += 1
+        self.sentences += len(input)
+        return self.embedding_function(input)
+
+
+def create_documents(count: int, seed: int = 42) -> List[str]:
+    """2〜4の話題を含む合成の管理者ルール文書"""
+    rng = random.Random(seed)
+    documents = []
+    for index in range(count):
+        sentences = []
+        for topic in rng.sample(list(TOPICS), rng.randint(2, 4)):
+            for _ in range(rng.randint(2, 8)):
+                sentence = rng.choice(TOPICS[topic]).format(
+                    location=rng.choice(LOCATIONS), process=rng.choice(PROCESSES)
+                )
+                # 文書間で同じ文ばかりにならないよう規定番号を付ける
+                sentences.append(f"{sentence[:-1]}（規定{index}-{len(sentences) + 1}）。")
+        documents.append("".join(sentences))
+    return documents
+
+
+def legacy_chunk(embedding_function, document: str, threshold: float, max_chars: int, min_chars: int) -> List[str]:
+    """実験実装と同じ方式（文書ごとに埋め込み、n×n類似度行列、最大10文先までのグループ化）"""
+    sentences = split_sentences(document)
+    if not sentences:
+        return []
+    embeddings = np.asarray(embedding_function(sentences), dtype=np.float32)
+    embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+    similarity_matrix = embeddings @ embeddings.T
+
+    groups, used = [], set()
+    for i in range(len(sentences)):
+        if i in used:
+            continue
+        group = [sentences[i]]
+        used.add(i)
+        for j in range(i + 1, min(i + 10, len(sentences))):
+            if j not in used and similarity_matrix[i][j] >= threshold:
+                group.append(sentences[j])
+                used.add(j)
+            elif similarity_matrix[i][j] < threshold * 0.7:
+                break
+        groups.append(group)
+
+    chunks, current, size = [], [], 0
+    for group in groups:
+        group_text = "".join(group)
+        if size + len(group_text) > max_chars and current:
+            if len("".join(current)) >= min_chars:
+                chunks.append("".join(current))
+            current, size = [group_text], len(group_text)
+        else:
+            current.append(group_text)
+            size += len(group_text)
+    if current and len("".join(current)) >= min_chars:
+        chunks.append("".join(current))
+    return chunks
+
+
+def report(label: str, seconds: float, documents: int, sentences: int, chunks: List[List[str]], calls: str):
+    print(
+        f"{label:<22} {seconds:8.2f}秒  {documents / seconds:9.1f}文書/秒  {sentences / seconds:10.1f}文/秒  "
+        f"チャンク {sum(len(c) for c in chunks):6d}件  埋め込み呼び出し {calls}"
+    )
+
+
+def main() -> int:
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="セマンティックチャンキングのベンチマーク")
+    parser.add_argument("--documents", type=int, default=2000, help="合成文書数")
+    parser.add_argument("--workers", type=int, default=2, help="プロセスプールのプロセス数")
+    parser.add_argument("--embedding", choices=["hash", "default"], default="hash", help="埋め込み関数")
+    parser.add_argument("--skip-legacy", action="store_true", help="実験実装方式の計測を省略")
+    args = parser.parse_args()
+
+    if args.embedding == "default":
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+        embedding_function = DefaultEmbeddingFunction()
+    else:
+        embedding_function = HashEmbedding()
+
+    documents = create_documents(args.documents)
+    sentences = sum(len(split_sentences(document)) for document in documents)
+    print(f"文書 {len(documents)}件 / 文 {sentences}件 / 埋め込み {args.embedding}")
+
+    chunker = SemanticChunker(embedding_function)
+    results = {}
+
+    if not args.skip_legacy:
+        counting = CountingEmbedding(embedding_function)
+        started = time.perf_counter()
+        chunks = [
+            legacy_chunk(counting, document, chunker.threshold, chunker.max_chars, chunker.min_chars)
+            for document in documents
+        ]
+        results["実験実装方式"] = time.perf_counter() - started
+        report("実験実装方式", results["実験実装方式"], len(documents), sentences, chunks, f"{counting.calls}回")
+
+    counting = CountingEmbedding(embedding_function)
+    started = time.perf_counter()
+    chunks = SemanticChunker(counting).chunk_documents(documents)
+    results["バッチ（単一プロセス）"] = time.perf_counter() - started
+    report(
+        "バッチ（単一プロセス）", results["バッチ（単一プロセス）"], len(documents), sentences, chunks,
+        f"{counting.calls}回（重複除去後 {counting.sentences}文）"
+    )
+
+    if args.workers > 0:
+        started = time.perf_counter()
+        parallel_chunks = chunk_documents_parallel(chunker, documents, workers=args.workers)
+        results["プロセスプール"] = time.perf_counter() - started
+        report(f"プロセスプール（{args.workers}）", results["プロセスプール"], len(documents), sentences, parallel_chunks, "-")
+        if parallel_chunks != chunks:
+            print("❌ プロセスプールと単一プロセスの結果が一致しません")
+            return 1
+
+    if "実験実装方式" in results:
+        fastest = min(seconds for label, seconds in results.items() if label != "実験実装方式")
+        print(f"速度比（実験実装方式 / 最速）: {results['実験実装方式'] / fastest:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""
+ChromaDBナレッジベースを種別ごとのコレクションに分割する移行スクリプト
+
+既存の単一コレクション（CHROMADB_COLLECTION）のドキュメントを metadata.type に応じて
+オペレータ・工程・管理者ルールの各パーティションへコピーする。
+埋め込みベクトルもそのままコピーするため、再計算は発生しない。
+
+移行後に件数を検証し、問題なければ .env で CHROMADB_PARTITIONED=true を設定する。
+
+使い方:
+    python scripts/migrate_chroma_partitions.py --dry-run
+    python scripts/migrate_chroma_partitions.py
+    python scripts/migrate_chroma_partitions.py --delete-source
+"""
+import sys
+import argparse
+from collections import Counter
+from pathlib import Path
+
+# プロジェクトルートをパスに追加
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from dotenv import load_dotenv
+
+# 環境変数をロード
+load_dotenv()
+
+from app.services.chroma_service import (
+    ChromaService,
+    COLLECTION_PARTITIONS,
+    partition_collection_name,
+    partition_for_type,
+)
+
+
+def migrate(chroma_service: ChromaService, page_size: int, dry_run: bool) -> Counter:
+    """
+    元コレクションをページ単位で読み、パーティションへupsert
+
+    Returns:
+        パーティションごとの移行件数
+    """
+    source = chroma_service.collection
+    migrated = Counter()
+    offset = 0
+
+    while True:
+        page = source.get(
+            include=["documents", "metadatas", "embeddings"],
+            limit=page_size,
+            offset=offset
+        )
+        ids = page["ids"]
+        if not ids:
+            break
+
+        groups = {}
+        for i, chunk_id in enumerate(ids):
+            metadata = page["metadatas"][i] or {}
+            partition = partition_for_type(metadata.get("type"))
+            group = groups.setdefault(partition, {"ids": [], "documents": [], "metadatas": [], "embeddings": []})
+            group["ids"].append(chunk_id)
+            group["documents"].append(page["documents"][i])
+            group["metadatas"].append(page["metadatas"][i])
+            group["embeddings"].append(page["embeddings"][i])
+
+        for partition, group in groups.items():
+            if not dry_run:
+                chroma_service.partition_collection(partition).upsert(**group)
+            migrated[partition] += len(group["ids"])
+
+        offset += len(ids)
+        print(f"  {offset}件処理 ({', '.join(f'{p}: {n}' for p, n in sorted(migrated.items()))})")
+        if len(ids) < page_size:
+            break
+
+    return migrated
+
+
+def main() -> int:
+    """メイン処理"""
+    parser = argparse.ArgumentParser(description="ChromaDBナレッジベースのパーティション分割")
+    parser.add_argument("--page-size", type=int, default=1000, help="1回に読み込む件数")
+    parser.add_argument("--dry-run", action="store_true", help="振り分け件数のみ表示して書き込まない")
+    parser.add_argument("--delete-source", action="store_true", help="件数検証後に元コレクションを削除")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("ChromaDBパーティション分割")
+    print("=" * 60)
+
+    try:
+        chroma_service = ChromaService()
+    except Exception as e:
+        print(f"❌ ChromaDB接続失敗: {e}")
+        return 1
+
+    source_name = chroma_service.collection_name
+    source_count = chroma_service.collection.count()
+    print(f"\n移行元: {source_name} ({source_count}件)")
+    for partition in COLLECTION_PARTITIONS:
+        print(f"  → {partition_collection_name(source_name, partition)}")
+
+    migrated = migrate(chroma_service, args.page_size, args.dry_run)
+    total = sum(migrated.values())
+
+    print("\n振り分け結果:")
+    for partition in COLLECTION_PARTITIONS:
+        print(f"  {partition:<14} {migrated.get(partition, 0)}件")
+    print(f"  {'合計':<14} {total}件")
+
+    if args.dry_run:
+        print("\n(dry-run: 書き込みは行っていません)")
+        return 0
+
+    # 件数検証（パーティションに移行前から別のドキュメントがある場合は移行件数以上になる）
+    mismatched = [
+        partition for partition in COLLECTION_PARTITIONS
+        if chroma_service.partition_collection(partition).count() < migrated.get(partition, 0)
+    ]
+    if total != source_count or mismatched:
+        print(f"\n❌ 件数が一致しません (移行元 {source_count}件, 移行 {total}件, 不一致: {mismatched})")
+        return 1
+    print("\n✅ 件数を検証しました")
+
+    if args.delete_source:
+        chroma_service.client.delete_collection(source_name)
+        print(f"元コレクション {source_name} を削除しました")
+
+    print("\n.env に CHROMADB_PARTITIONED=true を設定してAPIを再起動してください")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,27 @@
 """
 ChromaDBにMySQLデータを投入するスクリプト
+
+オペレータと処理可能工程を1クエリでストリーミング取得し、
+チャンク作成（プロセスプール）とupsert（並行バッチ）をパイプライン実行する。
+--delta では内容ハッシュが変わったチャンクのみupsertし、無効になったオペレータの
+チャンクを削除する。中断された場合は次回実行時にチェックポイントから再開する。
+字句インデックス（ハイブリッド検索用）も同時に更新される。--rebuild-lexical-index では
+ChromaDBの全チャンクから字句インデックスのみを作り直す。
+--manager-rules では管理者ルール文書（JSON配列またはJSON Lines、各行に
+rule_id, category, title, content）をセマンティックチャンキングで分割して投入する。
+
+使い方:
+    python scripts/populate_chromadb.py
+    python scripts/populate_chromadb.py --batch-size 2000 --max-in-flight 8 --workers 4
+    python scripts/populate_chromadb.py --delta
+    python scripts/populate_chromadb.py --delta --restart
+    python scripts/populate_chromadb.py --rebuild-lexical-index
+    python scripts/populate_chromadb.py --manager-rules data/manager_rules.jsonl --delta
 """
 import sys
 import os
+import argparse
+import json
 from pathlib import Path
 
 # プロジェクトルートをパスに追加
@@ -12,51 +31,38 @@ sys.path.insert(0, str(project_root))
 import asyncio
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
 from dotenv import load_dotenv
 
 from app.services.chroma_service import ChromaService
+from app.services.chroma_ingestion import ChromaIngestionPipeline
 from app.core.logging import app_logger
 
 # 環境変数をロード
 load_dotenv()
 
 
-async def fetch_operators(session: AsyncSession):
-    """オペレータ情報を取得"""
-    query = text("""
-        SELECT operator_id, operator_name, location_id, is_valid, belong_code
-        FROM operators
-        WHERE is_valid = 1
-    """)
-    result = await session.execute(query)
-    return [dict(row._mapping) for row in result]
-
-
-async def fetch_operator_capabilities(session: AsyncSession, operator_id: str):
-    """特定オペレータの処理可能工程を取得"""
-    query = text("""
-        SELECT business_id, process_id, work_level, location_id
-        FROM operator_process_capabilities
-        WHERE operator_id = :operator_id
-    """)
-    result = await session.execute(query, {"operator_id": operator_id})
-    return [dict(row._mapping) for row in result]
-
-
-async def fetch_processes(session: AsyncSession):
-    """工程情報を取得"""
-    query = text("""
-        SELECT business_id, process_id, level_id, process_name,
-               process_name_detail, process_category
-        FROM processes
-    """)
-    result = await session.execute(query)
-    return [dict(row._mapping) for row in result]
+def load_manager_rules(path: str) -> list:
+    """管理者ルール文書を読み込み（JSON配列またはJSON Lines）"""
+    content = Path(path).read_text(encoding="utf-8").strip()
+    if content.startswith("["):
+        return json.loads(content)
+    return [json.loads(line) for line in content.splitlines() if line.strip()]
 
 
 async def main():
     """メイン処理"""
+    parser = argparse.ArgumentParser(description="ChromaDBデータ投入")
+    parser.add_argument("--batch-size", type=int, help="1回のupsert件数")
+    parser.add_argument("--max-in-flight", type=int, help="同時実行するupsert数")
+    parser.add_argument("--workers", type=int, help="チャンク作成のプロセス数（0: 単一プロセス）")
+    parser.add_argument("--operators-per-task", type=int, help="ワーカー1タスクあたりのオペレータ数")
+    parser.add_argument("--delta", action="store_true", help="変更分のみupsertし、不要なチャンクを削除")
+    parser.add_argument("--restart", action="store_true", help="チェックポイントを無視して最初から実行")
+    parser.add_argument("--rebuild-lexical-index", action="store_true", help="ChromaDBから字句インデックスのみ作り直す")
+    parser.add_argument("--manager-rules", help="管理者ルール文書（JSON/JSON Lines）をセマンティックチャンキングで投入")
+    parser.add_argument("--progress-interval", type=float, default=5.0, help="進捗ログの出力間隔（秒）")
+    args = parser.parse_args()
+
     app_logger.info("=" * 60)
     app_logger.info("ChromaDBデータ投入スクリプト開始")
     app_logger.info("=" * 60)
@@ -73,49 +79,55 @@ async def main():
         app_logger.info("ChromaDBサービスを初期化しました")
     except Exception as e:
         app_logger.error(f"ChromaDB初期化失敗: {e}")
+        await engine.dispose()
+        return
+
+    if args.rebuild_lexical_index:
+        index = chroma_service.rebuild_lexical_index()
+        app_logger.info(f"字句インデックスを作り直しました: {len(index)}件")
+        await engine.dispose()
+        return
+
+    pipeline = ChromaIngestionPipeline(
+        chroma_service,
+        batch_size=args.batch_size,
+        max_in_flight=args.max_in_flight,
+        workers=args.workers,
+        operators_per_task=args.operators_per_task,
+        progress_interval=args.progress_interval
+    )
+
+    if args.manager_rules:
+        rules = load_manager_rules(args.manager_rules)
+        stats = await pipeline.ingest_manager_rules(rules, delta=args.delta)
+        app_logger.info(
+            f"管理者ルール: {stats['manager_rules']}件 → {stats['manager_rule_chunks']}チャンク "
+            f"(分割 {stats['chunking_seconds']}秒, {stats['rules_per_second']}件/秒)"
+        )
+        app_logger.info(
+            f"  upsert: {stats['chunks_upserted']}件, 削除: {stats['chunks_deleted']}件, "
+            f"変更なし: {stats['chunks_unchanged']}件"
+        )
+        await engine.dispose()
         return
 
     async with async_session() as session:
         try:
-            # オペレータデータを取得してチャンク化
-            app_logger.info("\n[1/3] オペレータデータを取得中...")
-            operators = await fetch_operators(session)
-            app_logger.info(f"  → {len(operators)}名のオペレータを取得")
-
-            all_operator_chunks = []
-            for operator in operators:
-                operator_id = operator["operator_id"]
-                capabilities = await fetch_operator_capabilities(session, operator_id)
-
-                chunks = chroma_service.create_operator_chunks(operator, capabilities)
-                all_operator_chunks.extend(chunks)
-                app_logger.info(f"  オペレータ {operator_id}: {len(chunks)}チャンク作成")
-
-            # オペレータチャンクをChromaDBに追加
-            if all_operator_chunks:
-                app_logger.info(f"\n  {len(all_operator_chunks)}個のオペレータチャンクをChromaDBに投入中...")
-                chroma_service.add_documents(all_operator_chunks)
-                app_logger.info("  ✓ オペレータチャンク投入完了")
-
-            # 工程データを取得してチャンク化
-            app_logger.info("\n[2/3] 工程データを取得中...")
-            processes = await fetch_processes(session)
-            app_logger.info(f"  → {len(processes)}件の工程を取得")
-
-            process_chunks = chroma_service.create_process_chunks(processes)
-            app_logger.info(f"  {len(process_chunks)}個の工程チャンクを作成")
-
-            # 工程チャンクをChromaDBに追加
-            if process_chunks:
-                app_logger.info(f"\n  {len(process_chunks)}個の工程チャンクをChromaDBに投入中...")
-                chroma_service.add_documents(process_chunks)
-                app_logger.info("  ✓ 工程チャンク投入完了")
+            app_logger.info("\n[1/2] オペレータ・工程データを投入中...")
+            stats = await pipeline.run(session, delta=args.delta, restart=args.restart)
+            app_logger.info(f"  オペレータ: {stats['operators']}名 → {stats['operator_chunks']}チャンク")
+            app_logger.info(f"  工程: {stats['process_chunks']}チャンク")
+            app_logger.info(
+                f"  upsert: {stats['chunks_upserted']}件, 削除: {stats['chunks_deleted']}件, "
+                f"変更なし: {stats['chunks_unchanged']}件"
+            )
+            app_logger.info(f"  スループット: {stats['chunks_per_second']}件/秒 ({stats['elapsed_seconds']}秒)")
 
             # 統計情報を表示
-            app_logger.info("\n[3/3] ChromaDB統計情報:")
-            stats = chroma_service.get_collection_stats()
-            app_logger.info(f"  コレクション名: {stats.get('collection_name')}")
-            app_logger.info(f"  総ドキュメント数: {stats.get('total_documents')}")
+            app_logger.info("\n[2/2] ChromaDB統計情報:")
+            collection_stats = chroma_service.get_collection_stats()
+            app_logger.info(f"  コレクション名: {collection_stats.get('collection_name')}")
+            app_logger.info(f"  総ドキュメント数: {collection_stats.get('total_documents')}")
 
         except Exception as e:
             app_logger.error(f"データ投入エラー: {e}", exc_info=True)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+アラート重複排除のテスト（解消 → 抑制期間内の再発）
+DBに接続せず、固定のアラートを返す評価エンジンで配信イベントを確認する
+"""
+import asyncio
+import sys
+import os
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.alert_dedup import AlertDeduplicator
+from app.services.alert_scheduler import AlertScheduler
+
+
+ALERT = {
+    "id": 1,
+    "alert_key": "correction_threshold:全拠点",
+    "type": "correction_threshold",
+    "priority": "high",
+    "location_name": None,
+    "process_name": "補正",
+    "threshold": 100,
+    "current_value": 120,
+}
+
+
+class FixedEngine:
+    """evaluate()で設定済みのアラートを返す評価エンジン"""
+
+    def __init__(self):
+        self.alerts = []
+
+    async def evaluate(self, db):
+        return {"alerts": [dict(alert) for alert in self.alerts]}
+
+    def bind_ids(self, ids):
+        pass
+
+
+def test_deduplicator(state_path: str):
+    """解消から抑制期間内に再発したフィンガープリントはreopenedとして返る"""
+    print("[1/2] AlertDeduplicator: 発生 → 解消 → 抑制期間内の再発")
+    print("-" * 80)
+    dedup = AlertDeduplicator(suppression_seconds=900, path=state_path)
+
+    result = dedup.apply([dict(ALERT)], now=0)
+    assert len(result["new"]) == 1, result
+    result = dedup.apply([], now=10)
+    assert len(result["cleared"]) == 1, result
+    result = dedup.apply([dict(ALERT)], now=20)
+    print(
+        f"  new={len(result['new'])} escalated={len(result['escalated'])} "
+        f"reopened={len(result['reopened'])} suppressed={result['suppressed']}"
+    )
+    assert not result["new"] and not result["escalated"], result
+    assert len(result["reopened"]) == 1 and result["suppressed"] == 1, result
+
+    # 発生が続くだけなら再び返さない
+    result = dedup.apply([dict(ALERT)], now=30)
+    assert not result["reopened"], result
+    print("  OK")
+    print()
+
+
+async def test_scheduler(state_path: str):
+    """解消を配信した後の再発で、versionが上がりreopenedが配信される"""
+    print("[2/2] AlertScheduler: 解消の配信後に再発を配信")
+    print("-" * 80)
+    engine = FixedEngine()
+    scheduler = AlertScheduler(
+        engine=engine,
+        deduplicator=AlertDeduplicator(suppression_seconds=900, path=state_path)
+    )
+    scheduler.store = None
+    queue = scheduler.subscribe()
+
+    engine.alerts = [ALERT]
+    await scheduler.run_once(None)
+    assert queue.get_nowait()["event"] == "snapshot"
+
+    engine.alerts = []
+    await scheduler.run_once(None)
+    event = queue.get_nowait()
+    assert event["event"] == "changed" and len(event["cleared"]) == 1, event
+
+    engine.alerts = [ALERT]
+    current = await scheduler.run_once(None)
+    event = queue.get_nowait()
+    print(f"  version={event['version']} reopened={len(event['reopened'])} alert_count={event['alert_count']}")
+    assert event["event"] == "changed" and len(event["reopened"]) == 1, event
+    assert event["version"] == current["version"] == 3, event
+
+    # 値だけの変化は配信しない
+    engine.alerts = [{**ALERT, "current_value": 125}]
+    await scheduler.run_once(None)
+    assert queue.empty()
+    print("  OK")
+    print()
+
+
+async def main():
+    print("=" * 80)
+    print("アラート重複排除テスト")
+    print("=" * 80)
+    print()
+    with tempfile.TemporaryDirectory() as directory:
+        test_deduplicator(os.path.join(directory, "dedup_state.json"))
+        await test_scheduler(os.path.join(directory, "scheduler_state.json"))
+    print("全テスト成功")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
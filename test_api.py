@@ -32,7 +32,7 @@ def test_alerts_list():
         response = requests.get("http://localhost:8000/api/v1/alerts")
         if response.status_code == 200:
             data = response.json()
-            print(f"✅ {data['total']}件のアラートを取得しました")
+            print(f"✅ {len(data['alerts'])}件のアラートを取得しました")
             print(f"   最初のアラート: {data['alerts'][0]['title'] if data['alerts'] else 'なし'}")
         else:
             print(f"❌ エラー: {response.status_code}")